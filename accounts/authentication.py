@@ -0,0 +1,73 @@
+"""
+JWT authentication without the per-request user lookup
+
+ClaimsJWTAuthentication builds request.user from the token claims (see
+accounts.claims): a User instance with the id, email, name and flags
+loaded and every other field deferred. It works as a foreign key value
+and in permission checks without a query; reading a deferred field loads
+it from the database. Claims are only used at the user's current
+generation, read from the cached copy of the user; tokens at an older
+generation get the fields of that copy instead.
+
+Needs a cache shared by every process (checked by accounts.checks);
+disabled with JWT_CLAIMS_AUTH = False (plain simplejwt behaviour).
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .claims import GENERATION_FIELD, USER_FIELDS, claims_current, user_claims
+from .models import User
+
+
+def claims_user(user_id, data):
+    """User instance with only `data` (USER_FIELDS, claims generation) loaded, no query"""
+    values = {'id': user_id, **data}
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, fields, [values[field] for field in fields])
+
+
+def full_user(user):
+    """The complete row of a user built from claims (for serializing it, or saving it)"""
+    if user.get_deferred_fields():
+        return User.objects.get(pk=user.pk)
+    return user
+
+
+def user_from_token(validated_token):
+    """
+    User of a validated access token, from its claims when they are current
+    Raises AuthenticationFailed for unknown or inactive users.
+    """
+    try:
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError as e:
+        raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+    current = user_claims(user_id)
+    if current is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    if claims_current(validated_token, current[GENERATION_FIELD]):
+        data = {field: validated_token[field] for field in USER_FIELDS}
+        data[GENERATION_FIELD] = current[GENERATION_FIELD]
+    else:
+        data = current
+
+    if not data['is_active']:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    return claims_user(user_id, data)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    simplejwt authentication that takes the user from the token claims
+    """
+
+    def get_user(self, validated_token):
+        if not getattr(settings, 'JWT_CLAIMS_AUTH', True):
+            return super().get_user(validated_token)
+        return user_from_token(validated_token)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+@register()
+def check_claims_auth_cache(app_configs, **kwargs):
+    """
+    Claims authentication trusts the cached copy of each user; a per-process
+    cache would keep accepting revoked tokens in the other processes
+    """
+    if getattr(settings, 'JWT_CLAIMS_AUTH', True) and isinstance(caches['default'], LocMemCache):
+        return [Error(
+            'JWT_CLAIMS_AUTH requires a cache shared by every process, the default cache is LocMemCache',
+            hint='Set CACHE_URL (or REDIS_URL), or JWT_CLAIMS_AUTH=False',
+            id='accounts.E001',
+        )]
+    return []
@@ -0,0 +1,96 @@
+"""
+User claims carried by the access tokens
+
+Tokens issued by accounts.tokens carry the user's identity (USER_FIELDS),
+role names (ROLES_CLAIM) and the claims generation of the user at the time
+they were read (GENERATION_CLAIM), so permission checks (accounts.roles)
+need no query.
+
+User.claims_generation is incremented in the same transaction as every
+change of the user or its UserRole rows. Each request compares the token's
+generation with the user's row, read from a copy in the shared cache
+(USER_CACHE_TTL seconds) that the change drops on commit and that is
+reloaded from the database when missing. An evicted or flushed cache entry
+therefore costs a query, never accepts a revoked token; the steady state
+costs one cache read and no query.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+
+ROLES_CLAIM = 'roles'
+GENERATION_CLAIM = 'claims_gen'
+GENERATION_FIELD = 'claims_generation'
+USER_FIELDS = ('email', 'full_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _user_key(user_id):
+    return f'accounts:user:{user_id}'
+
+
+def claims_current(token, generation):
+    """Whether the token claims were read at the user's current generation"""
+    return token.get(GENERATION_CLAIM) == generation
+
+
+def load_roles(user_id):
+    """Role names of the user, from the database"""
+    from .models import UserRole
+
+    return list(UserRole.objects.filter(user_id=user_id).values_list('role__name', flat=True))
+
+
+def set_user_claims(token, user):
+    """Store the current identity, roles and claims generation of the user in the token"""
+    from .models import User
+
+    # The generation is read before the roles: a change committed in between
+    # leaves the token with an older generation, never with older roles
+    data = User.objects.filter(pk=user.pk).values(*USER_FIELDS, GENERATION_FIELD).get()
+    token[GENERATION_CLAIM] = data.pop(GENERATION_FIELD)
+    for field in USER_FIELDS:
+        token[field] = data[field]
+    token[ROLES_CLAIM] = load_roles(user.pk)
+
+
+def user_claims(user_id):
+    """
+    USER_FIELDS and claims generation of a user, cached for USER_CACHE_TTL
+    seconds; None if it does not exist
+    """
+    from .models import User
+
+    data = cache.get(_user_key(user_id))
+    if data is None:
+        data = User.objects.filter(pk=user_id).values(*USER_FIELDS, GENERATION_FIELD).first()
+        if data is None:
+            return None
+        cache.set(_user_key(user_id), data, settings.USER_CACHE_TTL)
+    return data
+
+
+def claims_generation(user_id):
+    """Current claims generation of the user, None if it does not exist"""
+    data = user_claims(user_id)
+    return None if data is None else data[GENERATION_FIELD]
+
+
+def forget_user(user_id):
+    """Drop the cached copies of the user (shared cache and this process' roles)"""
+    from .roles import role_cache
+
+    cache.delete(_user_key(user_id))
+    role_cache.invalidate(user_id)
+
+
+def claims_changed(user_id):
+    """
+    Revoke the claims of the user: the new generation commits with the
+    current transaction, the cached copies are dropped once it does
+    """
+    from .models import User
+
+    User.objects.filter(pk=user_id).update(**{GENERATION_FIELD: F(GENERATION_FIELD) + 1})
+    transaction.on_commit(lambda: forget_user(user_id))
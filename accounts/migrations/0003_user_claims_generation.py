@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_role_userrole'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='claims_generation',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Incremented on every change of the user or its roles, older token claims are ignored', verbose_name='claims generation'),
+        ),
+    ]
@@ -62,6 +62,12 @@ class User(AbstractUser):
         blank=True,
         help_text=_('Optional full name of the user.')
     )
+    claims_generation = models.PositiveIntegerField(
+        _('claims generation'),
+        default=0,
+        editable=False,
+        help_text=_('Incremented on every change of the user or its roles, older token claims are ignored')
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []  # Email is already required by USERNAME_FIELD
@@ -76,6 +82,18 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        """
+        claims_generation only moves through accounts.claims.claims_changed();
+        saving a stale instance must not write an older generation back
+        """
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [field for field in update_fields if field != 'claims_generation']
+        super().save(*args, **kwargs)
+
     def get_full_name(self):
         """
         Return the full_name if set, otherwise return email.
@@ -98,6 +116,9 @@ class User(AbstractUser):
         """
         Get list of role names for this user
         """
+        if 'user_roles' in getattr(self, '_prefetched_objects_cache', {}):
+            # Loaded with prefetch_related('user_roles__role') (see UserManagementViewSet)
+            return [user_role.role.name for user_role in self.user_roles.all()]
         return list(self.user_roles.values_list('role__name', flat=True))
 
 
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .roles import get_user_roles
+
 
 class IsStaffOrAdmin(permissions.BasePermission):
     """
@@ -16,7 +18,7 @@ class IsStaffOrAdmin(permissions.BasePermission):
             return True
 
         # Check if user has STAFF or ADMIN role
-        user_roles = request.user.get_roles()
+        user_roles = get_user_roles(request.user, request.auth)
 
         return 'ADMIN' in user_roles or 'STAFF' in user_roles
 
@@ -36,7 +38,7 @@ class IsAdmin(permissions.BasePermission):
             return True
 
         # Check if user has ADMIN role
-        user_roles = request.user.get_roles()
+        user_roles = get_user_roles(request.user, request.auth)
 
         return 'ADMIN' in user_roles
 
@@ -52,7 +54,7 @@ class IsStaff(permissions.BasePermission):
             return False
 
         # Check if user has STAFF role
-        user_roles = request.user.get_roles()
+        user_roles = get_user_roles(request.user, request.auth)
 
         return 'STAFF' in user_roles or 'ADMIN' in user_roles
 
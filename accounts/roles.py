@@ -0,0 +1,66 @@
+"""
+Role lookups for permission checks without database queries
+
+Roles come from the access token claims while they are current (see
+accounts.claims). Requests without them (older tokens, force-authenticated
+tests, WebSocket group computation) use a per-process LRU cache of
+ROLE_CACHE_SIZE users, whose entries are only used at the generation they
+were loaded at.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .claims import ROLES_CLAIM, claims_current, claims_generation, load_roles
+
+
+class RoleCache:
+    """
+    Least recently used role names per user id, in this process
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # user_id -> (roles, generation)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, generation):
+        """Role names of the user, reloaded when cached at another generation"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] == generation:
+                self._entries.move_to_end(user_id)
+                return list(entry[0])
+
+        roles = load_roles(user_id)
+        with self._lock:
+            self._entries[user_id] = (roles, generation)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return list(roles)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+role_cache = RoleCache(getattr(settings, 'ROLE_CACHE_SIZE', 1024))
+
+
+def get_user_roles(user, token=None):
+    """
+    Role names of a user: from the access token claims when they are still
+    current, otherwise from the per-process cache
+    """
+    generation = claims_generation(user.pk)
+    if generation is None:
+        return []
+    if token is not None and ROLES_CLAIM in token and claims_current(token, generation):
+        return list(token[ROLES_CLAIM])
+    return role_cache.get(user.pk, generation)
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .claims import claims_changed, forget_user
+from .models import User, UserRole
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def user_role_changed(sender, instance, **kwargs):
+    """Role claims and cached roles of the user are stale"""
+    claims_changed(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    """Identity claims and the cached copy of the user are stale"""
+    if created:
+        # Nothing can be cached for a new row yet, except leftovers of a
+        # deleted user with the same id
+        forget_user(instance.pk)
+    elif not (update_fields and set(update_fields) <= {'last_login', 'password'}):
+        claims_changed(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """The row is gone, and with it every token of the user; drop the cached copies"""
+    transaction.on_commit(lambda: forget_user(instance.pk))
@@ -1,3 +1,133 @@
-from django.test import TestCase
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import user_from_token
+from .checks import check_claims_auth_cache
+from .claims import ROLES_CLAIM
+from .models import User, Role, UserRole
+from .permissions import IsStaffOrAdmin
+from .roles import role_cache
+
+
+class RoleClaimsTests(TestCase):
+    """
+    Permission checks read the roles from the token or the role cache, and
+    stop trusting them as soon as the roles change
+    """
+
+    def setUp(self):
+        cache.clear()
+        role_cache.clear()
+        self.addCleanup(role_cache.clear)
+        self.client = APIClient()
+        self.nurse = User.objects.create_user(email='nurse@example.com', password='staff123', full_name='Nurse')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_role = UserRole.objects.create(user=self.nurse, role=Role.objects.get_or_create(name=Role.STAFF)[0])
+
+        response = self.client.post(reverse('accounts:login'), {'email': 'nurse@example.com', 'password': 'staff123'})
+        self.refresh = response.data['refresh']
+        self.access = AccessToken(response.data['access'])
+
+    def has_permission(self, token=None):
+        request = SimpleNamespace(user=self.nurse, auth=token)
+        return IsStaffOrAdmin().has_permission(request, None)
+
+    def test_claims_and_cache_need_no_query(self):
+        self.assertEqual(self.access[ROLES_CLAIM], ['STAFF'])
+        with self.assertNumQueries(0):
+            self.assertTrue(self.has_permission(self.access))
+
+        # Without claims: one query, then served by the role cache
+        with self.assertNumQueries(1):
+            self.assertTrue(self.has_permission())
+        with self.assertNumQueries(0):
+            self.assertTrue(self.has_permission())
+
+    def test_role_removal_revokes_claims_and_cache(self):
+        self.assertTrue(self.has_permission())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_role.delete()
+
+        self.assertFalse(self.has_permission(self.access))
+        self.assertFalse(self.has_permission())
+
+        # Refreshed access tokens carry the current roles
+        response = self.client.post(reverse('accounts:token_refresh'), {'refresh': self.refresh})
+        access = AccessToken(response.data['access'])
+        self.assertEqual(access[ROLES_CLAIM], [])
+        with self.assertNumQueries(0):
+            self.assertFalse(self.has_permission(access))
+
+    def test_revocation_survives_cache_eviction(self):
+        self.assertTrue(self.has_permission(self.access))
+        # The role is removed while the cached copies are lost (eviction, flush, another process)
+        self.user_role.delete()
+        cache.clear()
+        role_cache.clear()
+        self.assertFalse(self.has_permission(self.access))
+
+
+@override_settings(JWT_CLAIMS_AUTH=True)
+class ClaimsAuthenticationTests(TestCase):
+    """
+    Staff requests are authenticated from the token claims, without loading the user
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.nurse = User.objects.create_user(email='nurse@example.com', password='staff123', full_name='Nurse')
+        self.staff_role = Role.objects.get_or_create(name=Role.STAFF)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            UserRole.objects.create(user=self.nurse, role=self.staff_role)
+        response = self.client.post(reverse('accounts:login'), {'email': 'nurse@example.com', 'password': 'staff123'})
+        self.access = response.data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('order-order-queue'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_no_user_lookup(self):
+        # Load the cached copy of the user first
+        self.count_queries()
+        with override_settings(JWT_CLAIMS_AUTH=False):
+            with_lookup = self.count_queries()
+        self.assertEqual(self.count_queries(), with_lookup - 1)
+
+        # The claims user works as a foreign key value
+        user = user_from_token(AccessToken(self.access))
+        admin = User.objects.create_user(email='admin@example.com', password='admin123')
+        # The insert and the new claims generation of `admin`
+        with self.assertNumQueries(2):
+            UserRole.objects.create(user=admin, role=self.staff_role, assigned_by=user)
+
+    def test_deactivated_user_is_rejected(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nurse.is_active = False
+            self.nurse.save()
+        self.assertEqual(self.client.get(reverse('order-order-queue')).status_code, 401)
+
+    def test_deactivation_survives_cache_eviction(self):
+        self.assertEqual(self.client.get(reverse('order-order-queue')).status_code, 200)
+        self.nurse.is_active = False
+        self.nurse.save()
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('order-order-queue')).status_code, 401)
+
+    def test_local_memory_cache_is_refused(self):
+        self.assertEqual([error.id for error in check_claims_auth_cache(None)], ['accounts.E001'])
+
+    def test_me_returns_full_user(self):
+        response = self.client.get(reverse('accounts:me'))
+        self.assertEqual(response.data['email'], 'nurse@example.com')
+        self.assertIsNotNone(response.data['date_joined'])
@@ -0,0 +1,37 @@
+"""
+JWT tokens carrying the identity and roles of the user (see accounts.claims)
+"""
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .claims import claims_current, claims_generation, set_user_claims
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token with user claims, copied to its access tokens
+    Claims of an older generation than the user's are re-read on refresh.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        set_user_claims(token, user)
+        return token
+
+    @property
+    def access_token(self):
+        from .models import User
+
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            generation = claims_generation(user_id)
+            if generation is not None and not claims_current(self, generation):
+                set_user_claims(self, User(pk=user_id))
+        return super().access_token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that keeps the user claims current"""
+    token_class = RoleRefreshToken
@@ -8,7 +8,9 @@ from rest_framework import filters
 
 from .models import User, UserRole
 from .serializers import LoginSerializer, UserDetailSerializer, UserSerializer
+from .authentication import full_user
 from .permissions import IsSuperAdmin
+from .tokens import RoleRefreshToken
 
 
 @api_view(['POST'])
@@ -51,8 +53,8 @@ def login_view(request):
 
     user = serializer.validated_data['user']
 
-    # Generate JWT tokens
-    refresh = RefreshToken.for_user(user)
+    # Generate JWT tokens (with role claims)
+    refresh = RoleRefreshToken.for_user(user)
 
     # Prepare response
     user_serializer = UserDetailSerializer(user)
@@ -87,7 +89,7 @@ def me_view(request):
         "last_login": "2024-01-15T10:30:00.000Z"
     }
     """
-    serializer = UserDetailSerializer(request.user)
+    serializer = UserDetailSerializer(full_user(request.user))
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -210,7 +212,7 @@ class UserManagementViewSet(viewsets.ModelViewSet):
     partial_update: Partially update a user
     destroy: Delete a user
     """
-    queryset = User.objects.all().order_by('-date_joined')
+    queryset = User.objects.prefetch_related('user_roles__role').order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [IsSuperAdmin]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import ProductCategory, Product, ProductTag
+from .models import ProductCategory, Product, ProductTag, ProductPopularity
 
 
 @admin.register(ProductTag)
@@ -261,3 +261,19 @@ class ProductAdmin(admin.ModelAdmin):
         updated = queryset.update(is_active=False)
         self.message_user(request, f'{updated} product(s) deactivated.')
     deactivate_products.short_description = 'Deactivate selected products'
+
+
+@admin.register(ProductPopularity)
+class ProductPopularityAdmin(admin.ModelAdmin):
+    list_display = ['product', 'category', 'order_count', 'quantity_ordered', 'delivered_count', 'last_ordered_at']
+    list_filter = ['category']
+    search_fields = ['product__name']
+    ordering = ['-order_count']
+    readonly_fields = [
+        'product', 'category', 'order_count', 'quantity_ordered', 'delivered_count',
+        'score_7d', 'score_30d', 'last_ordered_at', 'updated_at'
+    ]
+
+    def has_add_permission(self, request):
+        # Maintained from orders, use the rebuild_product_popularity command to recompute
+        return False
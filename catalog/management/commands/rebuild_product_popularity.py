@@ -0,0 +1,26 @@
+"""
+Management command to recompute the product popularity counters from the order history
+Use it after importing orders, or if the incremental counters ever drift.
+Usage: python manage.py rebuild_product_popularity [--batch-size 2000]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.popularity import rebuild_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recomputes ProductPopularity counters and decayed scores from all order items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Order items read per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        self.stdout.write('Rebuilding product popularity...')
+        processed, products = rebuild_popularity(batch_size=batch_size, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} order items, {products} products ranked'
+        ))
@@ -0,0 +1,169 @@
+"""
+Precomputed kiosk menu snapshot
+
+The whole public menu (categories, products, tags and availability) is
+rendered once per catalog version into a JSON document. The document is
+kept in process memory and on disk (settings.MENU_SNAPSHOT_DIR), so a
+worker restart does not rebuild it, and the version is used as the ETag.
+
+The catalog version lives in the shared cache. Signals on Product,
+ProductCategory, ProductTag and InventoryBalance (plus the inventory
+balances_changed signal sent by reservations) bump it after commit.
+
+The a-prefixed functions are the async versions used by the async kiosk views.
+"""
+import os
+import tempfile
+import threading
+import time
+from hashlib import sha1
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from rest_framework.renderers import JSONRenderer
+
+from .models import ProductCategory, Product, ProductTag
+from .serializers import PublicProductCategorySerializer, PublicProductSerializer, ProductTagSerializer
+
+
+VERSION_KEY = 'catalog:version'
+
+_memory = {}  # snapshot key -> rendered JSON (only the current version is kept)
+_memory_lock = threading.Lock()
+
+
+def get_catalog_version():
+    """Current catalog version"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Time based, so a cache flush never hands out a version a client already has
+        version = time.time_ns() // 1000
+        if not cache.add(VERSION_KEY, version, timeout=None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+async def aget_catalog_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        version = time.time_ns() // 1000
+        if not await cache.aadd(VERSION_KEY, version, timeout=None):
+            version = await cache.aget(VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = time.time_ns() // 1000
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def catalog_changed():
+    """Invalidate the menu snapshot once the current transaction commits"""
+    transaction.on_commit(bump_catalog_version)
+
+
+def menu_etag(version):
+    return f'"menu-{version}"'
+
+
+def active_categories():
+    """Active categories with their active product count in a single query"""
+    return ProductCategory.objects.filter(is_active=True).annotate(
+        active_product_count=Count('products', filter=Q(products__is_active=True))
+    )
+
+
+def build_menu(request=None):
+    """Build the menu document (4 queries regardless of catalog size)"""
+    categories = active_categories().order_by('sort_order', 'name')
+    products = Product.objects.select_related('category', 'inventory_balance').prefetch_related('tags').filter(
+        is_active=True,
+        category__is_active=True
+    ).order_by('category__sort_order', 'product_sort_order', 'name')
+    tags = ProductTag.objects.filter(is_active=True).order_by('sort_order', 'name')
+
+    context = {'request': request}
+    return {
+        'categories': PublicProductCategorySerializer(categories, many=True).data,
+        'products': PublicProductSerializer(products, many=True, context=context).data,
+        'tags': ProductTagSerializer(tags, many=True).data,
+    }
+
+
+def _snapshot_dir():
+    return Path(getattr(settings, 'MENU_SNAPSHOT_DIR', None) or Path(tempfile.gettempdir()) / 'clinic_menu')
+
+
+def _snapshot_key(version, host):
+    # Image URLs are absolute, so the document depends on the host it was built for
+    return f'{version}-{sha1(host.encode()).hexdigest()[:12]}'
+
+
+def _read_disk(key):
+    try:
+        return (_snapshot_dir() / f'menu-{key}.json').read_bytes()
+    except OSError:
+        return None
+
+
+def _write_disk(version, key, content):
+    directory = _snapshot_dir()
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so other workers never read half a document
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.replace(tmp_path, directory / f'menu-{key}.json')
+        # Drop documents of older catalog versions
+        for old in directory.glob('menu-*.json'):
+            if int(old.name.split('-')[1]) < version:
+                old.unlink(missing_ok=True)
+    except (OSError, ValueError) as e:
+        print(f'Menu snapshot could not be written to disk: {e}')
+
+
+def get_menu_snapshot(request):
+    """
+    Rendered menu JSON for the current catalog version
+    Returns (version, content); checks memory, then disk, then builds it.
+    """
+    version = get_catalog_version()
+    key = _snapshot_key(version, request.get_host())
+
+    content = _memory.get(key)
+    if content is not None:
+        return version, content
+
+    content = _read_disk(key)
+    if content is None:
+        menu = build_menu(request)
+        menu['version'] = version
+        content = JSONRenderer().render(menu)
+        _write_disk(version, key, content)
+
+    with _memory_lock:
+        for old_key in [old_key for old_key in _memory if int(old_key.split('-')[0]) < version]:
+            del _memory[old_key]
+        _memory[key] = content
+    return version, content
+
+
+async def aget_menu_snapshot(request):
+    """
+    Async get_menu_snapshot: served from memory, the disk read or rebuild
+    (once per catalog version) runs in a worker thread
+    """
+    version = await aget_catalog_version()
+    content = _memory.get(_snapshot_key(version, request.get_host()))
+    if content is not None:
+        return version, content
+    return await sync_to_async(get_menu_snapshot)(request)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_add_food_category_and_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='catalog.product', verbose_name='product')),
+                ('order_count', models.PositiveIntegerField(default=0, help_text='Number of order lines with this product', verbose_name='order count')),
+                ('quantity_ordered', models.PositiveIntegerField(default=0, help_text='Total units ordered', verbose_name='quantity ordered')),
+                ('delivered_count', models.PositiveIntegerField(default=0, help_text='Number of delivered order lines with this product', verbose_name='delivered count')),
+                ('score_7d', models.FloatField(default=0, help_text='Forward-decayed order count with a 7 day half-life', verbose_name='7 day score')),
+                ('score_30d', models.FloatField(default=0, help_text='Forward-decayed order count with a 30 day half-life', verbose_name='30 day score')),
+                ('last_ordered_at', models.DateTimeField(blank=True, null=True, verbose_name='last ordered at')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(help_text='Copy of the product category, for per-category rankings', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.productcategory', verbose_name='category')),
+            ],
+            options={
+                'verbose_name': 'product popularity',
+                'verbose_name_plural': 'product popularity',
+                'indexes': [models.Index(fields=['-order_count'], name='popularity_count_idx'), models.Index(fields=['category', '-order_count'], name='popularity_cat_count_idx'), models.Index(fields=['-score_7d'], name='popularity_7d_idx'), models.Index(fields=['-score_30d'], name='popularity_30d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_rating_sum(apps, schema_editor):
+    """
+    Products rated in feedbacks get their exact sum and count; ratings entered
+    by hand keep their average (rating_sum = rating * rating_count)
+    """
+    Product = apps.get_model('catalog', 'Product')
+    Feedback = apps.get_model('feedbacks', 'Feedback')
+
+    totals = {}
+    for product_ratings in Feedback.objects.exclude(product_ratings={}).values_list(
+        'product_ratings', flat=True
+    ).iterator(chunk_size=500):
+        for order_ratings in product_ratings.values():
+            for product_id, rating in order_ratings.items():
+                try:
+                    product_id = int(product_id)
+                except (ValueError, TypeError):
+                    continue
+                if rating is not None and 0 <= rating <= 5:
+                    rating_sum, rating_count = totals.get(product_id, (0, 0))
+                    totals[product_id] = (rating_sum + rating, rating_count + 1)
+
+    products = list(Product.objects.only('id', 'rating', 'rating_count'))
+    for product in products:
+        if product.id in totals:
+            product.rating_sum, product.rating_count = totals[product.id]
+            product.rating = round(Decimal(product.rating_sum) / product.rating_count, 1)
+        else:
+            product.rating_sum = round(product.rating * product.rating_count)
+    Product.objects.bulk_update(products, ['rating', 'rating_count', 'rating_sum'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_product_popularity'),
+        ('feedbacks', '0004_update_feedback_structure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, help_text='Sum of all ratings received, rating is rating_sum / rating_count', verbose_name='rating sum'),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated manually: decayed popularity scores are stored as logs
+
+import math
+
+from django.db import migrations, models
+
+
+def scores_to_logs(apps, schema_editor):
+    ProductPopularity = apps.get_model('catalog', 'ProductPopularity')
+    for row in ProductPopularity.objects.all():
+        row.score_7d = math.log(row.score_7d) if row.score_7d else None
+        row.score_30d = math.log(row.score_30d) if row.score_30d else None
+        row.save(update_fields=['score_7d', 'score_30d'])
+
+
+def logs_to_scores(apps, schema_editor):
+    ProductPopularity = apps.get_model('catalog', 'ProductPopularity')
+    for row in ProductPopularity.objects.all():
+        row.score_7d = 0 if row.score_7d is None else math.exp(row.score_7d)
+        row.score_30d = 0 if row.score_30d is None else math.exp(row.score_30d)
+        row.save(update_fields=['score_7d', 'score_30d'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_product_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productpopularity',
+            name='score_7d',
+            field=models.FloatField(blank=True, null=True, help_text='Log of the forward-decayed order count with a 7 day half-life', verbose_name='7 day score'),
+        ),
+        migrations.AlterField(
+            model_name='productpopularity',
+            name='score_30d',
+            field=models.FloatField(blank=True, null=True, help_text='Log of the forward-decayed order count with a 30 day half-life', verbose_name='30 day score'),
+        ),
+        migrations.RunPython(scores_to_logs, logs_to_scores),
+    ]
@@ -0,0 +1,28 @@
+# Generated manually: rank the products ordered before the popularity counters existed
+
+from django.db import migrations
+
+
+def backfill_popularity(apps, schema_editor):
+    """
+    Without this the most-ordered endpoints fall back to catalog order
+    until rebuild_product_popularity runs
+    """
+    from catalog.popularity import rebuild_popularity
+
+    rebuild_popularity(models=(
+        apps.get_model('orders', 'OrderItem'),
+        apps.get_model('catalog', 'ProductPopularity'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_popularity_log_scores'),
+        ('orders', '0002_order_patient_assignment'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
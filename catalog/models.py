@@ -182,6 +182,11 @@ class Product(models.Model):
         validators=[MinValueValidator(0)],
         help_text=_('Number of ratings received')
     )
+    rating_sum = models.PositiveIntegerField(
+        _('rating sum'),
+        default=0,
+        help_text=_('Sum of all ratings received, rating is rating_sum / rating_count')
+    )
 
     # Tags and categorization
     tags = models.ManyToManyField(
@@ -281,3 +286,75 @@ class Product(models.Model):
             self.sku = f"{category_prefix}-{next_number:04d}"
 
         super().save(*args, **kwargs)
+
+
+class ProductPopularity(models.Model):
+    """
+    Denormalized order counters per product, kept up to date as orders are
+    placed and delivered (see catalog.popularity)
+
+    score_7d and score_30d are forward-decayed counters: every order adds a
+    weight that grows exponentially with time, so sorting by the raw score
+    ranks products by their recent popularity without ever rewriting old rows.
+    They store the natural log of the score, NULL for products never ordered.
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name=_('product')
+    )
+    category = models.ForeignKey(
+        ProductCategory,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('category'),
+        help_text=_('Copy of the product category, for per-category rankings')
+    )
+    order_count = models.PositiveIntegerField(
+        _('order count'),
+        default=0,
+        help_text=_('Number of order lines with this product')
+    )
+    quantity_ordered = models.PositiveIntegerField(
+        _('quantity ordered'),
+        default=0,
+        help_text=_('Total units ordered')
+    )
+    delivered_count = models.PositiveIntegerField(
+        _('delivered count'),
+        default=0,
+        help_text=_('Number of delivered order lines with this product')
+    )
+    score_7d = models.FloatField(
+        _('7 day score'),
+        blank=True,
+        null=True,
+        help_text=_('Log of the forward-decayed order count with a 7 day half-life')
+    )
+    score_30d = models.FloatField(
+        _('30 day score'),
+        blank=True,
+        null=True,
+        help_text=_('Log of the forward-decayed order count with a 30 day half-life')
+    )
+    last_ordered_at = models.DateTimeField(
+        _('last ordered at'),
+        blank=True,
+        null=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('product popularity')
+        verbose_name_plural = _('product popularity')
+        indexes = [
+            models.Index(fields=['-order_count'], name='popularity_count_idx'),
+            models.Index(fields=['category', '-order_count'], name='popularity_cat_count_idx'),
+            models.Index(fields=['-score_7d'], name='popularity_7d_idx'),
+            models.Index(fields=['-score_30d'], name='popularity_30d_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.order_count} orders'
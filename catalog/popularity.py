@@ -0,0 +1,254 @@
+"""
+Incremental product popularity counters
+
+ProductPopularity rows are updated when orders are placed and delivered, so
+the most-ordered endpoints read a top-N from an indexed table instead of
+counting the whole OrderItem history on every kiosk page load.
+
+Time-decayed scores use forward decay: an order placed at time t adds
+2 ** ((t - DECAY_EPOCH) / half_life) to the score. Newer orders weigh more,
+the ordering of the stored scores is the ordering of the decayed counts at any
+moment, and the current decayed count is score * 2 ** (-(now - DECAY_EPOCH) / half_life).
+
+The weights grow without bound (a 7 day half-life overflows a float about
+twenty years after the epoch), so the score fields store the natural log of
+the score, NULL for none. Logs grow linearly with time, sort like the scores
+and are added with log(e^a + e^b) = max + log(1 + e^(min - max)).
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import (
+    Case, F, FloatField, IntegerField, Value, When, aprefetch_related_objects, prefetch_related_objects
+)
+from django.db.models.functions import Exp, Greatest, Least, Ln
+from django.utils import timezone
+
+from common.transactions import robust_on_commit
+
+from .models import Product, ProductPopularity
+
+
+DECAY_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# Ranking window -> ProductPopularity field
+WINDOWS = {
+    'all': 'order_count',
+    '7d': 'score_7d',
+    '30d': 'score_30d',
+}
+
+HALF_LIVES = {
+    'score_7d': timedelta(days=7),
+    'score_30d': timedelta(days=30),
+}
+
+
+def log_weight(at, half_life):
+    """Natural log of the forward-decay weight of an event at `at`"""
+    return math.log(2) * ((at - DECAY_EPOCH) / half_life)
+
+
+def log_add(a, b):
+    """log(e^a + e^b), None standing for log(0)"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def decayed_count(score, half_life, now=None):
+    """Current decayed count of a stored (log) score"""
+    if score is None:
+        return 0.0
+    now = now or timezone.now()
+    return math.exp(score - log_weight(now, half_life))
+
+
+def _per_product(field, values, output_field):
+    """field + CASE product_id WHEN ... THEN value END, for a bulk increment"""
+    return F(field) + Case(
+        *[When(product_id=product_id, then=Value(value)) for product_id, value in values.items()],
+        default=Value(0),
+        output_field=output_field
+    )
+
+
+def _log_add_per_product(field, values):
+    """log(e^field + e^value) per product, in SQL; `values` must cover every updated row"""
+    value = Case(
+        *[When(product_id=product_id, then=Value(value)) for product_id, value in values.items()],
+        output_field=FloatField()
+    )
+    return Case(
+        When(**{f'{field}__isnull': True}, then=value),
+        default=Greatest(F(field), value) + Ln(1 + Exp(Least(F(field), value) - Greatest(F(field), value))),
+        output_field=FloatField()
+    )
+
+
+def _increment(categories, counts=None, quantities=None, delivered=None, at=None):
+    """
+    Add to the counters of several products in two statements
+    `categories` maps product_id -> category_id, the other dicts product_id -> increment.
+    """
+    if not categories:
+        return
+
+    ProductPopularity.objects.bulk_create(
+        [ProductPopularity(product_id=product_id, category_id=category_id)
+         for product_id, category_id in categories.items()],
+        ignore_conflicts=True
+    )
+
+    updates = {'updated_at': timezone.now()}
+    if counts:
+        updates['order_count'] = _per_product('order_count', counts, IntegerField())
+        for field, half_life in HALF_LIVES.items():
+            weight = log_weight(at, half_life)
+            updates[field] = _log_add_per_product(
+                field,
+                {product_id: math.log(count) + weight for product_id, count in counts.items()}
+            )
+        updates['last_ordered_at'] = at
+    if quantities:
+        updates['quantity_ordered'] = _per_product('quantity_ordered', quantities, IntegerField())
+    if delivered:
+        updates['delivered_count'] = _per_product('delivered_count', delivered, IntegerField())
+
+    ProductPopularity.objects.filter(product_id__in=list(categories)).update(**updates)
+
+
+def _summarize(items):
+    categories, counts, quantities = {}, {}, {}
+    for item in items:
+        categories[item.product_id] = item.product.category_id
+        counts[item.product_id] = counts.get(item.product_id, 0) + 1
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return categories, counts, quantities
+
+
+def record_order_placed(order, items):
+    """
+    Count the items of a newly placed order
+    Applied after commit, so the counter rows are only locked for one short
+    statement; a failure is logged and leaves the order placed.
+    """
+    categories, counts, quantities = _summarize(items)
+    placed_at = order.placed_at
+    robust_on_commit(
+        lambda: _increment(categories, counts=counts, quantities=quantities, at=placed_at),
+        f'Popularity update of placed order #{order.id} failed, run rebuild_product_popularity'
+    )
+
+
+def record_order_delivered(order, items):
+    """Count the items of a delivered order, after commit"""
+    categories, counts, _ = _summarize(items)
+    robust_on_commit(
+        lambda: _increment(categories, delivered=counts),
+        f'Popularity update of delivered order #{order.id} failed, run rebuild_product_popularity'
+    )
+
+
+def _ranked(field, category_id):
+    # Decayed fields hold NULL, not 0, for products without orders
+    ranked = ProductPopularity.objects.select_related('product__category', 'product__inventory_balance').filter(
+        product__is_active=True,
+        product__category__is_active=True,
+        **({f'{field}__isnull': False} if field in HALF_LIVES else {f'{field}__gt': 0})
+    )
+    if category_id is not None:
+        ranked = ranked.filter(category_id=category_id)
+    return ranked.order_by(f'-{field}', 'product__product_sort_order', 'product__name')
+
+
+def _unranked(products, category_id):
+    rest = Product.objects.select_related('category', 'inventory_balance').filter(
+        is_active=True,
+        category__is_active=True
+    ).exclude(id__in=[product.id for product in products])
+    if category_id is not None:
+        rest = rest.filter(category_id=category_id)
+    return rest.order_by('product_sort_order', 'name')
+
+
+def top_products(limit, category_id=None, window='all'):
+    """
+    Most ordered active products, best first
+    Reads the top-N from ProductPopularity and fills up with never ordered
+    products (in catalog order) when there are fewer than `limit`.
+    """
+    field = WINDOWS.get(window, WINDOWS['all'])
+    products = [popularity.product for popularity in _ranked(field, category_id)[:limit]]
+    if len(products) < limit:
+        products += list(_unranked(products, category_id)[:limit - len(products)])
+
+    prefetch_related_objects(products, 'tags')
+    return products
+
+
+async def atop_products(limit, category_id=None, window='all'):
+    """Async version of top_products (async ORM)"""
+    field = WINDOWS.get(window, WINDOWS['all'])
+    products = [popularity.product async for popularity in _ranked(field, category_id)[:limit]]
+    if len(products) < limit:
+        products += [product async for product in _unranked(products, category_id)[:limit - len(products)]]
+
+    await aprefetch_related_objects(products, 'tags')
+    return products
+
+
+def rebuild_popularity(batch_size=2000, stdout=None, models=None):
+    """
+    Recompute every counter from the order history
+    OrderItems are read in primary key batches; the table is replaced in one
+    transaction. Orders placed while the rebuild runs may be missed, run it
+    during a quiet period.
+    `models` is (OrderItem, ProductPopularity), the historical models when
+    called from a migration.
+    """
+    if models:
+        OrderItem, Popularity = models
+    else:
+        from orders.models import OrderItem
+        Popularity = ProductPopularity
+
+    totals = {}
+    last_id = 0
+    processed = 0
+    while True:
+        batch = list(
+            OrderItem.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'product_id', 'product__category_id', 'quantity', 'order__placed_at', 'order__status'
+            )[:batch_size]
+        )
+        if not batch:
+            break
+
+        for item_id, product_id, category_id, quantity, placed_at, status in batch:
+            row = totals.get(product_id)
+            if row is None:
+                row = totals[product_id] = Popularity(product_id=product_id, category_id=category_id)
+            row.order_count += 1
+            row.quantity_ordered += quantity
+            if status == 'DELIVERED':
+                row.delivered_count += 1
+            for field, half_life in HALF_LIVES.items():
+                setattr(row, field, log_add(getattr(row, field), log_weight(placed_at, half_life)))
+            if row.last_ordered_at is None or placed_at > row.last_ordered_at:
+                row.last_ordered_at = placed_at
+
+        last_id = batch[-1][0]
+        processed += len(batch)
+        if stdout:
+            stdout.write(f'  {processed} order items read')
+
+    with transaction.atomic():
+        Popularity.objects.all().delete()
+        Popularity.objects.bulk_create(totals.values(), batch_size=batch_size)
+
+    return processed, len(totals)
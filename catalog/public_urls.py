@@ -7,7 +7,11 @@ from .views import (
     get_products_by_category,
     get_most_ordered_products,
     get_most_ordered_by_category,
-    get_carousel_categories
+    get_carousel_categories,
+    get_menu,
+    get_menu_async,
+    get_featured_product_async,
+    get_most_ordered_products_async
 )
 
 # Router for public endpoints
@@ -17,9 +21,15 @@ public_router.register(r'products', PublicProductViewSet, basename='public-produ
 
 # Custom endpoints for Kiosk features
 urlpatterns = [
+    path('menu/', get_menu, name='menu'),
     path('products/featured/', get_featured_product, name='featured-product'),
     path('products/most-ordered/', get_most_ordered_products, name='most-ordered-products'),
     path('categories/<int:category_id>/products/', get_products_by_category, name='category-products'),
     path('categories/<int:category_id>/most-ordered/', get_most_ordered_by_category, name='category-most-ordered'),
     path('categories/carousel/', get_carousel_categories, name='carousel-categories'),
+
+    # Async versions (same JSON), served on the event loop under ASGI
+    path('async/menu/', get_menu_async, name='async-menu'),
+    path('async/products/featured/', get_featured_product_async, name='async-featured-product'),
+    path('async/products/most-ordered/', get_most_ordered_products_async, name='async-most-ordered-products'),
 ] + public_router.urls
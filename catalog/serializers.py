@@ -37,6 +37,9 @@ class ProductCategorySerializer(serializers.ModelSerializer):
 
     def get_product_count(self, obj):
         """Get count of active products in this category"""
+        if hasattr(obj, 'active_product_count'):
+            # Annotated by the queryset (see ProductCategoryViewSet)
+            return obj.active_product_count
         return obj.products.filter(is_active=True).count()
 
 
@@ -107,6 +110,9 @@ class PublicProductCategorySerializer(serializers.ModelSerializer):
 
     def get_product_count(self, obj):
         """Get count of active products in this category"""
+        if hasattr(obj, 'active_product_count'):
+            # Annotated by the queryset (see catalog.menu.active_categories)
+            return obj.active_product_count
         return obj.products.filter(is_active=True).count()
 
 
@@ -0,0 +1,42 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from inventory.models import InventoryBalance
+from inventory.signals import balances_changed
+from .menu import catalog_changed
+from .models import ProductCategory, Product, ProductTag, ProductPopularity
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=ProductTag)
+@receiver(post_delete, sender=ProductTag)
+@receiver(post_save, sender=InventoryBalance)
+@receiver(post_delete, sender=InventoryBalance)
+def invalidate_menu(sender, **kwargs):
+    """
+    Any change to what the kiosk menu shows invalidates the menu snapshot
+    """
+    catalog_changed()
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_menu_on_tags(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        catalog_changed()
+
+
+@receiver(balances_changed)
+def invalidate_menu_on_reservations(sender, **kwargs):
+    """Reservations update balances in bulk, without post_save"""
+    catalog_changed()
+
+
+@receiver(post_save, sender=Product)
+def sync_popularity_category(sender, instance, created, **kwargs):
+    """ProductPopularity keeps a copy of the category for per-category rankings"""
+    if not created:
+        ProductPopularity.objects.filter(product=instance).exclude(
+            category_id=instance.category_id
+        ).update(category_id=instance.category_id)
@@ -1,3 +1,138 @@
+from contextlib import redirect_stdout
+from datetime import datetime, timezone as dt_timezone
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from clinic.models import Room, Device, Patient, PatientAssignment
+from inventory.models import InventoryBalance
+from orders.services import place_order
+from .models import ProductCategory, Product, ProductPopularity
+from .popularity import HALF_LIVES, decayed_count
+
+
+class MenuSnapshotTests(TestCase):
+    """
+    The kiosk menu is one cached document, revalidated with its catalog version
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.drinks = ProductCategory.objects.create(name='Bebidas', category_type='DRINK')
+        self.water = Product.objects.create(name='Agua', category=self.drinks)
+        Product.objects.create(name='Jugo', category=self.drinks)
+        InventoryBalance.objects.filter(product=self.water).update(on_hand=5)
+        self.url = reverse('menu')
+
+    def test_menu_document(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        menu = response.json()
+        self.assertEqual(menu['categories'][0]['product_count'], 2)
+        water = next(product for product in menu['products'] if product['id'] == self.water.id)
+        self.assertEqual(water['available'], 5)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_change_issues_new_version(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.water.name = 'Agua mineral'
+            self.water.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Agua mineral', [product['name'] for product in response.json()['products']])
+
+
+class ProductPopularityTests(TestCase):
+    """
+    Most-ordered endpoints read counters maintained as orders are placed
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.drinks = ProductCategory.objects.create(name='Bebidas', category_type='DRINK')
+        self.water = Product.objects.create(name='Agua', category=self.drinks)
+        self.juice = Product.objects.create(name='Jugo', category=self.drinks)
+        self.tea = Product.objects.create(name='Te', category=self.drinks)
+        InventoryBalance.objects.update(on_hand=100)
+
+        room = Room.objects.create(code='101')
+        self.device = Device.objects.create(device_uid='IPAD-01', room=room)
+        self.assignment = PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient', phone_e164='+15550000001'),
+            staff=User.objects.create_user(email='staff@example.com', password='staff123', full_name='Staff'),
+            device=self.device,
+            room=room
+        )
+
+    def _order(self, *products):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            place_order(
+                device=self.device,
+                patient_assignment=self.assignment,
+                items_data=[{'product_id': product.id, 'quantity': 2} for product in products],
+                enforce_limits=False
+            )
+
+    def test_counters_follow_orders_and_rebuild(self):
+        self._order(self.juice, self.water)
+        self._order(self.juice)
+
+        juice = ProductPopularity.objects.get(product=self.juice)
+        self.assertEqual((juice.order_count, juice.quantity_ordered), (2, 4))
+        self.assertGreater(juice.score_7d, ProductPopularity.objects.get(product=self.water).score_7d)
+
+        response = self.client.get(reverse('most-ordered-products'))
+        # Never ordered products fill the list after the ranked ones
+        self.assertEqual([product['id'] for product in response.data], [self.juice.id, self.water.id, self.tea.id])
+
+        response = self.client.get(reverse('category-most-ordered', args=[self.drinks.id]), {'limit': 1, 'window': '7d'})
+        self.assertEqual([product['id'] for product in response.data], [self.juice.id])
+
+        ProductPopularity.objects.all().delete()
+        call_command('rebuild_product_popularity', batch_size=1, stdout=StringIO())
+        self.assertEqual(ProductPopularity.objects.get(product=self.juice).order_count, 2)
+        self.assertEqual(ProductPopularity.objects.get(product=self.water).quantity_ordered, 2)
+        self.assertAlmostEqual(ProductPopularity.objects.get(product=self.juice).score_7d, juice.score_7d)
+
+        # The migration backfills the orders placed before the counters existed
+        ProductPopularity.objects.all().delete()
+        import_module('catalog.migrations.0009_backfill_product_popularity').backfill_popularity(apps, None)
+        self.assertEqual(ProductPopularity.objects.get(product=self.juice).order_count, 2)
+        self.assertAlmostEqual(ProductPopularity.objects.get(product=self.juice).score_7d, juice.score_7d)
+
+    def test_decayed_scores_do_not_overflow(self):
+        far_future = datetime(2125, 1, 1, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=far_future):
+            self._order(self.juice)
+            self._order(self.juice)
+
+        juice = ProductPopularity.objects.get(product=self.juice)
+        self.assertAlmostEqual(decayed_count(juice.score_7d, HALF_LIVES['score_7d'], now=far_future), 2)
+        self.assertAlmostEqual(decayed_count(juice.score_30d, HALF_LIVES['score_30d'], now=far_future), 2)
+
+    def test_failed_update_does_not_fail_the_order(self):
+        output = StringIO()
+        with mock.patch('catalog.popularity._increment', side_effect=DatabaseError('lock timeout')), \
+                redirect_stdout(output), self.assertLogs('django', 'ERROR'):
+            self._order(self.juice)
 
-# Create your tests here.
+        self.assertTrue(self.assignment.orders.exists())
+        self.assertIn('run rebuild_product_popularity', output.getvalue())
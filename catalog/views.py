@@ -4,8 +4,11 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Count
+from django.db.models import Count, Q
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
 from accounts.permissions import IsStaffOrAdmin
+from common.responses import JSONResponse, not_modified
 
 from .models import ProductCategory, Product, ProductTag
 from .serializers import (
@@ -15,6 +18,10 @@ from .serializers import (
     PublicProductSerializer,
     ProductTagSerializer
 )
+from .menu import (
+    active_categories, aget_catalog_version, aget_menu_snapshot, get_catalog_version, get_menu_snapshot, menu_etag
+)
+from .popularity import atop_products, top_products
 
 
 # Staff endpoints (require authentication)
@@ -53,7 +60,9 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
     partial_update: Partially update a category
     destroy: Delete a category
     """
-    queryset = ProductCategory.objects.all()
+    queryset = ProductCategory.objects.annotate(
+        active_product_count=Count('products', filter=Q(products__is_active=True))
+    )
     serializer_class = ProductCategorySerializer
     permission_classes = [IsStaffOrAdmin]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -75,7 +84,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     partial_update: Partially update a product
     destroy: Delete a product
     """
-    queryset = Product.objects.select_related('category').all()
+    queryset = Product.objects.select_related('category').prefetch_related('tags').all()
     serializer_class = ProductSerializer
     permission_classes = [IsStaffOrAdmin]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
@@ -96,7 +105,7 @@ class PublicProductCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     list: Get all active categories
     retrieve: Get a specific active category
     """
-    queryset = ProductCategory.objects.filter(is_active=True)
+    queryset = active_categories()
     serializer_class = PublicProductCategorySerializer
     permission_classes = [AllowAny]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -112,7 +121,7 @@ class PublicProductViewSet(viewsets.ReadOnlyModelViewSet):
     list: Get all active products
     retrieve: Get a specific active product
     """
-    queryset = Product.objects.select_related('category').prefetch_related('tags').filter(
+    queryset = Product.objects.select_related('category', 'inventory_balance').prefetch_related('tags').filter(
         is_active=True,
         category__is_active=True
     )
@@ -126,6 +135,22 @@ class PublicProductViewSet(viewsets.ReadOnlyModelViewSet):
 
 # Custom public endpoints for Kiosk
 
+def _featured_products():
+    return Product.objects.select_related('category', 'inventory_balance').prefetch_related('tags').filter(
+        is_active=True,
+        category__is_active=True,
+        is_featured=True
+    ).order_by('-product_sort_order')
+
+
+def _menu_response(version, content):
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = menu_etag(version)
+    # Clients may keep the menu but must revalidate it on every load
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_featured_product(request):
@@ -133,11 +158,7 @@ def get_featured_product(request):
     Get the featured product (product of the month/week)
     Returns the product marked as featured with highest sort_order
     """
-    product = Product.objects.select_related('category').prefetch_related('tags').filter(
-        is_active=True,
-        category__is_active=True,
-        is_featured=True
-    ).order_by('-product_sort_order').first()
+    product = _featured_products().first()
 
     if product:
         serializer = PublicProductSerializer(product, context={'request': request})
@@ -153,7 +174,7 @@ def get_products_by_category(request, category_id):
     Get products for a specific category (for carousels)
     Returns active products ordered by sort_order
     """
-    products = Product.objects.select_related('category').prefetch_related('tags').filter(
+    products = Product.objects.select_related('category', 'inventory_balance').prefetch_related('tags').filter(
         category_id=category_id,
         is_active=True,
         category__is_active=True
@@ -169,13 +190,9 @@ def get_most_ordered_products(request):
     """
     Get the most ordered products
     Returns top 10 products ordered by number of times they appear in orders
+    ?window=7d|30d ranks by recent (time-decayed) orders instead of all time
     """
-    products = Product.objects.select_related('category').prefetch_related('tags').filter(
-        is_active=True,
-        category__is_active=True
-    ).annotate(
-        order_count=Count('order_items')
-    ).order_by('-order_count', 'product_sort_order', 'name')[:10]
+    products = top_products(10, window=request.query_params.get('window', 'all'))
 
     serializer = PublicProductSerializer(products, many=True, context={'request': request})
     return Response(serializer.data)
@@ -188,8 +205,7 @@ def get_carousel_categories(request):
     Get categories configured to show in carousels
     Returns active categories with show_in_carousel=True ordered by carousel_order
     """
-    categories = ProductCategory.objects.filter(
-        is_active=True,
+    categories = active_categories().filter(
         show_in_carousel=True
     ).order_by('carousel_order', 'sort_order')
 
@@ -203,16 +219,71 @@ def get_most_ordered_by_category(request, category_id):
     """
     Get the most ordered products for a specific category
     Returns top 5 products ordered by number of times they appear in orders
+    ?window=7d|30d ranks by recent (time-decayed) orders instead of all time
     """
     limit = int(request.query_params.get('limit', 5))
 
-    products = Product.objects.select_related('category').prefetch_related('tags').filter(
-        is_active=True,
-        category_id=category_id,
-        category__is_active=True
-    ).annotate(
-        order_count=Count('order_items')
-    ).order_by('-order_count', 'product_sort_order', 'name')[:limit]
+    products = top_products(limit, category_id=category_id, window=request.query_params.get('window', 'all'))
 
     serializer = PublicProductSerializer(products, many=True, context={'request': request})
     return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_menu(request):
+    """
+    Get the whole kiosk menu in one document
+    GET /api/public/menu/
+
+    Returns categories, products (with availability) and tags, pre-rendered per
+    catalog version. The version is the ETag: a request with a matching
+    If-None-Match gets a 304 without touching the database.
+    """
+    response = not_modified(request, menu_etag(get_catalog_version()))
+    if response:
+        return response
+
+    return _menu_response(*get_menu_snapshot(request))
+
+
+# Async versions of the kiosk reads, same JSON as the views above. They run
+# on the event loop under ASGI instead of taking a worker thread per request.
+
+@require_GET
+async def get_menu_async(request):
+    """
+    Async get_menu
+    GET /api/public/async/menu/
+    """
+    response = not_modified(request, menu_etag(await aget_catalog_version()))
+    if response:
+        return response
+
+    return _menu_response(*await aget_menu_snapshot(request))
+
+
+@require_GET
+async def get_featured_product_async(request):
+    """
+    Async get_featured_product
+    GET /api/public/async/products/featured/
+    """
+    product = await _featured_products().afirst()
+
+    if product:
+        return JSONResponse(PublicProductSerializer(product, context={'request': request}).data)
+
+    return JSONResponse(None)
+
+
+@require_GET
+async def get_most_ordered_products_async(request):
+    """
+    Async get_most_ordered_products
+    GET /api/public/async/products/most-ordered/
+    """
+    products = await atop_products(10, window=request.GET.get('window', 'all'))
+
+    serializer = PublicProductSerializer(products, many=True, context={'request': request})
+    return JSONResponse(serializer.data)
@@ -0,0 +1,210 @@
+"""
+Signed device tokens for the public kiosk endpoints and KioskOrderConsumer
+
+Staff enroll a device (POST /api/clinic/devices/{id}/enroll/) and the kiosk
+sends the token it receives instead of its raw device_uid, in the
+X-Device-Token header (the device_token query parameter of the WebSocket
+URL, where browsers cannot set headers; a URL ends up in access logs, so
+HTTP endpoints do not read it). The token is signed with SECRET_KEY and
+carries the device id, device_uid and room, so checking it needs no query.
+
+Tokens are checked against the list of active devices and their
+tokens_revoked_at, kept in the shared cache and rebuilt with one query when
+missing. A token is only valid if its device is on the list and was issued
+after tokens_revoked_at, so tokens of deactivated and deleted devices are
+rejected even when the cached list was evicted. Until every kiosk is
+enrolled, requests without a token still identify the device by device_uid
+(DEVICE_UID_AUTH).
+
+Every device identified here is recorded as online (clinic.presence). The
+a-prefixed functions are the async versions used by the async kiosk views.
+"""
+import time
+from collections import namedtuple
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Device
+from .presence import device_presence
+
+
+SALT = 'clinic.device_token'
+HEADER = 'X-Device-Token'
+QUERY_PARAM = 'device_token'
+VALID_KEY = 'clinic:valid_devices'
+VALID_TIMEOUT = 5 * 60  # seconds, bounds a list rebuilt while a change was committing
+
+DeviceIdentity = namedtuple('DeviceIdentity', ['device_id', 'device_uid', 'room_id'])
+
+
+class DeviceTokenError(Exception):
+    """Invalid, expired or revoked device token"""
+
+
+def issue_device_token(device):
+    """Signed token identifying the device, valid for DEVICE_TOKEN_MAX_AGE seconds"""
+    return signing.dumps({
+        'd': device.id,
+        'u': device.device_uid,
+        'r': device.room_id,
+        'iat': time.time(),
+    }, salt=SALT)
+
+
+def _valid_rows():
+    return Device.objects.filter(is_active=True).values_list('id', 'tokens_revoked_at')
+
+
+def _valid_list(rows):
+    return {
+        device_id: revoked_at.timestamp() if revoked_at else None
+        for device_id, revoked_at in rows
+    }
+
+
+def valid_devices():
+    """
+    Devices that can hold valid tokens: {device_id: tokens_revoked_at
+    timestamp or None}, active devices only
+    """
+    valid = cache.get(VALID_KEY)
+    if valid is None:
+        valid = _valid_list(_valid_rows())
+        cache.set(VALID_KEY, valid, VALID_TIMEOUT)
+    return valid
+
+
+async def avalid_devices():
+    valid = await cache.aget(VALID_KEY)
+    if valid is None:
+        valid = _valid_list([row async for row in _valid_rows()])
+        await cache.aset(VALID_KEY, valid, VALID_TIMEOUT)
+    return valid
+
+
+def forget_valid_devices():
+    """Drop the cached list of valid devices, rebuilt on the next token check"""
+    cache.delete(VALID_KEY)
+
+
+def revocation_changed():
+    """Rebuild the list of valid devices once the current transaction commits"""
+    transaction.on_commit(forget_valid_devices)
+
+
+def _decode(token):
+    try:
+        return signing.loads(token, salt=SALT, max_age=settings.DEVICE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise DeviceTokenError('Invalid or expired device token')
+
+
+def _identity(data, valid):
+    # Deactivated and deleted devices are not on the list
+    if data['d'] not in valid:
+        raise DeviceTokenError('Device token revoked')
+    revoked_at = valid[data['d']]
+    if revoked_at is not None and data['iat'] < revoked_at:
+        raise DeviceTokenError('Device token revoked')
+    return DeviceIdentity(data['d'], data['u'], data['r'])
+
+
+def read_device_token(token):
+    """Identity carried by a valid token; raises DeviceTokenError"""
+    data = _decode(token)
+    return _identity(data, valid_devices())
+
+
+async def aread_device_token(token):
+    data = _decode(token)
+    return _identity(data, await avalid_devices())
+
+
+def _uid_lookup(device_uid):
+    """Query for an active device by its raw device_uid"""
+    if not settings.DEVICE_UID_AUTH:
+        raise DeviceTokenError('Device token required')
+    return Device.objects.values_list('id', 'room_id').filter(device_uid=device_uid, is_active=True)
+
+
+def _identity_from_uid(device_uid):
+    """Identity of an active device by its raw device_uid (one query)"""
+    device_id, room_id = _uid_lookup(device_uid).get()
+    return DeviceIdentity(device_id, device_uid, room_id)
+
+
+async def _aidentity_from_uid(device_uid):
+    device_id, room_id = await _uid_lookup(device_uid).aget()
+    return DeviceIdentity(device_id, device_uid, room_id)
+
+
+def _seen(identity):
+    device_presence.seen(identity.device_id)
+    return identity
+
+
+def _request_token(request):
+    return request.headers.get(HEADER)
+
+
+def device_from_request(request, device_uid=None):
+    """
+    Device making a public kiosk request: from its token when it sends one,
+    otherwise from `device_uid`. Returns None when there is neither.
+    Raises DeviceTokenError, or Device.DoesNotExist for an unknown or inactive device_uid.
+    """
+    token = _request_token(request)
+    if token:
+        return _seen(read_device_token(token))
+    if device_uid:
+        return _seen(_identity_from_uid(device_uid))
+    return None
+
+
+async def adevice_from_request(request, device_uid=None):
+    token = _request_token(request)
+    if token:
+        return _seen(await aread_device_token(token))
+    if device_uid:
+        return _seen(await _aidentity_from_uid(device_uid))
+    return None
+
+
+def _check_identity(identity, device_uid):
+    if identity.device_uid != device_uid:
+        raise DeviceTokenError('Device token does not match the device')
+    return _seen(identity)
+
+
+def device_for_uid(request, device_uid):
+    """
+    Device a request for `device_uid` comes from: the one of its token, which
+    must belong to that device (no query), or without a token the active
+    device with that device_uid (one query).
+    Raises DeviceTokenError, or Device.DoesNotExist for an unknown or inactive device_uid.
+    """
+    token = _request_token(request)
+    if token:
+        return _check_identity(read_device_token(token), device_uid)
+    return _seen(_identity_from_uid(device_uid))
+
+
+async def adevice_for_uid(request, device_uid):
+    token = _request_token(request)
+    if token:
+        return _check_identity(await aread_device_token(token), device_uid)
+    return _seen(await _aidentity_from_uid(device_uid))
+
+
+def device_from_query_string(query_string):
+    """Same as device_from_request, for the query string of a WebSocket connection"""
+    params = parse_qs(query_string.decode())
+    if params.get(QUERY_PARAM):
+        return _seen(read_device_token(params[QUERY_PARAM][0]))
+    if params.get('device_uid'):
+        return _seen(_identity_from_uid(params['device_uid'][0]))
+    return None
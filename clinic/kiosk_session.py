@@ -0,0 +1,164 @@
+"""
+Kiosk session state shared by the active-patient endpoint and KioskOrderConsumer
+
+Each device has a session version stored in the cache under its id. The
+snapshot (the active-patient response) is cached per version and the
+version doubles as the ETag, so a poll with a matching If-None-Match is
+answered without touching the database. Callers resolve the device first
+(clinic.device_tokens), so only devices that exist get cache keys.
+
+Whenever something shown in the snapshot changes, session_changed(device)
+bumps the version after commit and publishes session_changed to the kiosk
+group, and the consumer pushes the new snapshot to the iPad.
+
+The a-prefixed functions are the async versions used by the async kiosk views.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from common.outbox import publish
+from orders.groups import device_group
+from .models import Device, PatientAssignment
+
+
+VERSION_KEY = 'kiosk_session:version:{device_id}'
+SNAPSHOT_KEY = 'kiosk_session:snapshot:{device_id}:{version}'
+VERSION_TIMEOUT = 24 * 60 * 60  # 1 day, an expired version restarts from the clock
+SNAPSHOT_TIMEOUT = 60 * 60  # 1 hour, old versions simply expire
+
+
+def _initial_version():
+    # Time based, so a cache flush never hands out a version a client already has
+    return time.time_ns() // 1000
+
+
+def get_session_version(device_id):
+    """Current session version of a device"""
+    key = VERSION_KEY.format(device_id=device_id)
+    version = cache.get(key)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(key, version, VERSION_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_session_version(device_id):
+    key = VERSION_KEY.format(device_id=device_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = _initial_version()
+        if not await cache.aadd(key, version, VERSION_TIMEOUT):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_session_version(device_id):
+    """Invalidate the cached snapshot of a device"""
+    key = VERSION_KEY.format(device_id=device_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, VERSION_TIMEOUT)
+        return version
+
+
+def session_etag(version):
+    return f'"kiosk-session-{version}"'
+
+
+def build_session_snapshot(device_id):
+    """
+    Build the active-patient payload of a device
+    Returns (status_code, payload); raises Device.DoesNotExist for unknown or inactive devices.
+    """
+    device = Device.objects.select_related('room').get(pk=device_id, is_active=True)
+    return _session_payload(device, _active_assignment(device).first())
+
+
+async def abuild_session_snapshot(device_id):
+    """Async build_session_snapshot (async ORM)"""
+    device = await Device.objects.select_related('room').aget(pk=device_id, is_active=True)
+    return _session_payload(device, await _active_assignment(device).afirst())
+
+
+def _active_assignment(device):
+    return PatientAssignment.objects.filter(
+        device=device,
+        is_active=True
+    ).select_related('patient', 'room', 'staff')
+
+
+def _session_payload(device, assignment):
+    if not assignment:
+        return 404, {
+            'error': 'No active patient assigned to this device',
+            'device_uid': device.device_uid,
+            'device_type': device.get_device_type_display(),
+            'room_code': device.room.code if device.room else None
+        }
+
+    return 200, {
+        'success': True,
+        'device_uid': device.device_uid,
+        'device_type': device.get_device_type_display(),
+        'patient': {
+            'id': assignment.patient.id,
+            'full_name': assignment.patient.full_name,
+            'phone': assignment.patient.phone_e164,
+        },
+        'room': {
+            'code': assignment.room.code,
+            'floor': assignment.room.floor
+        },
+        'staff': {
+            'full_name': assignment.staff.full_name,
+            'email': assignment.staff.email,
+        },
+        'id': assignment.id,
+        'assignment_id': assignment.id,
+        'started_at': assignment.started_at.isoformat(),
+        'order_limits': assignment.order_limits or {},
+        'survey_enabled': assignment.survey_enabled,
+        'survey_enabled_at': assignment.survey_enabled_at.isoformat() if assignment.survey_enabled_at else None,
+        'can_patient_order': assignment.can_patient_order,
+    }
+
+
+def get_session_snapshot(device_id):
+    """
+    Cached snapshot of a device
+    Returns (version, status_code, payload); raises Device.DoesNotExist.
+    """
+    version = get_session_version(device_id)
+    key = SNAPSHOT_KEY.format(device_id=device_id, version=version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_session_snapshot(device_id)
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    status_code, payload = snapshot
+    return version, status_code, payload
+
+
+async def aget_session_snapshot(device_id):
+    version = await aget_session_version(device_id)
+    key = SNAPSHOT_KEY.format(device_id=device_id, version=version)
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        snapshot = await abuild_session_snapshot(device_id)
+        await cache.aset(key, snapshot, SNAPSHOT_TIMEOUT)
+    status_code, payload = snapshot
+    return version, status_code, payload
+
+
+def session_changed(device):
+    """
+    Invalidate the snapshot of a device and notify its kiosk
+    Call inside the transaction that changed the session.
+    """
+    device_id = device.id
+    transaction.on_commit(lambda: bump_session_version(device_id))
+    publish(device_group(device.id), {'type': 'session_changed'})
@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0007_patientassignment_survey_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='tokens_revoked_at',
+            field=models.DateTimeField(blank=True, help_text='Device tokens issued before this time are rejected', null=True, verbose_name='tokens revoked at'),
+        ),
+    ]
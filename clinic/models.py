@@ -139,6 +139,12 @@ class Device(models.Model):
         blank=True,
         help_text=_('Last time this device was seen online')
     )
+    tokens_revoked_at = models.DateTimeField(
+        _('tokens revoked at'),
+        null=True,
+        blank=True,
+        help_text=_('Device tokens issued before this time are rejected')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -0,0 +1,110 @@
+"""
+Write-behind device presence (Device.last_seen_at)
+
+Every kiosk request that identifies its device (clinic.device_tokens) and
+every message on the kiosk socket (pings included) records the device as
+seen in a per-process buffer; nothing is written during the request.
+
+Under ASGI (daphne) a flusher task on the server event loop, started by
+PresenceFlusherMiddleware, writes the buffer every
+DEVICE_PRESENCE_FLUSH_INTERVAL seconds with one UPDATE for all the devices
+seen since the last flush. The UPDATE sends no signals and leaves
+updated_at alone. Processes without the flusher (management commands,
+shells, tests) keep buffering until flush() is called.
+"""
+import asyncio
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import Device
+
+
+# Devices per UPDATE statement, keeps the CASE (and its parameters) bounded
+FLUSH_CHUNK_SIZE = 500
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class DevicePresence:
+    """
+    Last time each device was seen in this process, not written yet
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = {}  # device_id -> datetime
+        self._loop = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    def seen(self, device_id):
+        """Record that the device is online (thread safe, no query)"""
+        with self._lock:
+            self._seen[device_id] = timezone.now()
+
+    def flush(self):
+        """Write the buffered last_seen_at values, returns the number of devices"""
+        with self._lock:
+            seen, self._seen = self._seen, {}
+        if not seen:
+            return 0
+
+        try:
+            items = list(seen.items())
+            for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+                chunk = items[start:start + FLUSH_CHUNK_SIZE]
+                Device.objects.filter(pk__in=[device_id for device_id, _ in chunk]).update(
+                    last_seen_at=Case(
+                        *[When(pk=device_id, then=Value(seen_at)) for device_id, seen_at in chunk],
+                        output_field=DateTimeField()
+                    )
+                )
+        except Exception:
+            # Keep the values for the next flush, unless the device was seen again meanwhile
+            with self._lock:
+                for device_id, seen_at in seen.items():
+                    self._seen.setdefault(device_id, seen_at)
+            raise
+        return len(seen)
+
+    def attach(self, loop):
+        """Run the flusher as a task on an existing event loop (must be called from that loop)"""
+        with self._lock:
+            if not self.running:
+                self._loop = loop
+                self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        interval = _setting('DEVICE_PRESENCE_FLUSH_INTERVAL', 5)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await database_sync_to_async(self.flush)()
+            except Exception as e:
+                print(f'Device presence flush failed: {e}')
+
+
+device_presence = DevicePresence()
+
+
+class PresenceFlusherMiddleware:
+    """
+    ASGI middleware that starts the presence flusher on the server event loop
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not device_presence.running:
+            device_presence.attach(asyncio.get_running_loop())
+        return await self.app(scope, receive, send)
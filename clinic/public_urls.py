@@ -5,4 +5,6 @@ app_name = 'clinic_public'
 
 urlpatterns = [
     path('kiosk/device/<str:device_uid>/active-patient/', views.get_active_patient_by_device, name='kiosk-active-patient'),
+    # Async version (same JSON), served on the event loop under ASGI
+    path('async/kiosk/device/<str:device_uid>/active-patient/', views.get_active_patient_by_device_async, name='async-kiosk-active-patient'),
 ]
@@ -1,3 +1,5 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from .models import Room, Patient, Device, PatientAssignment
 
@@ -20,23 +22,58 @@ class PatientDetailSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
     
+
+    @staticmethod
+    def annotate(queryset):
+        """
+        Add the counts and last visit as subqueries, so a list of patients
+        is read with one query instead of four more per patient
+        """
+        from orders.models import Order
+        from feedbacks.models import Feedback
+
+        def count(related):
+            return Coalesce(Subquery(
+                related.objects.filter(patient=OuterRef('pk')).order_by().values('patient').annotate(
+                    n=Count('id')
+                ).values('n')
+            ), 0)
+
+        return queryset.annotate(
+            order_count=count(Order),
+            feedback_count=count(Feedback),
+            assignment_count=count(PatientAssignment),
+            last_started_at=Subquery(
+                PatientAssignment.objects.filter(patient=OuterRef('pk')).order_by('-started_at').values('started_at')[:1]
+            )
+        )
+
     def get_total_orders(self, obj):
         """Get total orders count for this patient"""
+        if hasattr(obj, 'order_count'):
+            return obj.order_count
         return obj.orders.count()
     
     def get_total_feedbacks(self, obj):
         """Get total feedbacks count for this patient"""
+        if hasattr(obj, 'feedback_count'):
+            return obj.feedback_count
         return obj.feedbacks.count()
     
     def get_assignments_count(self, obj):
         """Get total assignments count"""
+        if hasattr(obj, 'assignment_count'):
+            return obj.assignment_count
         return obj.assignments.count()
     
     def get_last_visit(self, obj):
         """Get last assignment date"""
-        last_assignment = obj.assignments.order_by('-started_at').first()
-        if last_assignment:
-            return last_assignment.started_at.isoformat()
+        if hasattr(obj, 'last_started_at'):
+            last_started_at = obj.last_started_at
+        else:
+            last_started_at = obj.assignments.order_by('-started_at').values_list('started_at', flat=True).first()
+        if last_started_at:
+            return last_started_at.isoformat()
         return None
 
 
@@ -114,10 +151,11 @@ class DeviceSerializer(serializers.ModelSerializer):
             'assigned_staff_details',
             'is_active',
             'last_seen_at',
+            'tokens_revoked_at',
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'tokens_revoked_at', 'created_at', 'updated_at']
 
     def get_assigned_staff_details(self, obj):
         """Get details of assigned staff members"""
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from orders.groups import refresh_staff_groups
+from .device_tokens import revocation_changed
+from .kiosk_session import session_changed
+from .models import Room, Patient, Device, PatientAssignment
+
+
+@receiver(m2m_changed, sender=Device.assigned_staff.through)
+def device_staff_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Refresh the WebSocket groups of staff added to or removed from a device
+    """
+    if action == 'pre_clear':
+        # pk_set is not provided on clear, remember who was there
+        if reverse:
+            instance._cleared_staff_ids = [instance.id]
+        else:
+            instance._cleared_staff_ids = list(instance.assigned_staff.values_list('id', flat=True))
+        return
+
+    if action == 'post_clear':
+        refresh_staff_groups(getattr(instance, '_cleared_staff_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        refresh_staff_groups([instance.id] if reverse else pk_set)
+
+
+@receiver(post_save, sender=PatientAssignment)
+def patient_assignment_saved(sender, instance, created, update_fields, **kwargs):
+    """
+    Let the attending staff join the device group as soon as a patient is assigned.
+    Sockets leave the group lazily, when they receive patient_assignment_ended.
+    Every change is part of the kiosk session snapshot.
+    """
+    if instance.staff_id and instance.is_active and (created or not update_fields or 'is_active' in update_fields):
+        refresh_staff_groups([instance.staff_id])
+
+    if instance.device_id:
+        session_changed(instance.device)
+
+
+@receiver(post_delete, sender=PatientAssignment)
+def patient_assignment_deleted(sender, instance, **kwargs):
+    if instance.device_id:
+        session_changed(instance.device)
+
+
+@receiver(post_save, sender=Device)
+def device_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        # Not on the cached list of valid devices yet
+        revocation_changed()
+        return
+    # Heartbeats only touch last_seen_at, which the kiosk does not show
+    if update_fields and set(update_fields) <= {'last_seen_at', 'updated_at'}:
+        return
+    session_changed(instance)
+    # Deactivation and tokens_revoked_at are part of the list of valid devices
+    revocation_changed()
+
+
+@receiver(post_delete, sender=Device)
+def device_deleted(sender, instance, **kwargs):
+    revocation_changed()
+
+
+def _sessions_changed(devices):
+    for device in devices.distinct():
+        session_changed(device)
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created, **kwargs):
+    """Patient name and phone are shown on the kiosk"""
+    if not created:
+        _sessions_changed(Device.objects.filter(
+            patient_assignments__patient=instance,
+            patient_assignments__is_active=True
+        ))
+
+
+@receiver(post_save, sender=Room)
+def room_saved(sender, instance, created, **kwargs):
+    """Room code and floor are shown on the kiosk"""
+    if not created:
+        _sessions_changed(Device.objects.filter(
+            Q(room=instance) |
+            Q(patient_assignments__room=instance, patient_assignments__is_active=True)
+        ))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def staff_saved(sender, instance, created, update_fields, **kwargs):
+    """Staff name and email are shown on the kiosk (logins only touch last_login)"""
+    if created or (update_fields and not {'full_name', 'email'} & set(update_fields)):
+        return
+    _sessions_changed(Device.objects.filter(
+        patient_assignments__staff=instance,
+        patient_assignments__is_active=True
+    ))
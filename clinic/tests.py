@@ -1,3 +1,197 @@
+from unittest import mock
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User, Role, UserRole
+from orders.consumers import KioskOrderConsumer
+from .device_tokens import issue_device_token, valid_devices
+from .presence import device_presence
+from .models import Room, Device, Patient, PatientAssignment
+
+
+class ActivePatientETagTests(TestCase):
+    """
+    The kiosk active-patient endpoint answers polls with 304 until the session changes
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.staff = User.objects.create_user(email='staff@example.com', password='staff123', full_name='Staff')
+        room = Room.objects.create(code='101')
+        self.device = Device.objects.create(device_uid='IPAD-01', room=room)
+        self.assignment = PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient', phone_e164='+15550000001'),
+            staff=self.staff,
+            device=self.device,
+            room=room
+        )
+        self.url = reverse('clinic_public:kiosk-active-patient', args=['IPAD-01'])
+        self.client.credentials(HTTP_X_DEVICE_TOKEN=issue_device_token(self.device))
+
+    def test_matching_etag_returns_304_without_queries(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assignment_id'], self.assignment.id)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_unknown_device_writes_no_cache_key(self):
+        self.client.credentials()
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add, mock.patch.object(cache, 'set', wraps=cache.set) as set_:
+            response = self.client.get(reverse('clinic_public:kiosk-active-patient', args=['NO-SUCH-IPAD']))
+        self.assertEqual(response.status_code, 404)
+        keys = [call.args[0] for call in add.call_args_list + set_.call_args_list]
+        self.assertFalse([key for key in keys if key.startswith('kiosk_session')])
+
+    def test_session_change_issues_new_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assignment.end_care()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class DeviceTokenTests(TestCase):
+    """
+    Enrolled kiosks are identified by their signed token without a device
+    query, until the device is deactivated or its tokens are revoked
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.staff = User.objects.create_user(email='staff@example.com', password='staff123', full_name='Staff')
+        UserRole.objects.create(user=self.staff, role=Role.objects.get_or_create(name=Role.STAFF)[0])
+        room = Room.objects.create(code='101')
+        self.device = Device.objects.create(device_uid='IPAD-01', room=room)
+        self.other = Device.objects.create(device_uid='IPAD-02', room=room)
+        PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient', phone_e164='+15550000001'),
+            staff=self.staff,
+            device=self.device,
+            room=room
+        )
+        self.token = self.enroll(self.device)
+        self.active_url = reverse('public-order-active')
+
+    def enroll(self, device):
+        self.client.force_authenticate(self.staff)
+        response = self.client.post(reverse('clinic:device-enroll', args=[device.id]))
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, 200)
+        return response.data['device_token']
+
+    def test_token_needs_no_device_query(self):
+        valid_devices()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=self.token)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.active_url, {'device_uid': 'IPAD-01'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(
+            reverse('clinic_public:kiosk-active-patient', args=['IPAD-02']),
+            HTTP_X_DEVICE_TOKEN=self.token
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_and_revoked_tokens_are_rejected(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.staff)
+            self.client.post(reverse('clinic:device-revoke-tokens', args=[self.device.id]))
+            self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=self.token).status_code, 401)
+
+        token = self.enroll(self.device)
+        self.assertEqual(self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=token).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.is_active = False
+            self.device.save()
+        self.assertEqual(self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=token).status_code, 401)
+
+    def test_deleted_device_token_is_rejected(self):
+        other_token = self.enroll(self.other)
+        self.assertEqual(self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=other_token).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        self.assertEqual(self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=other_token).status_code, 401)
+        # Also once the cached list is evicted and rebuilt
+        cache.clear()
+        self.assertEqual(self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=other_token).status_code, 401)
+
+    def test_new_device_token_is_accepted(self):
+        valid_devices()
+        with self.captureOnCommitCallbacks(execute=True):
+            device = Device.objects.create(device_uid='IPAD-03', room=self.device.room)
+        self.assertEqual(self.client.get(self.active_url, HTTP_X_DEVICE_TOKEN=self.enroll(device)).status_code, 200)
+
+    def test_http_endpoints_ignore_query_string_token(self):
+        response = self.client.get(self.active_url, {'device_token': self.token})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_kiosk_socket_accepts_token(self):
+        communicator = WebsocketCommunicator(KioskOrderConsumer.as_asgi(), f'/ws/kiosk/orders/?device_token={self.token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        message = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(message['session']['device_uid'], 'IPAD-01')
+        await communicator.disconnect()
+
+        communicator = WebsocketCommunicator(KioskOrderConsumer.as_asgi(), '/ws/kiosk/orders/?device_token=forged')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+
+class DevicePresenceTests(TestCase):
+    """
+    Kiosk requests and socket pings are buffered and written in one UPDATE
+    """
+
+    def setUp(self):
+        cache.clear()
+        device_presence.flush()
+        self.client = APIClient()
+        room = Room.objects.create(code='101')
+        self.device = Device.objects.create(device_uid='IPAD-01', room=room)
+        self.other = Device.objects.create(device_uid='IPAD-02', room=room)
+
+    async def test_socket_ping_is_a_heartbeat(self):
+        token = await database_sync_to_async(issue_device_token)(self.device)
+        communicator = WebsocketCommunicator(KioskOrderConsumer.as_asgi(), f'/ws/kiosk/orders/?device_token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from(timeout=2)
+        await communicator.send_json_to({'type': 'ping'})
+        self.assertEqual(await communicator.receive_json_from(timeout=2), {'type': 'pong'})
+        await communicator.disconnect()
+
+        self.assertEqual(await database_sync_to_async(device_presence.flush)(), 1)
+        await self.device.arefresh_from_db()
+        self.assertIsNotNone(self.device.last_seen_at)
+
+    def test_requests_do_not_write_and_flush_is_one_update(self):
+        url = reverse('public-order-active')
+        self.client.get(url, HTTP_X_DEVICE_TOKEN=issue_device_token(self.device))
+        self.client.get(url, {'device_uid': 'IPAD-02'})
+        self.assertFalse(Device.objects.filter(last_seen_at__isnull=False).exists())
 
-# Create your tests here.
+        with self.assertNumQueries(1):
+            self.assertEqual(device_presence.flush(), 2)
+        self.assertEqual(Device.objects.filter(last_seen_at__isnull=False).count(), 2)
+        self.assertEqual(Device.objects.get(pk=self.device.pk).updated_at, self.device.updated_at)
@@ -4,11 +4,19 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from accounts.permissions import IsStaffOrAdmin
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Count, Avg
+from django.views.decorators.http import require_GET
+from common.outbox import publish
+from common.responses import JSONResponse, not_modified
+from orders.groups import device_group, publish_to_staff
 
 from .models import Room, Patient, Device, PatientAssignment
+from .device_tokens import DeviceTokenError, adevice_for_uid, device_for_uid, issue_device_token
+from .kiosk_session import (
+    aget_session_snapshot, aget_session_version, get_session_snapshot, get_session_version, session_etag
+)
 from .serializers import (
     RoomSerializer,
     PatientSerializer,
@@ -68,6 +76,15 @@ class PatientViewSet(viewsets.ModelViewSet):
             return PatientDetailSerializer
         return PatientSerializer
 
+    def get_queryset(self):
+        """
+        Patients read with PatientDetailSerializer get their counts in the same query
+        """
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve', 'full_details']:
+            queryset = PatientDetailSerializer.annotate(queryset)
+        return queryset
+
     @action(detail=True, methods=['get'])
     def orders(self, request, pk=None):
         """
@@ -77,7 +94,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         from orders.serializers import OrderSerializer
         
         patient = self.get_object()
-        orders = patient.orders.all().prefetch_related('items', 'items__product').order_by('-placed_at')
+        orders = OrderSerializer.prefetch(patient.orders.all()).order_by('-placed_at')
         
         serializer = OrderSerializer(orders, many=True)
         return Response({
@@ -136,7 +153,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         patient = self.get_object()
         
         # Get orders
-        orders = patient.orders.all().prefetch_related('items', 'items__product').order_by('-placed_at')
+        orders = OrderSerializer.prefetch(patient.orders.all()).order_by('-placed_at')
         
         # Get feedbacks
         feedbacks = patient.feedbacks.all().select_related(
@@ -148,20 +165,17 @@ class PatientViewSet(viewsets.ModelViewSet):
             'staff', 'device', 'room'
         ).order_by('-started_at')
         
-        # Calculate statistics
-        total_orders = orders.count()
-        total_feedbacks = feedbacks.count()
-        
-        # Average ratings from feedbacks
-        avg_staff_rating = feedbacks.aggregate(avg=Avg('staff_rating'))['avg'] or 0
-        avg_stay_rating = feedbacks.aggregate(avg=Avg('stay_rating'))['avg'] or 0
+        # Calculate statistics (counts annotated by get_queryset)
+        ratings = feedbacks.aggregate(avg_staff=Avg('staff_rating'), avg_stay=Avg('stay_rating'))
+        avg_staff_rating = ratings['avg_staff'] or 0
+        avg_stay_rating = ratings['avg_stay'] or 0
         
         return Response({
             'patient': PatientDetailSerializer(patient).data,
             'statistics': {
-                'total_orders': total_orders,
-                'total_feedbacks': total_feedbacks,
-                'total_assignments': assignments.count(),
+                'total_orders': patient.order_count,
+                'total_feedbacks': patient.feedback_count,
+                'total_assignments': patient.assignment_count,
                 'avg_staff_rating': round(avg_staff_rating, 2),
                 'avg_stay_rating': round(avg_stay_rating, 2),
             },
@@ -183,7 +197,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
     partial_update: Partially update a device
     destroy: Delete a device
     """
-    queryset = Device.objects.all()
+    queryset = Device.objects.select_related('room').prefetch_related('assigned_staff')
     serializer_class = DeviceSerializer
     permission_classes = [IsStaffOrAdmin]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -204,6 +218,40 @@ class DeviceViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    @action(detail=True, methods=['post'])
+    def enroll(self, request, pk=None):
+        """
+        Issue a signed device token for the kiosk
+        POST /api/clinic/devices/{id}/enroll/
+        The kiosk sends it in the X-Device-Token header (device_token query
+        parameter for the WebSocket) instead of its device_uid.
+        """
+        device = self.get_object()
+        if not device.is_active:
+            return Response(
+                {'detail': 'Cannot enroll an inactive device'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'device_uid': device.device_uid,
+            'device_token': issue_device_token(device),
+            'expires_in': settings.DEVICE_TOKEN_MAX_AGE,
+        })
+
+    @action(detail=True, methods=['post'])
+    def revoke_tokens(self, request, pk=None):
+        """
+        Reject every token issued to the device so far (lost or replaced iPad)
+        POST /api/clinic/devices/{id}/revoke_tokens/
+        """
+        from django.utils import timezone
+
+        device = self.get_object()
+        device.tokens_revoked_at = timezone.now()
+        device.save(update_fields=['tokens_revoked_at', 'updated_at'])
+        return Response(self.get_serializer(device).data)
+
 
 class PatientAssignmentViewSet(viewsets.ModelViewSet):
     """
@@ -237,14 +285,13 @@ class PatientAssignmentViewSet(viewsets.ModelViewSet):
         """
         Create patient assignment and broadcast via WebSocket
         """
-        assignment = serializer.save()
+        with transaction.atomic():
+            assignment = serializer.save()
 
-        # Broadcast new patient assignment to kiosk
-        try:
+            # Broadcast new patient assignment to kiosk (sent after commit)
             if assignment.device:
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    f'device_{assignment.device.id}',
+                publish(
+                    device_group(assignment.device.id),
                     {
                         'type': 'patient_assigned',
                         'assignment_id': assignment.id,
@@ -254,9 +301,6 @@ class PatientAssignmentViewSet(viewsets.ModelViewSet):
                         'started_at': assignment.started_at.isoformat(),
                     }
                 )
-        except Exception as ws_error:
-            # Log but don't fail the request
-            print(f'WebSocket broadcast failed: {ws_error}')
 
     def get_queryset(self):
         """
@@ -319,40 +363,32 @@ class PatientAssignmentViewSet(viewsets.ModelViewSet):
         # Store device info before ending care
         device_id = assignment.device.id if assignment.device else None
 
-        # End the care
-        assignment.end_care()
+        with transaction.atomic():
+            # End the care
+            assignment.end_care()
 
-        # Broadcast session ended to kiosk
-        try:
+            # Broadcast session ended to kiosk (sent after commit)
             if device_id:
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    f'device_{device_id}',
+                publish(
+                    device_group(device_id),
                     {
                         'type': 'session_ended',
                         'assignment_id': assignment.id,
                         'ended_at': assignment.ended_at.isoformat(),
                     }
                 )
-        except Exception as ws_error:
-            # Log but don't fail the request
-            print(f'WebSocket broadcast failed: {ws_error}')
-
-        # Broadcast session ended to staff via WebSocket
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                'staff_orders',
+
+            # Broadcast session ended to the staff of this device and admins
+            publish_to_staff(
                 {
                     'type': 'patient_assignment_ended',
                     'assignment_id': assignment.id,
                     'staff_id': assignment.staff.id if assignment.staff else None,
                     'ended_at': assignment.ended_at.isoformat(),
-                }
+                },
+                device_id=device_id,
+                staff_id=assignment.staff_id
             )
-        except Exception as ws_error:
-            # Log but don't fail the request
-            print(f'WebSocket broadcast to staff failed: {ws_error}')
 
         serializer = self.get_serializer(assignment)
         return Response(serializer.data)
@@ -407,16 +443,15 @@ class PatientAssignmentViewSet(viewsets.ModelViewSet):
                     )
 
         # Update limits and reactivate patient orders
-        assignment.order_limits = order_limits
-        assignment.can_patient_order = True  # Reactivate patient orders when limits are updated
-        assignment.save(update_fields=['order_limits', 'can_patient_order', 'updated_at'])
+        with transaction.atomic():
+            assignment.order_limits = order_limits
+            assignment.can_patient_order = True  # Reactivate patient orders when limits are updated
+            assignment.save(update_fields=['order_limits', 'can_patient_order', 'updated_at'])
 
-        # Broadcast limits update to kiosk
-        try:
+            # Broadcast limits update to kiosk (sent after commit)
             if assignment.device:
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    f'device_{assignment.device.id}',
+                publish(
+                    device_group(assignment.device.id),
                     {
                         'type': 'limits_updated',
                         'assignment_id': assignment.id,
@@ -424,9 +459,6 @@ class PatientAssignmentViewSet(viewsets.ModelViewSet):
                         'can_patient_order': True,
                     }
                 )
-        except Exception as ws_error:
-            # Log but don't fail the request
-            print(f'WebSocket broadcast failed: {ws_error}')
 
         serializer = self.get_serializer(assignment)
         return Response(serializer.data)
@@ -457,17 +489,16 @@ class PatientAssignmentViewSet(viewsets.ModelViewSet):
             )
 
         # Enable survey and block patient orders
-        assignment.survey_enabled = True
-        assignment.survey_enabled_at = timezone.now()
-        assignment.can_patient_order = False  # Block patient from creating new orders
-        assignment.save(update_fields=['survey_enabled', 'survey_enabled_at', 'can_patient_order', 'updated_at'])
+        with transaction.atomic():
+            assignment.survey_enabled = True
+            assignment.survey_enabled_at = timezone.now()
+            assignment.can_patient_order = False  # Block patient from creating new orders
+            assignment.save(update_fields=['survey_enabled', 'survey_enabled_at', 'can_patient_order', 'updated_at'])
 
-        # Broadcast survey enabled to kiosk
-        try:
+            # Broadcast survey enabled to kiosk (sent after commit)
             if assignment.device:
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    f'device_{assignment.device.id}',
+                publish(
+                    device_group(assignment.device.id),
                     {
                         'type': 'survey_enabled',
                         'assignment_id': assignment.id,
@@ -475,9 +506,6 @@ class PatientAssignmentViewSet(viewsets.ModelViewSet):
                         'survey_enabled': True,
                     }
                 )
-        except Exception as ws_error:
-            # Log but don't fail the request
-            print(f'WebSocket broadcast failed: {ws_error}')
 
         serializer = self.get_serializer(assignment)
         return Response(serializer.data)
@@ -493,52 +521,25 @@ def get_active_patient_by_device(request, device_uid):
     GET /api/public/kiosk/device/{device_uid}/active-patient/
 
     Returns the patient currently assigned to this device.
+    Enrolled kiosks send their device token (clinic.device_tokens), which must
+    belong to this device.
+    Responses carry an ETag; a request with a device token and a matching
+    If-None-Match gets a 304 without any database query (see clinic.kiosk_session).
     """
     try:
-        # Get the device
-        device = Device.objects.get(device_uid=device_uid, is_active=True)
+        device = device_for_uid(request, device_uid)
 
-        # Get the active patient assignment for this device
-        assignment = PatientAssignment.objects.filter(
-            device=device,
-            is_active=True
-        ).select_related('patient', 'room', 'staff').first()
+        response = not_modified(request, session_etag(get_session_version(device.device_id)))
+        if response:
+            return response
 
-        if not assignment:
-            return Response({
-                'error': 'No active patient assigned to this device',
-                'device_uid': device_uid,
-                'device_type': device.get_device_type_display(),
-                'room_code': device.room.code if device.room else None
-            }, status=status.HTTP_404_NOT_FOUND)
-
-        # Return patient and assignment info
-        return Response({
-            'success': True,
-            'device_uid': device_uid,
-            'device_type': device.get_device_type_display(),
-            'patient': {
-                'id': assignment.patient.id,
-                'full_name': assignment.patient.full_name,
-                'phone': assignment.patient.phone_e164,
-            },
-            'room': {
-                'code': assignment.room.code,
-                'floor': assignment.room.floor
-            },
-            'staff': {
-                'full_name': assignment.staff.full_name,
-                'email': assignment.staff.email,
-            },
-            'id': assignment.id,
-            'assignment_id': assignment.id,
-            'started_at': assignment.started_at.isoformat(),
-            'order_limits': assignment.order_limits or {},
-            'survey_enabled': assignment.survey_enabled,
-            'survey_enabled_at': assignment.survey_enabled_at.isoformat() if assignment.survey_enabled_at else None,
-            'can_patient_order': assignment.can_patient_order,
-        }, status=status.HTTP_200_OK)
+        version, status_code, payload = get_session_snapshot(device.device_id)
+        return _session_response(Response(payload, status=status_code), version)
 
+    except DeviceTokenError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_401_UNAUTHORIZED)
     except Device.DoesNotExist:
         return Response({
             'error': 'Device not found or inactive',
@@ -548,3 +549,41 @@ def get_active_patient_by_device(request, device_uid):
         return Response({
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _session_response(response, version):
+    response['ETag'] = session_etag(version)
+    # Clients may keep the response but must revalidate it on every poll
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@require_GET
+async def get_active_patient_by_device_async(request, device_uid):
+    """
+    Async get_active_patient_by_device (same JSON), served on the event loop under ASGI
+    GET /api/public/async/kiosk/device/{device_uid}/active-patient/
+    """
+    try:
+        device = await adevice_for_uid(request, device_uid)
+
+        response = not_modified(request, session_etag(await aget_session_version(device.device_id)))
+        if response:
+            return response
+
+        version, status_code, payload = await aget_session_snapshot(device.device_id)
+        return _session_response(JSONResponse(payload, status=status_code), version)
+
+    except DeviceTokenError as e:
+        return JSONResponse({
+            'error': str(e)
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    except Device.DoesNotExist:
+        return JSONResponse({
+            'error': 'Device not found or inactive',
+            'device_uid': device_uid
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return JSONResponse({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -19,6 +19,8 @@ django_asgi_app = get_asgi_application()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import OriginValidator
 from orders.routing import websocket_urlpatterns
+from common.outbox import OutboxDispatcherMiddleware
+from clinic.presence import PresenceFlusherMiddleware
 from django.conf import settings
 
 # Custom origin validator that uses WS_ALLOWED_ORIGINS from settings
@@ -26,9 +28,11 @@ class CustomOriginValidator(OriginValidator):
     def __init__(self, application):
         super().__init__(application, settings.WS_ALLOWED_ORIGINS)
 
-application = ProtocolTypeRouter({
+# The outbox dispatcher and the device presence flusher run on the server
+# event loop, next to the consumers
+application = PresenceFlusherMiddleware(OutboxDispatcherMiddleware(ProtocolTypeRouter({
     'http': django_asgi_app,
     'websocket': CustomOriginValidator(
         URLRouter(websocket_urlpatterns)
     ),
-})
+})))
@@ -71,8 +71,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'common.timing.RequestTimingMiddleware',  # Server-Timing header and endpoint stats
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Whitenoise for static files
+    'common.middleware.AsyncWhiteNoiseMiddleware',  # Whitenoise for static files (async capable)
     'corsheaders.middleware.CorsMiddleware',  # Must be before CommonMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -240,7 +241,7 @@ AUTHENTICATION_BACKENDS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -279,8 +280,17 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 
     'JTI_CLAIM': 'jti',
+
+    # Refreshed access tokens get current role claims (accounts.roles)
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.tokens.RoleTokenRefreshSerializer',
 }
 
+# Users whose roles are cached per process, for requests without role claims
+ROLE_CACHE_SIZE = int(os.getenv('ROLE_CACHE_SIZE', '1024'))
+
+# Users are read from a copy cached this many seconds (accounts.claims)
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))
+
 
 # CORS Configuration
 # https://github.com/adamchainz/django-cors-headers
@@ -311,18 +321,141 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-device-token',
 ]
 
 
+# Inventory Configuration
+# 'locking': lock balance rows with select_for_update() before reserving
+# 'conditional': reserve with a single guarded UPDATE, without row locks
+INVENTORY_RESERVATION_MODE = os.getenv('INVENTORY_RESERVATION_MODE', 'locking')
+
+
 # Django Channels Configuration
 # https://channels.readthedocs.io/en/stable/
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
+# Backend is chosen by CHANNEL_LAYERS_BACKEND:
+# 'memory': single process only (groups are not shared between daphne workers)
+# 'redis': channels_redis core layer, honours capacity and expiry settings
+# 'redis-pubsub': channels_redis pub/sub layer (no capacity/expiry, lower latency)
+# Redis is opt-in: defaults to 'redis' when REDIS_URL is set, otherwise 'memory'.
+# CHANNEL_LAYERS_HOST/PORT only locate Redis for an explicit 'redis' or 'redis-pubsub'
+# backend without REDIS_URL
+REDIS_URL = os.getenv('REDIS_URL')
+CHANNEL_LAYERS_HOST = os.getenv('CHANNEL_LAYERS_HOST')
+CHANNEL_LAYERS_PORT = int(os.getenv('CHANNEL_LAYERS_PORT', '6379'))
+CHANNEL_LAYERS_BACKEND = os.getenv('CHANNEL_LAYERS_BACKEND', 'redis' if REDIS_URL else 'memory')
+
+# Messages buffered per channel before ChannelFull, seconds a message may wait,
+# and seconds a channel stays in a group without being re-added
+CHANNEL_LAYERS_CAPACITY = int(os.getenv('CHANNEL_LAYERS_CAPACITY', '100'))
+CHANNEL_LAYERS_EXPIRY = int(os.getenv('CHANNEL_LAYERS_EXPIRY', '60'))
+CHANNEL_LAYERS_GROUP_EXPIRY = int(os.getenv('CHANNEL_LAYERS_GROUP_EXPIRY', '86400'))
+# Per-channel capacity overrides, e.g. "specific.*=500,http.request=200"
+CHANNEL_LAYERS_CHANNEL_CAPACITY = {
+    pattern.strip(): int(capacity)
+    for pattern, capacity in (
+        entry.split('=') for entry in os.getenv('CHANNEL_LAYERS_CHANNEL_CAPACITY', '').split(',') if entry.strip()
+    )
 }
 
+if CHANNEL_LAYERS_BACKEND == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {
+                'capacity': CHANNEL_LAYERS_CAPACITY,
+                'expiry': CHANNEL_LAYERS_EXPIRY,
+                'group_expiry': CHANNEL_LAYERS_GROUP_EXPIRY,
+                'channel_capacity': CHANNEL_LAYERS_CHANNEL_CAPACITY,
+            },
+        },
+    }
+elif CHANNEL_LAYERS_BACKEND == 'redis-pubsub':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL or (CHANNEL_LAYERS_HOST or 'localhost', CHANNEL_LAYERS_PORT)],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL or (CHANNEL_LAYERS_HOST or 'localhost', CHANNEL_LAYERS_PORT)],
+                'capacity': CHANNEL_LAYERS_CAPACITY,
+                'expiry': CHANNEL_LAYERS_EXPIRY,
+                'group_expiry': CHANNEL_LAYERS_GROUP_EXPIRY,
+                'channel_capacity': CHANNEL_LAYERS_CHANNEL_CAPACITY,
+            },
+        },
+    }
+
+# Cache Configuration
+# Redis (shared by every worker) when CACHE_URL or REDIS_URL is set; otherwise
+# a per-process local memory cache, which is only correct with a single worker
+CACHE_URL = os.getenv('CACHE_URL') or REDIS_URL
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'clinic',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'clinic-service',
+        }
+    }
+
+# Build request.user from the token claims instead of loading it (accounts.authentication);
+# needs the shared cache, so it is off by default with the local memory cache
+JWT_CLAIMS_AUTH = os.getenv('JWT_CLAIMS_AUTH', 'True' if CACHE_URL else 'False') == 'True'
+
+# Admin dashboard statistics (orders.dashboard_stats), shared through the cache
+DASHBOARD_STATS_TTL = int(os.getenv('DASHBOARD_STATS_TTL', '30'))  # seconds
+DASHBOARD_STATS_STALE_TTL = int(os.getenv('DASHBOARD_STATS_STALE_TTL', '600'))  # seconds
+
+# Request timing (common.timing): Server-Timing header, sampled JSON logs and
+# per-endpoint stats for GET /api/reports/endpoints/
+REQUEST_TIMING_ENABLED = os.getenv('REQUEST_TIMING_ENABLED', 'True') == 'True'
+REQUEST_TIMING_LOG_SAMPLE_RATE = float(os.getenv('REQUEST_TIMING_LOG_SAMPLE_RATE', '0.01'))
+REQUEST_TIMING_SLOW_MS = float(os.getenv('REQUEST_TIMING_SLOW_MS', '1000'))  # always logged
+REQUEST_TIMING_WINDOW = int(os.getenv('REQUEST_TIMING_WINDOW', '200'))  # samples per endpoint and process
+REQUEST_TIMING_FLUSH_INTERVAL = int(os.getenv('REQUEST_TIMING_FLUSH_INTERVAL', '10'))  # seconds
+
+# Signed device tokens of the kiosks (clinic.device_tokens); DEVICE_UID_AUTH
+# still accepts a raw device_uid from kiosks that are not enrolled yet
+DEVICE_TOKEN_MAX_AGE = int(os.getenv('DEVICE_TOKEN_MAX_AGE', str(365 * 24 * 60 * 60)))  # seconds
+DEVICE_UID_AUTH = os.getenv('DEVICE_UID_AUTH', 'True') == 'True'
+
+# Kiosk heartbeats are buffered per process and written to Device.last_seen_at
+# in one UPDATE this often (clinic.presence)
+DEVICE_PRESENCE_FLUSH_INTERVAL = float(os.getenv('DEVICE_PRESENCE_FLUSH_INTERVAL', '5'))  # seconds
+
+# Staff queue delta sync (orders.queue_sync): every sync looks this far behind
+# its cursor to catch orders committed after the previous one
+ORDER_SYNC_OVERLAP = float(os.getenv('ORDER_SYNC_OVERLAP', '5'))  # seconds
+
+# Pre-rendered kiosk menu documents (catalog.menu), defaults to <tmp>/clinic_menu
+MENU_SNAPSHOT_DIR = os.getenv('MENU_SNAPSHOT_DIR')
+
+# WebSocket Outbox Configuration
+# Broadcasts are stored in common.OutboxEvent inside the request transaction
+# and sent to the channel layer after commit by common.outbox
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '2'))  # seconds
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_CLAIM_LEASE = int(os.getenv('OUTBOX_CLAIM_LEASE', '30'))  # seconds a dispatcher has to send a claimed batch
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', '24'))
+
 # WebSocket Configuration
 WS_ALLOWED_ORIGINS = [
     origin.strip()
@@ -1,3 +1,19 @@
 from django.contrib import admin
+from .models import OutboxEvent
 
-# Register your models here.
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'group', 'event_type', 'attempts', 'created_at', 'dispatched_at']
+    list_filter = ['dispatched_at', 'created_at']
+    search_fields = ['group']
+    readonly_fields = ['group', 'payload', 'attempts', 'created_at', 'claimed_until', 'dispatched_at']
+    ordering = ['-id']
+
+    def event_type(self, obj):
+        return obj.payload.get('type')
+    event_type.short_description = 'Type'
+
+    def has_add_permission(self, request):
+        # Events are written by the views that change data
+        return False
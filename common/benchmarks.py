@@ -0,0 +1,309 @@
+"""
+Endpoint benchmark suite
+
+Each scenario sends one kind of request through the full Django stack
+(middleware, JWT authentication, views, serializers) with the test client,
+against whatever the default database holds. run_scenario() fires a number
+of requests from N threads and reports latency percentiles, throughput,
+errors and the queries per request (read from the Server-Timing header of
+common.timing). Used by the run_benchmarks and compare_benchmarks commands.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User, Role, UserRole
+from accounts.tokens import RoleRefreshToken
+from catalog.models import Product
+from clinic.device_tokens import issue_device_token
+from clinic.models import PatientAssignment
+from inventory.models import InventoryBalance
+from orders.models import Order
+from orders.queue_sync import make_cursor
+from orders.services import place_order
+
+
+BENCHMARK_ADMIN_EMAIL = 'benchmark-admin@example.com'
+
+# Synthetic data sizes, passed to generate_synthetic_data
+SCALES = {
+    'small': {'rooms': 20, 'staff': 5, 'patients': 500, 'days': 30, 'orders_per_day': 100},
+    'medium': {'rooms': 50, 'staff': 20, 'patients': 5000, 'days': 90, 'orders_per_day': 500},
+    'large': {'rooms': 100, 'staff': 40, 'patients': 20000, 'days': 365, 'orders_per_day': 3000},
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _queries(response):
+    """Query count reported by RequestTimingMiddleware, None when disabled"""
+    header = response.get('Server-Timing', '')
+    marker = 'desc="'
+    if marker not in header:
+        return None
+    return int(header.split(marker, 1)[1].split(' ', 1)[0])
+
+
+class BenchmarkContext:
+    """
+    Everything the scenarios need from the database: kiosks with an active
+    patient, products, a staff and an admin token, the report date range, a
+    queue sync cursor and pools of open orders for change_status and cancel
+    """
+
+    def __init__(self):
+        assignments = list(PatientAssignment.objects.filter(
+            is_active=True, device__is_active=True, can_patient_order=True
+        ).select_related('device', 'room', 'patient'))
+        if not assignments:
+            raise ValueError('No device with an active patient, generate data first (generate_synthetic_data)')
+        self.assignments = assignments
+        self.device_uids = [assignment.device.device_uid for assignment in assignments]
+        self.device_tokens = {assignment.device.device_uid: issue_device_token(assignment.device) for assignment in assignments}
+        self.product_ids = list(Product.objects.filter(
+            is_active=True, inventory_balance__isnull=False
+        ).values_list('id', flat=True))
+
+        admin, created = User.objects.get_or_create(
+            email=BENCHMARK_ADMIN_EMAIL,
+            defaults={'full_name': 'Benchmark Admin', 'is_staff': True}
+        )
+        if created:
+            admin.set_unusable_password()
+            admin.save(update_fields=['password'])
+        UserRole.objects.get_or_create(user=admin, role=Role.objects.get_or_create(name=Role.ADMIN)[0])
+        staff = next((assignment.staff for assignment in assignments if assignment.staff_id), admin)
+        self.admin_token = str(RoleRefreshToken.for_user(admin).access_token)
+        self.staff_token = str(RoleRefreshToken.for_user(staff).access_token)
+
+        last = Order.objects.aggregate(last=Max('placed_at'))['last']
+        if last:
+            self.report_range = {'from': (last - timedelta(days=29)).date().isoformat(), 'to': last.date().isoformat()}
+        else:
+            self.report_range = {}
+
+        # Queue syncs see the orders changed during the run
+        self.queue_cursor = make_cursor(timezone.now())
+
+        self._open_orders = {}
+        self._lock = threading.Lock()
+
+    def top_up_stock(self, units):
+        """Make sure order creation never fails for lack of stock"""
+        InventoryBalance.objects.update(on_hand=F('on_hand') + units)
+
+    def prepare_orders(self, pool, count, rng):
+        """Place `count` orders (untimed) for the scenarios that close them"""
+        ids = []
+        for _ in range(count):
+            assignment = rng.choice(self.assignments)
+            with transaction.atomic():
+                order, _ = place_order(
+                    device=assignment.device,
+                    patient_assignment=assignment,
+                    items_data=[{'product_id': rng.choice(self.product_ids), 'quantity': 1}],
+                    enforce_limits=False
+                )
+            ids.append(order.id)
+        self._open_orders[pool] = ids
+
+    def take_order(self, pool):
+        with self._lock:
+            return self._open_orders[pool].pop()
+
+
+def _create_order(client, context, rng):
+    # One unit of one product, within the default per-category limits
+    device_uid = rng.choice(context.device_uids)
+    return client.post(
+        reverse('public-order-create'),
+        {'items': [{'product_id': rng.choice(context.product_ids), 'quantity': 1}]},
+        content_type='application/json',
+        HTTP_X_DEVICE_TOKEN=context.device_tokens[device_uid]
+    )
+
+
+def _order_queue(client, context, rng):
+    return client.get(reverse('order-order-queue'), {'my_orders': 'true'}, HTTP_AUTHORIZATION=f'Bearer {context.staff_token}')
+
+
+def _order_queue_changes(client, context, rng):
+    return client.get(
+        reverse('order-queue-changes'),
+        {'my_orders': 'true', 'cursor': context.queue_cursor},
+        HTTP_AUTHORIZATION=f'Bearer {context.staff_token}'
+    )
+
+
+def _deliver(client, context, rng):
+    return client.patch(
+        reverse('order-change-status', args=[context.take_order('deliver')]),
+        {'to_status': 'DELIVERED'},
+        content_type='application/json',
+        HTTP_AUTHORIZATION=f'Bearer {context.staff_token}'
+    )
+
+
+def _cancel(client, context, rng):
+    return client.post(
+        reverse('order-cancel-order', args=[context.take_order('cancel')]),
+        {},
+        content_type='application/json',
+        HTTP_AUTHORIZATION=f'Bearer {context.staff_token}'
+    )
+
+
+def _active_patient(client, context, rng):
+    device_uid = rng.choice(context.device_uids)
+    return client.get(
+        reverse('clinic_public:kiosk-active-patient', args=[device_uid]),
+        HTTP_X_DEVICE_TOKEN=context.device_tokens[device_uid]
+    )
+
+
+def _menu(client, context, rng):
+    return client.get(reverse('menu'))
+
+
+def _most_ordered(client, context, rng):
+    return client.get(reverse('most-ordered-products'))
+
+
+def _admin_get(route):
+    def request(client, context, rng):
+        return client.get(reverse(route), context.report_range, HTTP_AUTHORIZATION=f'Bearer {context.admin_token}')
+    return request
+
+
+# request(client, context, rng) sends one request; pool names the open
+# orders the scenario consumes, one per request
+Scenario = namedtuple('Scenario', ['request', 'pool'], defaults=[None])
+
+SCENARIOS = {
+    'order_create': Scenario(_create_order),
+    'order_queue': Scenario(_order_queue),
+    'order_queue_changes': Scenario(_order_queue_changes),
+    'order_deliver': Scenario(_deliver, pool='deliver'),
+    'order_cancel': Scenario(_cancel, pool='cancel'),
+    'active_patient': Scenario(_active_patient),
+    'menu': Scenario(_menu),
+    'most_ordered': Scenario(_most_ordered),
+    'dashboard_stats': Scenario(_admin_get('dashboard-stats')),
+    'report_daily_orders': Scenario(_admin_get('reports-daily-orders')),
+    'report_top_products': Scenario(_admin_get('reports-top-products')),
+    'report_ratings_summary': Scenario(_admin_get('reports-ratings-summary')),
+    'report_product_ratings': Scenario(_admin_get('reports-product-ratings')),
+}
+
+
+def run_scenario(name, context, requests, concurrency, seed=0):
+    """
+    Send `requests` requests of one scenario from `concurrency` threads
+    With a concurrency of 1 the requests run in the calling thread.
+    """
+    scenario = SCENARIOS[name]
+    if scenario.pool:
+        context.prepare_orders(scenario.pool, requests, random.Random(seed))
+
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    barrier = threading.Barrier(concurrency)
+
+    def worker(index, count):
+        rng = random.Random(seed * 1000 + index)
+        client = Client()
+        thread_latencies, thread_queries, thread_errors = [], [], 0
+        try:
+            if concurrency > 1:
+                barrier.wait()
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    response = scenario.request(client, context, rng)
+                except Exception:
+                    thread_errors += 1
+                    continue
+                thread_latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    thread_errors += 1
+                count_queries = _queries(response)
+                if count_queries is not None:
+                    thread_queries.append(count_queries)
+        finally:
+            if concurrency > 1:
+                connection.close()
+            with lock:
+                latencies.extend(thread_latencies)
+                queries.extend(thread_queries)
+                errors.append(thread_errors)
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(0, requests)
+    else:
+        threads = [threading.Thread(target=worker, args=(i, count)) for i, count in enumerate(shares)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0) * 1000, 2),
+        'avg_queries': round(sum(queries) / len(queries), 1) if queries else None,
+        'max_queries': max(queries, default=None),
+    }
+
+
+def compare_results(baseline, current, threshold=0.2, min_ms=2.0):
+    """
+    Compare two result files; returns (rows, regressions)
+    A result regresses when its p95 is more than `threshold` (and `min_ms`)
+    slower, when it runs more queries per request, or when it has new errors.
+    """
+    key = lambda result: (result.get('scale'), result['concurrency'], result['scenario'])
+    previous = {key(result): result for result in baseline['results']}
+
+    rows, regressions = [], []
+    for result in current['results']:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        problems = []
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold) and result['p95_ms'] - before['p95_ms'] >= min_ms:
+            problems.append(f"p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if (result['avg_queries'] or 0) > (before['avg_queries'] or 0):
+            problems.append(f"queries {before['avg_queries']} -> {result['avg_queries']}")
+        if result['errors'] > before['errors']:
+            problems.append(f"errors {before['errors']} -> {result['errors']}")
+        row = {'key': key(result), 'before': before, 'after': result, 'problems': problems}
+        rows.append(row)
+        if problems:
+            regressions.append(row)
+    return rows, regressions
@@ -0,0 +1,244 @@
+"""
+Management command to compare the sync and async kiosk read endpoints under daphne
+Starts daphne on the current database (or uses the server given with --url)
+and sends each endpoint the same load through its sync DRF view, which runs
+in daphne's thread pool (ASGI_THREADS), and through its async version, which
+runs on the event loop. Every client is a keep-alive HTTP/1.1 connection;
+throughput, latency percentiles and errors are printed and written to a
+JSON file. The database needs a device with an active patient
+(generate_synthetic_data).
+Usage: python manage.py bench_kiosk_async --concurrency 1,16,64 --requests 1000 --threads 4
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from clinic.device_tokens import HEADER, issue_device_token
+from clinic.models import PatientAssignment
+from common.benchmarks import percentile
+
+
+# Endpoint -> (sync route, async route, URL arguments, sends the device token)
+ENDPOINTS = {
+    'menu': ('menu', 'async-menu', None, False),
+    'featured': ('featured-product', 'async-featured-product', None, False),
+    'most_ordered': ('most-ordered-products', 'async-most-ordered-products', None, False),
+    'active_orders': ('public-order-active', 'async-public-order-active', None, True),
+    'active_patient': (
+        'clinic_public:kiosk-active-patient', 'clinic_public:async-kiosk-active-patient', 'device_uid', True
+    ),
+}
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _get(reader, writer, path, headers):
+    """
+    One GET on a keep-alive connection
+    Returns (status, keep_alive); reads the whole body (Content-Length or chunked).
+    """
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n'.encode('latin-1'))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('Connection closed by the server')
+    status = int(status_line.split()[1])
+
+    length, chunked, keep_alive = 0, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            keep_alive = value != 'close'
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if not size:
+                await reader.readline()
+                break
+            await reader.readexactly(size + 2)
+    elif length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def _load(host, port, requests, concurrency, make_request):
+    """Send `requests` GETs from `concurrency` connections; make_request(rng) -> (path, headers)"""
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def client(index):
+        nonlocal errors
+        rng = random.Random(index)
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for _ in remaining:
+                path, headers = make_request(rng)
+                started = time.perf_counter()
+                try:
+                    status, keep_alive = await _get(reader, writer, path, headers)
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                    errors += 1
+                    keep_alive = False
+                else:
+                    latencies.append(time.perf_counter() - started)
+                    if status >= 400:
+                        errors += 1
+                if not keep_alive:
+                    writer.close()
+                    reader, writer = await asyncio.open_connection(host, port)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(index) for index in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compares the throughput of the sync and async kiosk read endpoints under daphne'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma separated endpoints')
+        parser.add_argument('--concurrency', default='1,16,64', help='Comma separated numbers of concurrent connections')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per endpoint, mode and concurrency level')
+        parser.add_argument('--threads', type=int, default=None, help='ASGI_THREADS of the daphne server (thread pool of the sync views)')
+        parser.add_argument('--url', default=None, help='Use a running server (e.g. http://127.0.0.1:8000) instead of starting daphne')
+        parser.add_argument('--output', default='benchmarks/kiosk_async.json', help='JSON results file')
+
+    def handle(self, *args, **options):
+        endpoints = _split(options['endpoints'])
+        for name in endpoints:
+            if name not in ENDPOINTS:
+                raise CommandError(f'Unknown endpoint: {name}')
+        try:
+            levels = [int(level) for level in _split(options['concurrency'])]
+        except ValueError:
+            raise CommandError('--concurrency must be a list of numbers')
+        if not levels or min(levels) < 1:
+            raise CommandError('Concurrency levels must be 1 or more')
+
+        assignments = list(PatientAssignment.objects.filter(
+            is_active=True, device__is_active=True
+        ).select_related('device')[:200])
+        if not assignments:
+            raise CommandError('No device with an active patient, generate data first (generate_synthetic_data)')
+        devices = [(assignment.device.device_uid, issue_device_token(assignment.device)) for assignment in assignments]
+
+        server = None
+        if options['url']:
+            url = urlsplit(options['url'])
+            host, port = url.hostname, url.port or 80
+        else:
+            host, port = '127.0.0.1', _free_port()
+            server = self._start_server(port, options['threads'])
+
+        try:
+            results = asyncio.run(self._run(host, port, endpoints, levels, devices, options['requests']))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({
+            'created_at': timezone.now().isoformat(),
+            'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+            'threads': options['threads'],
+            'requests': options['requests'],
+            'results': results,
+        }, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} results written to {output}'))
+
+    def _start_server(self, port, threads):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        if threads:
+            env['ASGI_THREADS'] = str(threads)
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'clinic_service.asgi:application'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'daphne exited: {server.stderr.read().decode()[-2000:]}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                self.stdout.write(f'daphne listening on 127.0.0.1:{port} (ASGI_THREADS={threads or "default"})')
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('daphne did not start within 30 seconds')
+
+    async def _run(self, host, port, endpoints, levels, devices, requests):
+        results = []
+        for name in endpoints:
+            sync_route, async_route, argument, send_token = ENDPOINTS[name]
+
+            def requester(route):
+                def make_request(rng):
+                    device_uid, token = rng.choice(devices)
+                    path = reverse(route, args=[device_uid] if argument else [])
+                    headers = f'{HEADER}: {token}\r\n' if send_token else ''
+                    return path, headers
+                return make_request
+
+            # Warm up the caches (menu, kiosk sessions, revocation list) and the connections
+            for route in (sync_route, async_route):
+                await _load(host, port, 50, 4, requester(route))
+
+            for concurrency in levels:
+                row = {}
+                for mode, route in (('sync', sync_route), ('async', async_route)):
+                    result = await _load(host, port, requests, concurrency, requester(route))
+                    results.append({'endpoint': name, 'mode': mode, 'concurrency': concurrency, **result})
+                    row[mode] = result
+                speedup = row['async']['throughput'] / row['sync']['throughput'] if row['sync']['throughput'] else 0
+                self.stdout.write(
+                    f"  {name:<15} c={concurrency:<4}"
+                    f"sync {row['sync']['throughput']:>7.1f} req/s p95 {row['sync']['p95_ms']:>7.1f} ms  "
+                    f"async {row['async']['throughput']:>7.1f} req/s p95 {row['async']['p95_ms']:>7.1f} ms  "
+                    f"x{speedup:.2f}  errors {row['sync']['errors']}/{row['async']['errors']}"
+                )
+        return results
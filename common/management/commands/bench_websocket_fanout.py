@@ -0,0 +1,299 @@
+"""
+Management command to load test the WebSocket fan-out of one ASGI process
+Opens thousands of simulated KioskOrderConsumer and StaffOrderConsumer
+connections (channels' WebsocketCommunicator, in process), then publishes
+order events the way the views do: publish() in a committed transaction,
+drained by an outbox dispatcher on the same event loop. Each event is an
+order_status_changed for one kiosk and a new_order for the staff of that
+device and the admins. Reports memory per connection, latency from commit
+to socket and dropped messages, for each channel layer.
+
+Do not point the redis layers at a production Redis: the admin sockets of
+real servers would receive the benchmark's new_order events.
+Usage: python manage.py bench_websocket_fanout --kiosks 2000 --staff 200 --events 1000 --layers memory,redis
+"""
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.claims import forget_user
+from accounts.models import User, Role, UserRole
+from clinic.device_tokens import forget_valid_devices, issue_device_token
+from clinic.models import Room, Device
+from common.benchmarks import percentile
+from common.models import OutboxEvent
+from common.outbox import dispatch_pending, publish
+from common.redis_standin import RedisStandIn
+from orders.groups import device_group, publish_to_staff
+from orders.routing import websocket_urlpatterns
+
+PREFIX = 'bench-fanout'
+LAYERS = ('memory', 'redis', 'redis-pubsub')
+
+
+def layer_config(name, standin_url=None):
+    """CHANNEL_LAYERS['default'] for a layer name, with the capacity settings of the project"""
+    limits = {
+        'capacity': settings.CHANNEL_LAYERS_CAPACITY,
+        'expiry': settings.CHANNEL_LAYERS_EXPIRY,
+        'group_expiry': settings.CHANNEL_LAYERS_GROUP_EXPIRY,
+        'channel_capacity': settings.CHANNEL_LAYERS_CHANNEL_CAPACITY,
+    }
+    host = standin_url or settings.REDIS_URL or (settings.CHANNEL_LAYERS_HOST or 'localhost', settings.CHANNEL_LAYERS_PORT)
+    if name == 'memory':
+        return {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': limits}
+    if name == 'redis-pubsub':
+        return {'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer', 'CONFIG': {'hosts': [host]}}
+    return {'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': [host], **limits}}
+
+
+class Command(BaseCommand):
+    help = 'Load tests kiosk and staff WebSocket fan-out: memory per connection, delivery latency, drops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kiosks', type=int, default=1000, help='Kiosk sockets (one device each)')
+        parser.add_argument('--staff', type=int, default=100, help='Staff sockets, devices are shared out between them')
+        parser.add_argument('--admins', type=int, default=5, help='Admin sockets, they receive every new_order')
+        parser.add_argument('--events', type=int, default=1000, help='Order events to publish')
+        parser.add_argument('--rate', type=float, default=200, help='Events per second')
+        parser.add_argument('--layers', default='memory', help=f'Comma separated channel layers ({", ".join(LAYERS)})')
+        parser.add_argument('--standin', action='store_true', help='Serve redis-pubsub from an in-process Redis stand-in')
+        parser.add_argument('--connect-batch', type=int, default=200, help='Sockets connecting at the same time')
+        parser.add_argument('--timeout', type=float, default=10, help='Seconds to wait for the last deliveries')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        layers = [layer.strip() for layer in options['layers'].split(',') if layer.strip()]
+        for layer in layers:
+            if layer not in LAYERS:
+                raise CommandError(f'Unknown channel layer: {layer}')
+        if options['kiosks'] < 1 or options['staff'] < 1:
+            raise CommandError('At least one kiosk and one staff socket are needed')
+
+        standin = RedisStandIn(port=0).start() if options['standin'] else None
+        fixtures = self._create_fixtures(options['kiosks'], options['staff'], options['admins'])
+        results = []
+        try:
+            for layer in layers:
+                config = layer_config(layer, standin.url if standin and layer == 'redis-pubsub' else None)
+                with override_settings(CHANNEL_LAYERS={'default': config}):
+                    result = async_to_sync(self._run)(fixtures, options)
+                result['layer'] = layer
+                results.append(result)
+                self._report(result)
+        finally:
+            self._delete_fixtures(fixtures)
+            if standin:
+                standin.stop()
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    async def _run(self, fixtures, options):
+        application = URLRouter(websocket_urlpatterns)
+        paths = (
+            [f'/ws/kiosk/orders/?device_token={issue_device_token(device)}' for device in fixtures['devices']] +
+            [f'/ws/staff/orders/?token={token}' for token in fixtures['staff_tokens'] + fixtures['admin_tokens']]
+        )
+        kiosk_count = len(fixtures['devices'])
+
+        # Connect every socket, measuring the Python memory it takes
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        communicators = []
+        failed = 0
+        for offset in range(0, len(paths), options['connect_batch']):
+            batch = [WebsocketCommunicator(application, path) for path in paths[offset:offset + options['connect_batch']]]
+            connected = await asyncio.gather(*[communicator.connect(timeout=30) for communicator in batch])
+            failed += sum(1 for ok, _ in connected if not ok)
+            communicators.extend(batch)
+        connect_seconds = time.perf_counter() - started
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - memory_before) / len(paths)
+        tracemalloc.stop()
+
+        sent = {}
+        latencies = {'kiosk': [], 'staff': []}
+        received = {'kiosk': 0, 'staff': 0}
+        expected = {'kiosk': 0, 'staff': 0}
+        done = asyncio.Event()
+
+        async def read(communicator, kind):
+            while True:
+                message = await communicator.output_queue.get()
+                if message.get('type') != 'websocket.send':
+                    continue
+                data = json.loads(message['text'])
+                if data.get('type') in ('order_status_changed', 'new_order') and data['order_id'] in sent:
+                    latencies[kind].append(time.perf_counter() - sent[data['order_id']])
+                    received[kind] += 1
+                    if received == expected and sending_done:
+                        done.set()
+
+        wakeup = asyncio.Event()
+
+        async def dispatch():
+            # One dispatcher draining the outbox after every commit, as the ASGI one does when woken
+            while True:
+                await wakeup.wait()
+                wakeup.clear()
+                while await dispatch_pending():
+                    pass
+
+        sending_done = False
+        readers = [
+            asyncio.create_task(read(communicator, 'kiosk' if index < kiosk_count else 'staff'))
+            for index, communicator in enumerate(communicators)
+        ]
+        dispatcher = asyncio.create_task(dispatch())
+
+        rng = random.Random(options['seed'])
+        admins = len(fixtures['admin_tokens'])
+        started = time.perf_counter()
+        for order_id in range(1, options['events'] + 1):
+            delay = started + order_id / options['rate'] - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            device = rng.choice(fixtures['devices'])
+            expected['kiosk'] += 1
+            expected['staff'] += 1 + admins
+            sent[order_id] = await database_sync_to_async(self._publish)(device, order_id)
+            wakeup.set()
+        sending_done = True
+        send_seconds = time.perf_counter() - started
+
+        if received != expected:
+            try:
+                await asyncio.wait_for(done.wait(), timeout=options['timeout'])
+            except asyncio.TimeoutError:
+                pass
+
+        for task in readers + [dispatcher]:
+            task.cancel()
+        for offset in range(0, len(communicators), options['connect_batch']):
+            await asyncio.gather(*[
+                communicator.disconnect() for communicator in communicators[offset:offset + options['connect_batch']]
+            ], return_exceptions=True)
+        layer = channel_layers['default']
+        if hasattr(layer, 'close_pools'):
+            await layer.close_pools()
+        elif hasattr(layer, 'flush'):
+            await layer.flush()
+
+        result = {
+            'kiosk_sockets': kiosk_count,
+            'staff_sockets': len(paths) - kiosk_count,
+            'failed_connections': failed,
+            'connect_seconds': round(connect_seconds, 2),
+            'memory_per_connection_kb': round(memory_per_connection / 1024, 1),
+            'events': options['events'],
+            'events_per_second': round(options['events'] / send_seconds, 1) if send_seconds else 0,
+        }
+        for kind in ('kiosk', 'staff'):
+            result[kind] = {
+                'expected': expected[kind],
+                'received': received[kind],
+                'dropped': expected[kind] - received[kind],
+                'p50_ms': round(percentile(latencies[kind], 50) * 1000, 2),
+                'p95_ms': round(percentile(latencies[kind], 95) * 1000, 2),
+                'p99_ms': round(percentile(latencies[kind], 99) * 1000, 2),
+            }
+        return result
+
+    def _publish(self, device, order_id):
+        """Publish the kiosk and staff messages of one order change, returns the commit time"""
+        with transaction.atomic():
+            publish(device_group(device.id), {
+                'type': 'order_status_changed',
+                'order_id': order_id,
+                'status': 'READY',
+                'from_status': 'PREPARING',
+                'changed_at': None,
+            })
+            publish_to_staff({
+                'type': 'new_order',
+                'order_id': order_id,
+                'room_code': device.room.code,
+                'device_uid': device.device_uid,
+                'placed_at': None,
+            }, device_id=device.id)
+        return time.perf_counter()
+
+    def _report(self, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Layer: {result['layer']}"))
+        self.stdout.write(
+            f"  Sockets: {result['kiosk_sockets']} kiosks + {result['staff_sockets']} staff "
+            f"({result['failed_connections']} failed) in {result['connect_seconds']:.1f}s"
+        )
+        self.stdout.write(f"  Memory per connection: {result['memory_per_connection_kb']:.1f} KiB")
+        self.stdout.write(f"  Events: {result['events']} at {result['events_per_second']:.1f}/s")
+        for kind in ('kiosk', 'staff'):
+            data = result[kind]
+            style = self.style.ERROR if data['dropped'] else self.style.SUCCESS
+            self.stdout.write(style(
+                f"  {kind.title()} messages: {data['received']}/{data['expected']} ({data['dropped']} dropped), "
+                f"latency p50/p95/p99: {data['p50_ms']:.1f} / {data['p95_ms']:.1f} / {data['p99_ms']:.1f} ms"
+            ))
+
+    def _create_fixtures(self, kiosks, staff, admins):
+        """Devices shared out between staff members, plus admins; tokens for the staff sockets"""
+        staff_role = Role.objects.get_or_create(name=Role.STAFF)[0]
+        users = User.objects.bulk_create([
+            User(email=f'{PREFIX}-staff-{i}@example.com', full_name=f'Fan-out Staff {i}', is_staff=True, password='!')
+            for i in range(staff)
+        ])
+        UserRole.objects.bulk_create([UserRole(user=user, role=staff_role) for user in users])
+        admin_users = User.objects.bulk_create([
+            User(email=f'{PREFIX}-admin-{i}@example.com', full_name=f'Fan-out Admin {i}',
+                 is_staff=True, is_superuser=True, password='!')
+            for i in range(admins)
+        ])
+        # bulk_create sends no signals: drop anything cached for reused ids
+        for user in users + admin_users:
+            forget_user(user.id)
+
+        rooms = Room.objects.bulk_create([Room(code=f'{PREFIX}-{i}') for i in range(kiosks)])
+        devices = Device.objects.bulk_create([
+            Device(device_uid=f'{PREFIX}-{i}', room=room) for i, room in enumerate(rooms)
+        ])
+        # Not on a cached list of valid devices yet, their tokens would be rejected
+        forget_valid_devices()
+        Device.assigned_staff.through.objects.bulk_create([
+            Device.assigned_staff.through(device=device, user=users[i % staff]) for i, device in enumerate(devices)
+        ])
+        last_event = OutboxEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        return {
+            'users': users + admin_users,
+            'rooms': rooms,
+            'devices': devices,
+            'staff_tokens': [str(AccessToken.for_user(user)) for user in users],
+            'admin_tokens': [str(AccessToken.for_user(user)) for user in admin_users],
+            'last_event': last_event,
+        }
+
+    def _delete_fixtures(self, fixtures):
+        groups = {device_group(device.id) for device in fixtures['devices']}
+        OutboxEvent.objects.filter(id__gt=fixtures['last_event'], group__in=groups).delete()
+        OutboxEvent.objects.filter(
+            id__gt=fixtures['last_event'], payload__device_uid__startswith=f'{PREFIX}-'
+        ).delete()
+        Device.objects.filter(id__in=[device.id for device in fixtures['devices']]).delete()
+        Room.objects.filter(id__in=[room.id for room in fixtures['rooms']]).delete()
+        User.objects.filter(id__in=[user.id for user in fixtures['users']]).delete()
@@ -0,0 +1,67 @@
+"""
+Management command to compare benchmark results against a stored baseline
+Flags every scenario whose p95 latency grew by more than --threshold, that
+runs more queries per request or that has new errors, and exits with an
+error when there is any regression. --update stores the results as the new
+baseline.
+Usage: python manage.py compare_benchmarks --baseline benchmarks/baseline.json --results benchmarks/results.json
+"""
+import json
+import shutil
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.benchmarks import compare_results
+
+
+class Command(BaseCommand):
+    help = 'Compares benchmark results with a baseline and reports regressions'
+    # Only reads JSON files
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default='benchmarks/baseline.json', help='Baseline results file')
+        parser.add_argument('--results', default='benchmarks/results.json', help='New results file')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Tolerated p95 slowdown (0.2 = 20%%)')
+        parser.add_argument('--min-ms', type=float, default=2.0, help='Ignore p95 slowdowns smaller than this')
+        parser.add_argument('--update', action='store_true', help='Store the results as the new baseline when there are no regressions')
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        results_path = Path(options['results'])
+        if not results_path.exists():
+            raise CommandError(f'{results_path} not found, run run_benchmarks first')
+        if not baseline_path.exists():
+            if not options['update']:
+                raise CommandError(f'{baseline_path} not found, use --update to create it')
+            self._store(results_path, baseline_path)
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        current = json.loads(results_path.read_text())
+        rows, regressions = compare_results(baseline, current, options['threshold'], options['min_ms'])
+
+        for row in rows:
+            scale, concurrency, scenario = row['key']
+            before, after = row['before'], row['after']
+            line = (
+                f"{scale or '-':<9} c={concurrency:<3} {scenario:<24} "
+                f"p95 {before['p95_ms']:>8.1f} -> {after['p95_ms']:>8.1f} ms  "
+                f"queries {before['avg_queries']} -> {after['avg_queries']}"
+            )
+            if row['problems']:
+                self.stdout.write(self.style.ERROR(f"{line}  REGRESSION: {'; '.join(row['problems'])}"))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions in {len(rows)} compared results'))
+        if options['update']:
+            self._store(results_path, baseline_path)
+
+    def _store(self, results_path, baseline_path):
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(results_path, baseline_path)
+        self.stdout.write(self.style.SUCCESS(f'Baseline stored in {baseline_path}'))
@@ -0,0 +1,51 @@
+"""
+Management command to send pending outbox events to the channel layer
+Useful after a worker crash, or with --watch as a dedicated dispatcher
+process when the web server does not run under ASGI.
+Usage: python manage.py dispatch_outbox [--prune] [--watch]
+"""
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from common.models import OutboxEvent
+from common.outbox import dispatch_pending, dispatcher, prune_events
+
+
+class Command(BaseCommand):
+    help = 'Dispatches pending WebSocket outbox events and optionally prunes old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events claimed per batch')
+        parser.add_argument('--prune', action='store_true', help='Delete events older than the retention window')
+        parser.add_argument('--retention-hours', type=int, default=None, help='Override OUTBOX_RETENTION_HOURS')
+        parser.add_argument('--watch', action='store_true', help='Keep running and dispatch events as they are committed')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['watch']:
+            self.stdout.write(self.style.SUCCESS('Dispatching outbox events (Ctrl+C to stop)'))
+            try:
+                asyncio.run(dispatcher.run_forever())
+            except KeyboardInterrupt:
+                self.stdout.write('Stopped')
+            return
+
+        dispatched = 0
+        while True:
+            claimed = async_to_sync(dispatch_pending)(batch_size)
+            dispatched += claimed
+            if claimed < batch_size:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'Dispatched {dispatched} events'))
+
+        failed = OutboxEvent.objects.filter(dispatched_at__isnull=True).count()
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} events still pending'))
+
+        if options['prune']:
+            deleted = prune_events(options['retention_hours'])
+            self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} events'))
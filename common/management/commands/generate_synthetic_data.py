@@ -0,0 +1,383 @@
+"""
+Management command to generate a large, realistic data set for performance testing
+Creates rooms, devices, staff, patients with their stays (patient assignments),
+and for every day of history: orders with items, status events, inventory
+movements and end-of-stay feedbacks. Everything is written with bulk_create
+in chunks, one transaction per day, bypassing signals; the derived tables
+(rollups, popularity, ratings) are rebuilt at the end.
+
+The output only depends on the parameters: the same --seed and --end-date
+always produce the same rows. Rows are named with --prefix, so several data
+sets can live in one database.
+
+Usage: python manage.py generate_synthetic_data --rooms 100 --patients 20000 --days 365 --orders-per-day 3000
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User, Role, UserRole
+from catalog.models import ProductCategory, Product
+from clinic.models import Room, Device, Patient, PatientAssignment
+from feedbacks.models import Feedback
+from inventory.models import InventoryBalance, InventoryMovement
+from orders.models import Order, OrderItem, OrderStatusEvent
+
+
+CATEGORIES = [
+    ('Bebidas', 'DRINK', ['Agua', 'Jugo', 'Café', 'Té', 'Refresco', 'Leche', 'Atole', 'Limonada']),
+    ('Snacks', 'SNACK', ['Galletas', 'Fruta picada', 'Yogurt', 'Barra de granola', 'Nueces', 'Gelatina']),
+    ('Comida', 'FOOD', ['Sopa', 'Ensalada', 'Sándwich', 'Pollo', 'Pasta', 'Arroz', 'Quesadilla', 'Tacos']),
+    ('Otros', 'OTHER', ['Almohada', 'Cobija', 'Kit de higiene', 'Cargador', 'Revista']),
+]
+
+# Share of the orders placed at each hour of the day (meal peaks)
+HOUR_WEIGHTS = [0, 0, 0, 0, 0, 0, 1, 4, 9, 7, 4, 4, 6, 10, 8, 4, 3, 4, 6, 9, 7, 4, 2, 1]
+
+ACTIVE_STATUSES = ['PLACED', 'PREPARING', 'READY']
+
+
+@contextmanager
+def historical_timestamps(*models):
+    """
+    Let bulk_create keep the given created_at/updated_at style values
+    (auto_now and auto_now_add would replace them with the current time)
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generates a deterministic, production-sized data set (orders, items, events, movements, feedbacks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=50, help='Rooms, one kiosk device each')
+        parser.add_argument('--staff', type=int, default=20, help='Staff members, each attends several devices')
+        parser.add_argument('--patients', type=int, default=5000, help='Patient pool (patients come back for new stays)')
+        parser.add_argument('--days', type=int, default=90, help='Days of history')
+        parser.add_argument('--orders-per-day', type=int, default=500, help='Average orders per day')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--end-date', help='Last day of history, YYYY-MM-DD (default: today)')
+        parser.add_argument('--prefix', default='synth', help='Prefix of codes, emails and SKUs of the generated rows')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per INSERT')
+        parser.add_argument('--skip-rebuild', action='store_true', help='Do not rebuild rollups, popularity and ratings')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.chunk_size = options['chunk_size']
+
+        if Room.objects.filter(code__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Rows with prefix "{self.prefix}" already exist, use another --prefix')
+
+        try:
+            end_date = date.fromisoformat(options['end_date']) if options['end_date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('--end-date must be YYYY-MM-DD')
+        days = options['days']
+        self.start = timezone.make_aware(datetime.combine(end_date - timedelta(days=days - 1), datetime.min.time()))
+        self.end = self.start + timedelta(days=days)
+
+        started = time.monotonic()
+        with historical_timestamps(Room, Device, Patient, PatientAssignment, Order, OrderItem,
+                                   OrderStatusEvent, InventoryMovement, Feedback):
+            with transaction.atomic():
+                self._create_catalog()
+                self._create_people(options['rooms'], options['staff'], options['patients'])
+                self._create_stays(days)
+
+            totals = {'orders': 0, 'items': 0, 'events': 0, 'movements': 0, 'feedbacks': 0}
+            for day in range(days):
+                with transaction.atomic():
+                    counts = self._generate_day(day, days, options['orders_per_day'])
+                for key, value in counts.items():
+                    totals[key] += value
+                if (day + 1) % 10 == 0 or day == days - 1:
+                    self.stdout.write(
+                        f'  day {day + 1}/{days}: {totals["orders"]} orders, {totals["items"]} items, '
+                        f'{totals["events"]} events, {totals["movements"]} movements, {totals["feedbacks"]} feedbacks'
+                    )
+
+            with transaction.atomic():
+                self._finish_inventory()
+
+        if not options['skip_rebuild']:
+            self.stdout.write('Rebuilding derived tables...')
+            for command in ('rebuild_order_rollups', 'rebuild_product_popularity',
+                            'backfill_product_rating_facts', 'rebuild_product_ratings'):
+                call_command(command, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {totals["orders"]} orders in {time.monotonic() - started:.0f}s'
+        ))
+
+    def _bulk(self, model, rows):
+        return model.objects.bulk_create(rows, batch_size=self.chunk_size)
+
+    def _create_catalog(self):
+        """Categories and products; a few products are far more popular than the rest"""
+        categories = self._bulk(ProductCategory, [
+            ProductCategory(name=f'{name} ({self.prefix})', category_type=category_type, sort_order=index)
+            for index, (name, category_type, _) in enumerate(CATEGORIES)
+        ])
+        self.products = self._bulk(Product, [
+            Product(
+                category=category,
+                name=f'{product_name} {self.prefix}',
+                sku=f'{self.prefix}-{category.category_type}-{index}',
+                price=self.rng.randint(20, 150),
+                product_sort_order=index
+            )
+            for category, (_, _, names) in zip(categories, CATEGORIES)
+            for index, product_name in enumerate(names)
+        ])
+        self.rng.shuffle(self.products)
+        # Zipf-like popularity
+        self.product_weights = [1 / (rank + 1) for rank in range(len(self.products))]
+        self.on_hand = {product.id: 0 for product in self.products}
+        self.reserved = {product.id: 0 for product in self.products}
+
+    def _create_people(self, rooms, staff, patients):
+        staff_role = Role.objects.get_or_create(name=Role.STAFF)[0]
+        password = make_password('staff123')
+        self.staff = self._bulk(User, [
+            User(email=f'{self.prefix}-staff-{i}@example.com', full_name=f'Staff {i}', password=password, is_staff=True)
+            for i in range(staff)
+        ])
+        self._bulk(UserRole, [UserRole(user=user, role=staff_role) for user in self.staff])
+
+        self.rooms = self._bulk(Room, [
+            Room(code=f'{self.prefix}-{i}', floor=str(i // 20 + 1), created_at=self.start, updated_at=self.start)
+            for i in range(rooms)
+        ])
+        self.devices = self._bulk(Device, [
+            Device(device_uid=f'{self.prefix}-ipad-{i}', room=room, created_at=self.start, updated_at=self.start)
+            for i, room in enumerate(self.rooms)
+        ])
+        # Each device is attended by two staff members
+        self.device_staff = [[self.staff[i % staff], self.staff[(i + 1) % staff]] for i in range(rooms)]
+        self._bulk(Device.assigned_staff.through, [
+            Device.assigned_staff.through(device=device, user=user)
+            for device, users in zip(self.devices, self.device_staff)
+            for user in {user.id: user for user in users}.values()
+        ])
+
+        self.patients = self._bulk(Patient, [
+            Patient(
+                full_name=f'Paciente {i}',
+                phone_e164=f'+1999{i:07d}',
+                created_at=self.start,
+                updated_at=self.start
+            )
+            for i in range(patients)
+        ])
+
+    def _create_stays(self, days):
+        """
+        Back to back stays of 1-4 days on every device; stays[device][day] is the stay index
+        The stays running on the last day are still active.
+        """
+        assignments = []
+        self.stays = []
+        next_patient = 0
+        for device_index, device in enumerate(self.devices):
+            by_day = []
+            day = 0
+            while day < days:
+                length = self.rng.randint(1, 4)
+                started_at = self.start + timedelta(days=day, hours=self.rng.randint(6, 10))
+                last_day = day + length - 1
+                active = last_day >= days - 1
+                ended_at = None if active else self.start + timedelta(days=last_day, hours=self.rng.randint(18, 22))
+                assignments.append(PatientAssignment(
+                    patient=self.patients[next_patient % len(self.patients)],
+                    staff=self.rng.choice(self.device_staff[device_index]),
+                    device=device,
+                    room=device.room,
+                    survey_enabled=not active,
+                    survey_enabled_at=ended_at,
+                    is_active=active,
+                    started_at=started_at,
+                    ended_at=ended_at,
+                    created_at=started_at,
+                    updated_at=ended_at or started_at
+                ))
+                by_day.extend([len(assignments) - 1] * min(length, days - day))
+                next_patient += 1
+                day += length
+            self.stays.append(by_day)
+
+        self.assignments = self._bulk(PatientAssignment, assignments)
+        self.stay_orders = {}
+
+    def _placed_at(self, day, assignment):
+        hour = self.rng.choices(range(24), weights=HOUR_WEIGHTS)[0]
+        placed_at = self.start + timedelta(days=day, hours=hour, minutes=self.rng.randint(0, 59),
+                                           seconds=self.rng.randint(0, 59))
+        placed_at = max(placed_at, assignment.started_at + timedelta(minutes=5))
+        if assignment.ended_at:
+            placed_at = min(placed_at, assignment.ended_at - timedelta(minutes=30))
+        return min(placed_at, self.end - timedelta(minutes=1))
+
+    def _generate_day(self, day, days, orders_per_day):
+        rng = self.rng
+        weekday_factor = 0.85 if (self.start + timedelta(days=day)).weekday() >= 5 else 1
+        count = max(0, int(rng.gauss(orders_per_day * weekday_factor, orders_per_day * 0.05)))
+        last_day = day == days - 1
+
+        plans = []
+        for _ in range(count):
+            device_index = rng.randrange(len(self.devices))
+            stay = self.stays[device_index][day]
+            assignment = self.assignments[stay]
+            placed_at = self._placed_at(day, assignment)
+
+            roll = rng.random()
+            if last_day and roll < 0.3:
+                final_status = rng.choice(ACTIVE_STATUSES)
+            elif roll < 0.06:
+                final_status = 'CANCELLED'
+            else:
+                final_status = 'DELIVERED'
+
+            products = {
+                product.id: product
+                for product in rng.choices(self.products, weights=self.product_weights, k=rng.choices([1, 2, 3], [50, 35, 15])[0])
+            }
+            lines = [(product, rng.choices([1, 2], [80, 20])[0]) for product in products.values()]
+            plans.append((stay, assignment, placed_at, final_status, lines))
+
+        orders = []
+        transitions = []
+        for stay, assignment, placed_at, final_status, lines in plans:
+            steps = [('', 'PLACED', placed_at)]
+            at = placed_at
+            if final_status == 'CANCELLED':
+                at += timedelta(minutes=rng.randint(1, 15))
+                steps.append(('PLACED', 'CANCELLED', at))
+            else:
+                path = ['PLACED', 'PREPARING', 'READY', 'DELIVERED']
+                for from_status, to_status in zip(path, path[1:path.index(final_status) + 1]):
+                    at += timedelta(seconds=int(60 * max(1, rng.lognormvariate(1.8, 0.5))))
+                    steps.append((from_status, to_status, min(at, self.end - timedelta(seconds=1))))
+            at = steps[-1][2]
+            transitions.append(steps)
+            orders.append(Order(
+                assignment=assignment.device,
+                patient_assignment=assignment,
+                room=assignment.room,
+                patient=assignment.patient,
+                status=final_status,
+                placed_at=placed_at,
+                delivered_at=at if final_status == 'DELIVERED' else None,
+                cancelled_at=at if final_status == 'CANCELLED' else None,
+                created_at=placed_at,
+                updated_at=at
+            ))
+        orders = self._bulk(Order, orders)
+
+        items, events, movements = [], [], []
+        for order, steps, (stay, assignment, placed_at, final_status, lines) in zip(orders, transitions, plans):
+            staff = assignment.staff
+            for from_status, to_status, at in steps:
+                events.append(OrderStatusEvent(
+                    order=order, from_status=from_status, to_status=to_status,
+                    changed_by=None if to_status == 'PLACED' else staff, changed_at=at
+                ))
+            for product, quantity in lines:
+                items.append(OrderItem(
+                    order=order, product=product, quantity=quantity,
+                    unit_label=product.unit_label, created_at=placed_at
+                ))
+                movements.append(InventoryMovement(
+                    product=product, movement_type='RESERVE', quantity=quantity, order=order,
+                    note=f'Reserved for Order #{order.id}', created_at=placed_at
+                ))
+                if final_status in ('DELIVERED', 'CANCELLED'):
+                    movement_type = 'CONSUME' if final_status == 'DELIVERED' else 'RELEASE'
+                    movements.append(InventoryMovement(
+                        product=product, movement_type=movement_type, quantity=quantity, order=order,
+                        created_by=staff, note=f'{movement_type.title()} for Order #{order.id}', created_at=steps[-1][2]
+                    ))
+                    if final_status == 'DELIVERED':
+                        self.on_hand[product.id] -= quantity
+                else:
+                    self.reserved[product.id] += quantity
+            if final_status == 'DELIVERED':
+                self.stay_orders.setdefault(stay, []).append((order.id, [product.id for product, _ in lines]))
+
+        self._bulk(OrderItem, items)
+        self._bulk(OrderStatusEvent, events)
+        self._bulk(InventoryMovement, movements)
+        feedbacks = self._create_feedbacks(day, days)
+
+        return {
+            'orders': len(orders),
+            'items': len(items),
+            'events': len(events),
+            'movements': len(movements),
+            'feedbacks': feedbacks,
+        }
+
+    def _create_feedbacks(self, day, days):
+        """About 60% of the stays ending today leave a survey, rating up to three of their orders"""
+        rng = self.rng
+        feedbacks = []
+        for by_day in self.stays:
+            stay = by_day[day]
+            if day + 1 < days and by_day[day + 1] == stay:
+                continue
+            assignment = self.assignments[stay]
+            delivered = self.stay_orders.pop(stay, [])
+            if assignment.is_active or rng.random() >= 0.6:
+                continue
+            product_ratings = {
+                str(order_id): {str(product_id): rng.choices([1, 2, 3, 4, 5], [2, 3, 10, 35, 50])[0] for product_id in product_ids}
+                for order_id, product_ids in delivered[-3:]
+            }
+            feedbacks.append(Feedback(
+                patient_assignment=assignment,
+                room=assignment.room,
+                patient=assignment.patient,
+                staff=assignment.staff,
+                product_ratings=product_ratings,
+                staff_rating=rng.choices([1, 2, 3, 4, 5], [2, 3, 10, 35, 50])[0],
+                stay_rating=rng.choices([1, 2, 3, 4, 5], [3, 5, 15, 40, 37])[0],
+                comment='',
+                created_at=assignment.ended_at
+            ))
+        self._bulk(Feedback, feedbacks)
+        return len(feedbacks)
+
+    def _finish_inventory(self):
+        """Stock received on the first day covers everything consumed, balances match the movements"""
+        receipts = []
+        for product in self.products:
+            received = -self.on_hand[product.id] + self.reserved[product.id] + self.rng.randint(50, 200)
+            self.on_hand[product.id] += received
+            receipts.append(InventoryMovement(
+                product=product, movement_type='RECEIPT', quantity=received,
+                note='Initial stock', created_at=self.start
+            ))
+        self._bulk(InventoryMovement, receipts)
+        self._bulk(InventoryBalance, [
+            InventoryBalance(product=product, on_hand=self.on_hand[product.id], reserved=self.reserved[product.id])
+            for product in self.products
+        ])
@@ -0,0 +1,113 @@
+"""
+Management command to benchmark the kiosk and staff hot paths
+For each data scale a throwaway test database is created and filled with
+generate_synthetic_data (or, with --use-existing, the current database is
+used as is). Every scenario of common.benchmarks then runs at each
+concurrency level and the latency percentiles, throughput, errors and
+queries per request are written to a JSON file for compare_benchmarks.
+Usage: python manage.py run_benchmarks --scales small,medium --concurrency 1,8 --requests 200 --output benchmarks/results.json
+"""
+import json
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from common.benchmarks import SCALES, SCENARIOS, BenchmarkContext, run_scenario
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the main endpoints at several data scales and concurrency levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='small', help=f'Comma separated data scales ({", ".join(SCALES)})')
+        parser.add_argument('--use-existing', action='store_true', help='Benchmark the current database instead (it is written to)')
+        parser.add_argument('--concurrency', default='1,8', help='Comma separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated scenarios')
+        parser.add_argument('--seed', type=int, default=42, help='Seed of the generated data and the requests')
+        parser.add_argument('--output', default='benchmarks/results.json', help='JSON results file')
+
+    def handle(self, *args, **options):
+        scales = ['existing'] if options['use_existing'] else _split(options['scales'])
+        scenarios = _split(options['scenarios'])
+        try:
+            levels = [int(level) for level in _split(options['concurrency'])]
+        except ValueError:
+            raise CommandError('--concurrency must be a list of numbers')
+
+        for scale in scales:
+            if scale != 'existing' and scale not in SCALES:
+                raise CommandError(f'Unknown scale: {scale}')
+        for name in scenarios:
+            if name not in SCENARIOS:
+                raise CommandError(f'Unknown scenario: {name}')
+        if not levels or min(levels) < 1:
+            raise CommandError('Concurrency levels must be 1 or more')
+
+        if connection.vendor == 'sqlite' and max(levels) > 1:
+            self.stdout.write(self.style.WARNING(
+                'SQLite serializes all writers, expect errors on the write scenarios under concurrency. '
+                'Run against PostgreSQL for meaningful numbers.'
+            ))
+
+        results = []
+        # The test client talks to 'testserver'
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for scale in scales:
+                results.extend(self._run_scale(scale, scenarios, levels, options))
+
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'results': results,
+        }, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} results written to {output}'))
+
+    def _run_scale(self, scale, scenarios, levels, options):
+        old_name = None
+        if scale != 'existing':
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Scale: {scale} (creating test database)'))
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        else:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Scale: existing ({connection.settings_dict["NAME"]})'))
+
+        try:
+            if old_name is not None:
+                call_command('generate_synthetic_data', seed=options['seed'], stdout=StringIO(), **SCALES[scale])
+            cache.clear()
+            try:
+                context = BenchmarkContext()
+            except ValueError as e:
+                raise CommandError(str(e))
+            context.top_up_stock(options['requests'] * len(levels) * 10)
+
+            results = []
+            for concurrency in levels:
+                for name in scenarios:
+                    result = run_scenario(name, context, options['requests'], concurrency, seed=options['seed'])
+                    result['scale'] = scale
+                    results.append(result)
+                    self.stdout.write(
+                        f"  {name:<24} c={concurrency:<3} p50 {result['p50_ms']:>8.1f} ms  "
+                        f"p95 {result['p95_ms']:>8.1f} ms  {result['throughput']:>7.1f} req/s  "
+                        f"queries {result['avg_queries']}  errors {result['errors']}"
+                    )
+            return results
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,36 @@
+"""
+Management command to run a local Redis-compatible stand-in (pub/sub only)
+Lets several daphne workers share WebSocket groups without installing Redis:
+    python manage.py run_redis_standin --port 6379
+    CHANNEL_LAYERS_BACKEND=redis-pubsub daphne -p 8001 clinic_service.asgi:application
+    CHANNEL_LAYERS_BACKEND=redis-pubsub daphne -p 8002 clinic_service.asgi:application
+Usage: python manage.py run_redis_standin [--host 127.0.0.1] [--port 6379]
+"""
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from common.redis_standin import RedisStandIn
+
+
+class Command(BaseCommand):
+    help = 'Runs a Redis-compatible pub/sub stand-in for the redis-pubsub channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+
+    def handle(self, *args, **options):
+        standin = RedisStandIn(host=options['host'], port=options['port'])
+
+        async def run():
+            server = await standin.serve()
+            self.stdout.write(self.style.SUCCESS(f'Redis stand-in listening on {standin.url} (Ctrl+C to stop)'))
+            self.stdout.flush()
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
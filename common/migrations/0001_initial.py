@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-16 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(help_text='Channel layer group the message is sent to', max_length=100, verbose_name='group')),
+                ('payload', models.JSONField(help_text='Message sent with group_send (includes the consumer "type")', verbose_name='payload')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Failed dispatch attempts', verbose_name='attempts')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, help_text='When the message was sent to the channel layer', null=True, verbose_name='dispatched at')),
+            ],
+            options={
+                'verbose_name': 'outbox event',
+                'verbose_name_plural': 'outbox events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['dispatched_at', 'id'], name='common_outb_dispatc_2a4fb0_idx')],
+            },
+        ),
+    ]
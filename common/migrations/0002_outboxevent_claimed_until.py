@@ -0,0 +1,18 @@
+# Generated manually: outbox events are leased while they are being sent
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, help_text='Lease of the dispatcher sending the message; claimed again after it expires', null=True, verbose_name='claimed until'),
+        ),
+    ]
@@ -1,3 +1,47 @@
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+
+class OutboxEvent(models.Model):
+    """
+    WebSocket broadcast written in the same transaction as the change it announces.
+    Sent to the channel layer after commit by the outbox dispatcher (common.outbox).
+    """
+    group = models.CharField(
+        _('group'),
+        max_length=100,
+        help_text=_('Channel layer group the message is sent to')
+    )
+    payload = models.JSONField(
+        _('payload'),
+        help_text=_('Message sent with group_send (includes the consumer "type")')
+    )
+    attempts = models.PositiveIntegerField(
+        _('attempts'),
+        default=0,
+        help_text=_('Failed dispatch attempts')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_until = models.DateTimeField(
+        _('claimed until'),
+        blank=True,
+        null=True,
+        help_text=_('Lease of the dispatcher sending the message; claimed again after it expires')
+    )
+    dispatched_at = models.DateTimeField(
+        _('dispatched at'),
+        blank=True,
+        null=True,
+        help_text=_('When the message was sent to the channel layer')
+    )
+
+    class Meta:
+        verbose_name = _('outbox event')
+        verbose_name_plural = _('outbox events')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['dispatched_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.payload.get("type")} → {self.group}'
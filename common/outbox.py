@@ -0,0 +1,235 @@
+"""
+Transactional outbox for WebSocket broadcasts
+
+Views call publish(group, message) inside their transaction instead of
+async_to_sync(channel_layer.group_send). The message is stored as an
+OutboxEvent row, so it commits or rolls back together with the change it
+announces, and the request never waits on the channel layer.
+
+After commit the dispatcher is woken up; it claims pending events in
+batches and sends them with group_send. Events of the same group are sent
+in order, different groups are sent concurrently. The dispatcher also
+polls every OUTBOX_POLL_INTERVAL seconds so events committed by other
+processes (or left behind by a failed send) are delivered too.
+
+A claim is a lease (claimed_until, OUTBOX_CLAIM_LEASE seconds): an event is
+only marked dispatched after group_send returned, and the events of a
+dispatcher that died while sending are claimed again once the lease runs
+out. Delivery is at least once; consumers must tolerate a repeated message.
+
+Under ASGI (daphne) the dispatcher runs as a task on the server event loop,
+started by OutboxDispatcherMiddleware. Processes without a dispatcher
+(management commands, shells) only write the events; a web worker picks
+them up on its next poll, or run `python manage.py dispatch_outbox --watch`.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboxEvent
+from .timing import timed
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def publish(group, message):
+    """
+    Queue a group_send for after the current transaction commits
+    Outside a transaction the event is dispatched right away.
+    """
+    with timed('channels'):
+        event = OutboxEvent.objects.create(group=group, payload=message)
+        transaction.on_commit(dispatcher.wake)
+    return event
+
+
+def claim_events(batch_size):
+    """
+    Lease up to batch_size pending events, oldest first
+    Events leased by another dispatcher are skipped until their lease expires;
+    rows locked by a concurrent claim are skipped (on databases that support it).
+    """
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 5)
+    lease = timedelta(seconds=_setting('OUTBOX_CLAIM_LEASE', 30))
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+                Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+                dispatched_at__isnull=True,
+                attempts__lt=max_attempts
+            ).order_by('id')[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+                claimed_until=now + lease
+            )
+    return events
+
+
+def mark_dispatched(event_ids):
+    """Record that the events were sent"""
+    OutboxEvent.objects.filter(id__in=event_ids).update(
+        dispatched_at=timezone.now(),
+        claimed_until=None
+    )
+
+
+def release_events(event_ids):
+    """Put events that could not be sent back in the queue"""
+    OutboxEvent.objects.filter(id__in=event_ids).update(
+        claimed_until=None,
+        attempts=F('attempts') + 1
+    )
+
+
+def prune_events(retention_hours=None):
+    """Delete events older than the retention window, returns the number deleted"""
+    if retention_hours is None:
+        retention_hours = _setting('OUTBOX_RETENTION_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=retention_hours)
+    deleted, _ = OutboxEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+async def _send_group(channel_layer, group, events):
+    """
+    Send the events of one group in order
+    Returns the ids that were not sent (the failed event and everything after it).
+    """
+    for index, event in enumerate(events):
+        try:
+            await channel_layer.group_send(group, event.payload)
+        except Exception as e:
+            print(f'Outbox dispatch to {group} failed: {e}')
+            return [pending.id for pending in events[index:]]
+    return []
+
+
+async def dispatch_pending(batch_size=None):
+    """
+    Send one batch of pending events to the channel layer
+    Returns the number of events claimed.
+    """
+    batch_size = batch_size or _setting('OUTBOX_BATCH_SIZE', 100)
+    events = await database_sync_to_async(claim_events)(batch_size)
+    if not events:
+        return 0
+
+    by_group = defaultdict(list)
+    for event in events:
+        by_group[event.group].append(event)
+
+    channel_layer = get_channel_layer()
+    results = await asyncio.gather(*[
+        _send_group(channel_layer, group, group_events)
+        for group, group_events in by_group.items()
+    ])
+
+    failed = {event_id for group_failed in results for event_id in group_failed}
+    sent = [event.id for event in events if event.id not in failed]
+    if sent:
+        await database_sync_to_async(mark_dispatched)(sent)
+    if failed:
+        await database_sync_to_async(release_events)(list(failed))
+
+    return len(events)
+
+
+class OutboxDispatcher:
+    """
+    Background dispatcher, one per process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._last_prune = None
+
+    @property
+    def running(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    def attach(self, loop):
+        """Run the dispatcher as a task on an existing event loop (must be called from that loop)"""
+        with self._lock:
+            if not self.running:
+                self._attach(loop)
+
+    def _attach(self, loop):
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def run_forever(self):
+        """Run the dispatcher on the current event loop until cancelled"""
+        self.attach(asyncio.get_running_loop())
+        await self._task
+
+    def wake(self):
+        """Ask the dispatcher to send pending events now (thread safe)"""
+        with self._lock:
+            if not self.running:
+                # No dispatcher in this process, a polling one will pick the events up
+                return
+            loop, wakeup = self._loop, self._wakeup
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            # Loop closed meanwhile, the events stay pending until the next dispatch
+            pass
+
+    async def _run(self):
+        poll_interval = _setting('OUTBOX_POLL_INTERVAL', 2)
+        batch_size = _setting('OUTBOX_BATCH_SIZE', 100)
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                # Keep going while full batches come back
+                while await dispatch_pending(batch_size) >= batch_size:
+                    pass
+                await self._prune_if_due()
+            except Exception as e:
+                print(f'Outbox dispatcher error: {e}')
+
+    async def _prune_if_due(self):
+        now = timezone.now()
+        if self._last_prune and now - self._last_prune < timedelta(hours=1):
+            return
+        self._last_prune = now
+        await database_sync_to_async(prune_events)()
+
+
+dispatcher = OutboxDispatcher()
+
+
+class OutboxDispatcherMiddleware:
+    """
+    ASGI middleware that starts the dispatcher on the server event loop,
+    so group_send runs on the same loop as the WebSocket consumers
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not dispatcher.running:
+            dispatcher.attach(asyncio.get_running_loop())
+        return await self.app(scope, receive, send)
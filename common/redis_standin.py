@@ -0,0 +1,179 @@
+"""
+Minimal Redis-compatible server for local multi-worker testing
+
+Speaks enough of the RESP2/RESP3 protocol for channels_redis.pubsub.RedisPubSubChannelLayer
+(PING, HELLO, CLIENT, SELECT, AUTH, PUBLISH, SUBSCRIBE, UNSUBSCRIBE), so two
+daphne workers (or two channel layers in one test) can share groups without a
+real Redis. The core RedisChannelLayer needs Lua scripting and is not supported.
+
+Usage:
+    standin = RedisStandIn(port=0).start()   # background thread, random port
+    ...
+    standin.stop()
+
+Or from the command line: python manage.py run_redis_standin --port 6379
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class RedisStandIn:
+    """In-process Redis stand-in that only supports pub/sub"""
+
+    def __init__(self, host='127.0.0.1', port=6379):
+        self.host = host
+        self.port = port
+        self._subscribers = defaultdict(set)  # channel -> set of clients
+        self._protocols = {}  # client -> negotiated RESP version
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'redis://{self.host}:{self.port}'
+
+    async def serve(self):
+        """Start listening on the running event loop"""
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    def start(self):
+        """Run the server on its own event loop in a daemon thread"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='redis-standin', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for writers in self._subscribers.values():
+                for writer in writers:
+                    writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    async def _handle_client(self, reader, writer):
+        subscribed = set()
+        self._protocols[writer] = 2
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                if command:
+                    self._execute(command, writer, subscribed)
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self._subscribers.get(channel, set()).discard(writer)
+            self._protocols.pop(writer, None)
+            writer.close()
+
+    async def _read_command(self, reader):
+        """Read one command, either a RESP array of bulk strings or an inline command"""
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.strip().split()
+
+        args = []
+        for _ in range(int(line[1:])):
+            header = await reader.readline()
+            length = int(header[1:])
+            data = await reader.readexactly(length + 2)
+            args.append(data[:-2])
+        return args
+
+    def _push(self, writer, items):
+        """Pub/sub replies are arrays in RESP2 and push frames in RESP3"""
+        writer.write(_array(items, b'>' if self._protocols.get(writer) == 3 else b'*'))
+
+    def _execute(self, args, writer, subscribed):
+        name = args[0].upper()
+
+        if name == b'PING':
+            if subscribed:
+                self._push(writer, [b'pong', args[1] if len(args) > 1 else b''])
+            else:
+                writer.write(_bulk(args[1]) if len(args) > 1 else b'+PONG\r\n')
+        elif name == b'HELLO':
+            protocol = int(args[1]) if len(args) > 1 else self._protocols[writer]
+            if protocol not in (2, 3):
+                writer.write(b'-NOPROTO unsupported protocol version\r\n')
+                return
+            self._protocols[writer] = protocol
+            info = [b'server', b'redis', b'version', b'7.0.0', b'proto', protocol]
+            if protocol == 3:
+                writer.write(b'%3\r\n' + b''.join(_encode(item) for item in info))
+            else:
+                writer.write(_array(info))
+        elif name in (b'CLIENT', b'SELECT', b'AUTH'):
+            writer.write(b'+OK\r\n')
+        elif name == b'PUBLISH':
+            channel, message = args[1], args[2]
+            receivers = list(self._subscribers.get(channel, ()))
+            for receiver in receivers:
+                self._push(receiver, [b'message', channel, message])
+            writer.write(_integer(len(receivers)))
+        elif name == b'SUBSCRIBE':
+            for channel in args[1:]:
+                subscribed.add(channel)
+                self._subscribers[channel].add(writer)
+                self._push(writer, [b'subscribe', channel, len(subscribed)])
+        elif name == b'UNSUBSCRIBE':
+            channels = args[1:] or sorted(subscribed)
+            if not channels:
+                self._push(writer, [b'unsubscribe', None, 0])
+            for channel in channels:
+                subscribed.discard(channel)
+                receivers = self._subscribers.get(channel, set())
+                receivers.discard(writer)
+                if not receivers:
+                    self._subscribers.pop(channel, None)
+                self._push(writer, [b'unsubscribe', channel, len(subscribed)])
+        else:
+            writer.write(b'-ERR unknown command \'' + name + b'\'\r\n')
+
+
+def _bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, str):
+        value = value.encode()
+    return b'$' + str(len(value)).encode() + b'\r\n' + value + b'\r\n'
+
+
+def _integer(value):
+    return b':' + str(value).encode() + b'\r\n'
+
+
+def _encode(item):
+    return _integer(item) if isinstance(item, int) else _bulk(item)
+
+
+def _array(items, marker=b'*'):
+    return marker + str(len(items)).encode() + b'\r\n' + b''.join(_encode(item) for item in items)
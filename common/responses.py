@@ -0,0 +1,27 @@
+"""
+Responses shared by DRF and plain Django (async) views
+"""
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+
+def not_modified(request, etag):
+    """304 response when the request's If-None-Match matches the ETag, else None"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    return None
+
+
+class JSONResponse(HttpResponse):
+    """
+    Data rendered by DRF's JSONRenderer, byte for byte what a DRF Response
+    with the same data returns to a JSON client
+    """
+
+    def __init__(self, data, status=200, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(JSONRenderer().render(data), status=status, **kwargs)
@@ -1,3 +1,346 @@
+from collections import namedtuple
+from contextlib import redirect_stdout
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User, Role, UserRole
+from catalog.models import ProductCategory, Product, ProductTag
+from clinic.models import Room, Device, Patient, PatientAssignment
+from common.benchmarks import SCENARIOS, BenchmarkContext, compare_results, run_scenario
+from common.models import OutboxEvent
+from common.outbox import claim_events, dispatch_pending
+from feedbacks.models import Feedback
+from inventory.models import InventoryBalance
+from orders.models import Order, OrderItem
+
+
+# A GET route, the most queries it may run (authentication excluded), its URL
+# arguments (names of objects created in setUp) and query string. The query
+# count must also be the same whether the tables hold SMALL or LARGE rows: a
+# count that grows with the data is an N+1. Declare every new route here.
+Route = namedtuple('Route', ['name', 'budget', 'args', 'params', 'auth'], defaults=[(), {}, 'admin'])
+
+ROUTES = [
+    Route('accounts:me', budget=1),
+    Route('accounts:admin-users-list', budget=4),
+    Route('accounts:admin-users-detail', args=('admin',), budget=3),
+    Route('clinic:room-list', budget=2),
+    Route('clinic:room-detail', args=('room',), budget=1),
+    Route('clinic:patient-list', budget=2),
+    Route('clinic:patient-detail', args=('patient',), budget=1),
+    Route('clinic:patient-assignments', args=('patient',), budget=3),
+    Route('clinic:patient-feedbacks', args=('patient',), budget=3),
+    Route('clinic:patient-orders', args=('patient',), budget=5),
+    Route('clinic:patient-full-details', args=('patient',), budget=7),
+    Route('clinic:device-list', budget=3),
+    Route('clinic:device-detail', args=('device',), budget=2),
+    Route('clinic:patient-assignment-list', budget=2),
+    Route('clinic:patient-assignment-my-active', budget=2),
+    Route('clinic:patient-assignment-detail', args=('assignment',), budget=1),
+    Route('category-list', budget=2),
+    Route('category-detail', args=('category',), budget=1),
+    Route('product-list', budget=3),
+    Route('product-detail', args=('product',), budget=2),
+    Route('tag-list', budget=2),
+    Route('tag-detail', args=('tag',), budget=1),
+    Route('inventory-balance-list', budget=2),
+    Route('inventory-balance-all-products', budget=1),
+    Route('inventory-balance-detail', args=('balance',), budget=1),
+    Route('dashboard-stats', budget=14),
+    Route('order-list', budget=4),
+    Route('order-order-queue', budget=3),
+    Route('order-queue-changes', budget=3),
+    Route('order-detail', args=('order',), budget=3),
+    Route('feedback-list', budget=2),
+    Route('feedback-stats', budget=3),
+    Route('feedback-detail', args=('feedback',), budget=1),
+    Route('reports-daily-orders', params={'from': '2025-01-01', 'to': '2025-01-31'}, budget=1),
+    Route('reports-top-products', params={'from': '2025-01-01', 'to': '2025-01-31'}, budget=1),
+    Route('reports-ratings-summary', params={'from': '2025-01-01', 'to': '2025-01-31'}, budget=1),
+    Route('reports-product-ratings', params={'from': '2025-01-01', 'to': '2025-01-31'}, budget=1),
+    Route('reports-endpoints', budget=0),
+    Route('health', budget=0, auth=None),
+    Route('menu', budget=4, auth=None),
+    Route('featured-product', budget=2, auth=None),
+    Route('most-ordered-products', budget=3, auth=None),
+    Route('category-products', args=('category',), budget=2, auth=None),
+    Route('category-most-ordered', args=('category',), budget=3, auth=None),
+    Route('carousel-categories', budget=1, auth=None),
+    Route('public-category-list', budget=2, auth=None),
+    Route('public-category-detail', args=('category',), budget=1, auth=None),
+    Route('public-product-list', budget=3, auth=None),
+    Route('public-product-detail', args=('product',), budget=2, auth=None),
+    Route('public-order-active', params={'device_uid': 'IPAD-MAIN'}, budget=3, auth=None),
+    Route('public-order-by-assignment', args=('assignment',), budget=4, auth=None),
+    Route('clinic_public:kiosk-active-patient', args=('device_uid',), budget=3, auth=None),
+    Route('async-menu', budget=4, auth=None),
+    Route('async-featured-product', budget=2, auth=None),
+    Route('async-most-ordered-products', budget=3, auth=None),
+    Route('async-public-order-active', params={'device_uid': 'IPAD-MAIN'}, budget=3, auth=None),
+    Route('clinic_public:async-kiosk-active-patient', args=('device_uid',), budget=3, auth=None),
+]
+
+# GET routes without a budget: router index pages and the one-off setup
+# endpoint (it writes). Every other GET route must be in ROUTES.
+UNBUDGETED = {'api-root', 'accounts:api-root', 'clinic:api-root', 'accounts:init-db'}
+UNBUDGETED_NAMESPACES = {'admin'}
+
+
+def get_routes(patterns, namespace=None):
+    """Names of the URL patterns that answer GET, with their namespace"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            inner = namespace
+            if pattern.namespace:
+                inner = f'{namespace}:{pattern.namespace}' if namespace else pattern.namespace
+            yield from get_routes(pattern.url_patterns, inner)
+            continue
+        if not pattern.name:
+            continue
+
+        actions = getattr(pattern.callback, 'actions', None)  # ViewSet routes
+        view_class = getattr(pattern.callback, 'cls', None)  # APIView and @api_view
+        if actions is not None:
+            answers_get = 'get' in actions
+        elif view_class is not None:
+            answers_get = hasattr(view_class, 'get')
+        else:
+            # Plain (async) Django views
+            answers_get = True
+        if answers_get:
+            yield f'{namespace}:{pattern.name}' if namespace else pattern.name
+
+
+# Async kiosk reads and the sync view whose JSON they must return
+ASYNC_ROUTES = {
+    'async-menu': 'menu',
+    'async-featured-product': 'featured-product',
+    'async-most-ordered-products': 'most-ordered-products',
+    'async-public-order-active': 'public-order-active',
+    'clinic_public:async-kiosk-active-patient': 'clinic_public:kiosk-active-patient',
+}
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every read route runs a bounded number of queries, whatever the data size
+    """
+
+    SMALL = 10
+    LARGE = 60
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        self.staff_role = Role.objects.get_or_create(name=Role.STAFF)[0]
+        UserRole.objects.create(user=self.admin, role=Role.objects.get_or_create(name=Role.ADMIN)[0])
+
+        self.category = ProductCategory.objects.create(name='Bebidas', category_type='DRINK', show_in_carousel=True)
+        self.product = Product.objects.create(name='Agua', category=self.category, is_featured=True)
+        self.tag = ProductTag.objects.create(name='Sin azucar')
+        self.product.tags.add(self.tag)
+        self.room = Room.objects.create(code='100')
+        self.device = Device.objects.create(device_uid='IPAD-MAIN', room=self.room)
+        self.device.assigned_staff.add(self.admin)
+        self.patient = Patient.objects.create(full_name='Main Patient', phone_e164='+15550000000')
+        self.assignment = PatientAssignment.objects.create(
+            patient=self.patient, staff=self.admin, device=self.device, room=self.room
+        )
+        self.objects = {
+            'admin': self.admin,
+            'room': self.room,
+            'patient': self.patient,
+            'device': self.device,
+            'device_uid': self.device.device_uid,
+            'assignment': self.assignment,
+            'category': self.category,
+            'product': self.product,
+            'tag': self.tag,
+            'balance': InventoryBalance.objects.get(product=self.product),
+        }
+        self.seeded = 0
+
+    def seed(self, size):
+        """
+        Add rows until every table holds `size` rows; orders and feedbacks go
+        to the main patient, so its detail routes grow too
+        """
+        start, self.seeded = self.seeded, size
+        new = range(start, size)
+
+        users = User.objects.bulk_create([
+            User(email=f'staff{i}@example.com', full_name=f'Staff {i}') for i in new
+        ])
+        UserRole.objects.bulk_create([UserRole(user=user, role=self.staff_role) for user in users])
+        categories = ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'Category {i}', category_type='FOOD', show_in_carousel=True) for i in new
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', category=category, is_featured=True)
+            for i, category in zip(new, categories)
+        ])
+        InventoryBalance.objects.bulk_create([InventoryBalance(product=product, on_hand=5) for product in products])
+        tags = ProductTag.objects.bulk_create([ProductTag(name=f'Tag {i}') for i in new])
+        Product.tags.through.objects.bulk_create([
+            Product.tags.through(product=product, producttag=tag) for product, tag in zip(products, tags)
+        ])
+        rooms = Room.objects.bulk_create([Room(code=f'R{i}') for i in new])
+        devices = Device.objects.bulk_create([
+            Device(device_uid=f'IPAD-{i}', room=room) for i, room in zip(new, rooms)
+        ])
+        Device.assigned_staff.through.objects.bulk_create([
+            Device.assigned_staff.through(device=device, user=user) for device, user in zip(devices, users)
+        ])
+        patients = Patient.objects.bulk_create([
+            Patient(full_name=f'Patient {i}', phone_e164=f'+1555100{i:04d}') for i in new
+        ])
+        PatientAssignment.objects.bulk_create([
+            PatientAssignment(patient=patient, staff=self.admin, device=device, room=device.room)
+            for patient, device in zip(patients, devices)
+        ])
+
+        orders = Order.objects.bulk_create([
+            Order(
+                assignment=self.device,
+                patient_assignment=self.assignment,
+                patient=self.patient,
+                room=self.room,
+                status=['PLACED', 'PREPARING', 'READY', 'DELIVERED'][i % 4]
+            )
+            for i in new
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1)
+            for order, product in zip(orders, products)
+        ] + [OrderItem(order=order, product=self.product, quantity=2) for order in orders])
+        feedbacks = Feedback.objects.bulk_create([
+            Feedback(
+                patient_assignment=self.assignment,
+                patient=self.patient,
+                room=self.room,
+                staff=self.admin,
+                staff_rating=5,
+                stay_rating=4
+            )
+            for _ in new
+        ])
+        self.objects.setdefault('order', orders[0])
+        self.objects.setdefault('feedback', feedbacks[0])
+
+    def count_queries(self, route):
+        args = [getattr(self.objects[name], 'pk', self.objects[name]) for name in route.args]
+        self.client.force_authenticate(self.admin if route.auth == 'admin' else None)
+        # Nothing served from the caches (dashboard, menu, kiosk session)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(route.name, args=args), route.params)
+        self.assertEqual(response.status_code, 200, f'{route.name}: {response.status_code}')
+        return len(queries)
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.seed(self.SMALL)
+        small = {route.name: self.count_queries(route) for route in ROUTES}
+        self.seed(self.LARGE)
+        large = {route.name: self.count_queries(route) for route in ROUTES}
+
+        for route in ROUTES:
+            with self.subTest(route=route.name):
+                self.assertEqual(
+                    large[route.name], small[route.name],
+                    f'{route.name} runs {small[route.name]} queries with {self.SMALL} rows '
+                    f'and {large[route.name]} with {self.LARGE}'
+                )
+                self.assertLessEqual(large[route.name], route.budget, f'{route.name} is over its query budget')
+
+    def test_every_get_route_has_a_budget(self):
+        declared = {route.name for route in ROUTES}
+        missing = sorted(
+            name for name in set(get_routes(get_resolver().url_patterns))
+            if name not in declared and name not in UNBUDGETED and name.split(':')[0] not in UNBUDGETED_NAMESPACES
+        )
+        self.assertEqual(missing, [], 'GET routes without a query budget, declare them in ROUTES')
+
+    def test_async_routes_return_the_same_json(self):
+        self.seed(self.SMALL)
+        for route in ROUTES:
+            if route.name not in ASYNC_ROUTES:
+                continue
+            with self.subTest(route=route.name):
+                args = [getattr(self.objects[name], 'pk', self.objects[name]) for name in route.args]
+                expected = self.client.get(reverse(ASYNC_ROUTES[route.name], args=args), route.params)
+                response = async_to_sync(self.async_client.get)(reverse(route.name, args=args), route.params)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response['Content-Type'], expected['Content-Type'])
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+
+class BenchmarkTests(TestCase):
+    """
+    Every benchmark scenario runs cleanly on synthetic data, regressions are flagged
+    """
+
+    def test_scenarios_run_without_errors(self):
+        call_command(
+            'generate_synthetic_data', rooms=3, staff=2, patients=10, days=3, orders_per_day=10,
+            end_date='2025-01-31', stdout=StringIO()
+        )
+        cache.clear()
+        context = BenchmarkContext()
+        context.top_up_stock(100)
+
+        for name in SCENARIOS:
+            with self.subTest(scenario=name):
+                result = run_scenario(name, context, requests=3, concurrency=1)
+                self.assertEqual((result['requests'], result['errors']), (3, 0))
+                self.assertIsNotNone(result['avg_queries'])
+
+    def test_compare_results(self):
+        result = {'scale': 'small', 'concurrency': 1, 'scenario': 'menu', 'p95_ms': 10.0, 'avg_queries': 1, 'errors': 0}
+        baseline = {'results': [result]}
+
+        _, regressions = compare_results(baseline, {'results': [{**result, 'p95_ms': 11.0}]})
+        self.assertEqual(regressions, [])
+        _, regressions = compare_results(baseline, {'results': [{**result, 'p95_ms': 20.0, 'avg_queries': 2}]})
+        self.assertEqual(regressions[0]['problems'], ['p95 10.0 -> 20.0 ms', 'queries 1 -> 2'])
+
+
+class OutboxTests(TestCase):
+    """
+    Events are leased while they are sent and only marked dispatched once group_send returned
+    """
+
+    def setUp(self):
+        self.first = OutboxEvent.objects.create(group='staff_1', payload={'type': 'groups_changed'})
+        self.second = OutboxEvent.objects.create(group='staff_1', payload={'type': 'groups_changed'})
+
+    def test_events_of_a_dead_dispatcher_are_claimed_again(self):
+        self.assertEqual(claim_events(10), [self.first, self.second])
+        # Leased, the dispatcher is still sending
+        self.assertEqual(claim_events(10), [])
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=False).exists())
+
+        OutboxEvent.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_events(10), [self.first, self.second])
+
+    def test_only_sent_events_are_marked_dispatched(self):
+        layer = mock.Mock(group_send=mock.AsyncMock(side_effect=[None, ConnectionError('layer down')]))
+        with mock.patch('common.outbox.get_channel_layer', return_value=layer), redirect_stdout(StringIO()):
+            self.assertEqual(async_to_sync(dispatch_pending)(), 2)
 
-# Create your tests here.
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertIsNotNone(self.first.dispatched_at)
+        self.assertEqual((self.second.dispatched_at, self.second.claimed_until, self.second.attempts), (None, None, 1))
+        self.assertEqual(claim_events(10), [self.second])
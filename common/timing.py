@@ -0,0 +1,281 @@
+"""
+Per-request timing instrumentation
+
+RequestTimingMiddleware measures every request that resolves to a view:
+total time, number of queries and time spent in the database, in DRF
+serializers (.data) and queuing channel-layer broadcasts (common.outbox).
+The figures are returned in a Server-Timing header (visible in the browser
+dev tools), printed as one JSON line for a sample of the requests (and for
+every request slower than REQUEST_TIMING_SLOW_MS), and kept per endpoint.
+
+Each process keeps the last REQUEST_TIMING_WINDOW samples of every endpoint
+and copies them to the cache every REQUEST_TIMING_FLUSH_INTERVAL seconds;
+worst_endpoints() merges the samples of all the processes. The sections
+overlap: queries run while serializing count in both db and serializer.
+"""
+import contextvars
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+
+
+WORKERS_KEY = 'timing:workers'
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+SECTIONS = ('db', 'serializer', 'channels')
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RequestTimings:
+    """Time spent per section (seconds) and query count of one request"""
+
+    def __init__(self):
+        self.sections = defaultdict(float)
+        self.queries = 0
+        self._depth = defaultdict(int)
+
+    def __call__(self, execute, sql, params, many, context):
+        # Called by _record_query for the queries of this request
+        self.queries += 1
+        with self.section('db'):
+            return execute(sql, params, many, context)
+
+    @contextmanager
+    def section(self, name):
+        # Nested sections of the same name (a serializer using another one) count once
+        self._depth[name] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[name] -= 1
+            if not self._depth[name]:
+                self.sections[name] += time.perf_counter() - start
+
+
+@contextmanager
+def timed(name):
+    """Count the enclosed block in the `name` section of the current request, if any"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    with timings.section(name):
+        yield
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def _install_query_hook(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def instrument_connections():
+    """
+    Count the queries of the current request on every connection, so the
+    queries that async views run in sync_to_async threads count too
+    """
+    connection_created.connect(_install_query_hook, dispatch_uid='common.timing.queries')
+
+
+def instrument_serializers():
+    """Time BaseSerializer.data, which every DRF serializer goes through"""
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, 'timed', False):
+        return
+
+    def timed_data(self):
+        with timed('serializer'):
+            return data.fget(self)
+
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
+
+
+class EndpointStats:
+    """
+    Recent samples per endpoint in this process, copied to the cache periodically
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._counts = defaultdict(int)
+        self._last_flush = 0
+
+    def record(self, endpoint, duration_ms, queries):
+        window = _setting('REQUEST_TIMING_WINDOW', 200)
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None or samples.maxlen != window:
+                samples = self._samples[endpoint] = deque(samples or (), maxlen=window)
+            samples.append((round(duration_ms, 2), queries))
+            self._counts[endpoint] += 1
+        if time.monotonic() - self._last_flush >= _setting('REQUEST_TIMING_FLUSH_INTERVAL', 10):
+            self.flush()
+
+    def flush(self):
+        """Publish the samples of this process to the cache"""
+        interval = _setting('REQUEST_TIMING_FLUSH_INTERVAL', 10)
+        with self._lock:
+            self._last_flush = time.monotonic()
+            snapshot = {
+                endpoint: {'count': self._counts[endpoint], 'samples': list(samples)}
+                for endpoint, samples in self._samples.items()
+            }
+        # Processes that stop flushing drop out after a while
+        ttl = max(interval * 30, 300)
+        cache.set(f'timing:worker:{WORKER_ID}', snapshot, ttl)
+        workers = cache.get(WORKERS_KEY) or {}
+        now = time.time()
+        workers = {worker: seen for worker, seen in workers.items() if now - seen < ttl}
+        workers[WORKER_ID] = now
+        cache.set(WORKERS_KEY, workers, None)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+endpoint_stats = EndpointStats()
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def worst_endpoints(order_by='p95', limit=20):
+    """
+    Endpoints sorted by 95th percentile duration ('p95') or average query count ('queries')
+    """
+    endpoint_stats.flush()
+    workers = cache.get(WORKERS_KEY) or {}
+    snapshots = cache.get_many([f'timing:worker:{worker}' for worker in workers]).values()
+
+    merged = defaultdict(lambda: {'count': 0, 'samples': []})
+    for snapshot in snapshots:
+        for endpoint, data in snapshot.items():
+            merged[endpoint]['count'] += data['count']
+            merged[endpoint]['samples'].extend(data['samples'])
+
+    rows = []
+    for endpoint, data in merged.items():
+        durations = [duration for duration, _ in data['samples']]
+        queries = [count for _, count in data['samples']]
+        rows.append({
+            'endpoint': endpoint,
+            'requests': data['count'],
+            'samples': len(durations),
+            'p50_ms': _percentile(durations, 0.5),
+            'p95_ms': _percentile(durations, 0.95),
+            'max_ms': max(durations),
+            'avg_queries': round(sum(queries) / len(queries), 1),
+            'max_queries': max(queries),
+        })
+
+    sort_key = 'avg_queries' if order_by == 'queries' else 'p95_ms'
+    rows.sort(key=lambda row: row[sort_key], reverse=True)
+    return rows[:limit]
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return f'{request.method} {match.view_name or match.route}'
+
+
+class RequestTimingMiddleware:
+    """
+    Measure each request and report it (Server-Timing header, sampled log, endpoint stats)
+    Works both ways, so async views stay on the event loop under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _setting('REQUEST_TIMING_ENABLED', True):
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._report(request, response, timings, start)
+
+    async def __acall__(self, request):
+        if not _setting('REQUEST_TIMING_ENABLED', True):
+            return await self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._report(request, response, timings, start)
+
+    def _report(self, request, response, timings, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        endpoint = _endpoint(request)
+        if endpoint is None:
+            return response
+
+        metrics = [f'{name};dur={timings.sections[name] * 1000:.1f}' for name in SECTIONS]
+        metrics[0] += f';desc="{timings.queries} queries"'
+        metrics.append(f'total;dur={duration_ms:.1f}')
+        response['Server-Timing'] = ', '.join(metrics)
+
+        endpoint_stats.record(endpoint, duration_ms, timings.queries)
+
+        slow = duration_ms >= _setting('REQUEST_TIMING_SLOW_MS', 1000)
+        if slow or random.random() < _setting('REQUEST_TIMING_LOG_SAMPLE_RATE', 0.01):
+            print(json.dumps({
+                'event': 'request_timing',
+                'endpoint': endpoint,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 1),
+                'queries': timings.queries,
+                **{f'{name}_ms': round(timings.sections[name] * 1000, 1) for name in SECTIONS},
+                'slow': slow,
+            }))
+
+        return response
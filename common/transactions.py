@@ -0,0 +1,25 @@
+"""
+After-commit work that must never fail the request that committed
+
+transaction.on_commit() callbacks run once the data is already committed:
+an exception raised there reaches the view after the fact and turns a
+successful write into a 500. robust_on_commit() runs the callback with
+robust=True instead and prints what was lost, so derived data (rollups,
+counters) can be repaired with its rebuild command.
+"""
+from django.db import transaction
+
+
+def robust_on_commit(func, failure_message):
+    """
+    Run func() after the current transaction commits; a failure is printed
+    with `failure_message` and logged by Django, never raised to the caller
+    """
+    def run():
+        try:
+            func()
+        except Exception as e:
+            print(f'{failure_message}: {e}')
+            raise
+
+    transaction.on_commit(run, robust=True)
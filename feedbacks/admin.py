@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Feedback
+from .models import Feedback, ProductRating
 
 
 @admin.register(Feedback)
@@ -21,3 +21,12 @@ class FeedbackAdmin(admin.ModelAdmin):
             'fields': ('created_at',)
         }),
     )
+
+
+@admin.register(ProductRating)
+class ProductRatingAdmin(admin.ModelAdmin):
+    list_display = ['id', 'feedback', 'order', 'product', 'rating', 'created_at']
+    list_filter = ['rating', 'created_at']
+    search_fields = ['product__name', 'feedback__id', 'order__id']
+    readonly_fields = ['feedback', 'order', 'product', 'rating', 'created_at']
+    date_hierarchy = 'created_at'
@@ -0,0 +1,27 @@
+"""
+Management command to create ProductRating rows for feedbacks that have none
+The 0005 migration backfills existing data; run this after importing feedbacks
+written without the normalized rating rows.
+Usage: python manage.py backfill_product_rating_facts [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from feedbacks.ratings import backfill_rating_facts
+
+
+class Command(BaseCommand):
+    help = 'Normalizes Feedback.product_ratings into ProductRating rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Feedbacks written per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        self.stdout.write('Backfilling product ratings...')
+        processed, created = backfill_rating_facts(batch_size=batch_size, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} feedbacks, {created} product ratings created'
+        ))
@@ -0,0 +1,26 @@
+"""
+Management command to recompute product rating aggregates from all feedbacks
+Streams the feedback history once and rewrites rating, rating_count and rating_sum.
+Usage: python manage.py rebuild_product_ratings [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from feedbacks.ratings import rebuild_product_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recomputes product rating sum, count and average from the feedback history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Feedbacks fetched per round trip')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        self.stdout.write('Rebuilding product ratings...')
+        processed, products = rebuild_product_ratings(batch_size=batch_size, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} feedbacks, {products} products rated'
+        ))
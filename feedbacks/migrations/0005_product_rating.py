@@ -0,0 +1,78 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:03
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_product_ratings(apps, schema_editor):
+    """Normalize the product_ratings JSON of existing feedbacks"""
+    Feedback = apps.get_model('feedbacks', 'Feedback')
+    ProductRating = apps.get_model('feedbacks', 'ProductRating')
+    Product = apps.get_model('catalog', 'Product')
+    Order = apps.get_model('orders', 'Order')
+
+    product_ids = set(Product.objects.values_list('id', flat=True))
+    order_ids = set(Order.objects.values_list('id', flat=True))
+
+    rows = []
+    feedbacks = Feedback.objects.exclude(product_ratings={}).values_list('id', 'created_at', 'product_ratings')
+    for feedback_id, created_at, product_ratings in feedbacks.iterator(chunk_size=500):
+        for order_id, order_ratings in product_ratings.items():
+            try:
+                order_id = int(order_id)
+            except (ValueError, TypeError):
+                order_id = None
+            for product_id, rating in order_ratings.items():
+                try:
+                    product_id = int(product_id)
+                except (ValueError, TypeError):
+                    continue
+                if product_id in product_ids and rating is not None and 0 <= rating <= 5:
+                    rows.append(ProductRating(
+                        feedback_id=feedback_id,
+                        order_id=order_id if order_id in order_ids else None,
+                        product_id=product_id,
+                        rating=rating,
+                        created_at=created_at
+                    ))
+        if len(rows) >= 1000:
+            ProductRating.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    ProductRating.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_product_rating_sum'),
+        ('feedbacks', '0004_update_feedback_structure'),
+        ('orders', '0002_order_patient_assignment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField(help_text='Product rating (0-5 stars)', validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(5)], verbose_name='rating')),
+                ('created_at', models.DateTimeField(help_text='Copy of the feedback creation time', verbose_name='created at')),
+                ('feedback', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='feedbacks.feedback', verbose_name='feedback')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='product_ratings', to='orders.order', verbose_name='order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feedback_ratings', to='catalog.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'product rating',
+                'verbose_name_plural': 'product ratings',
+                'ordering': ['-created_at'],
+                'indexes': [
+                    models.Index(fields=['product', '-created_at'], name='feedbacks_p_product_6b4778_idx'),
+                    models.Index(fields=['-created_at'], name='feedbacks_p_created_31e87a_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('feedback', 'order', 'product'), name='unique_feedback_order_product_rating'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_product_ratings, migrations.RunPython.noop),
+    ]
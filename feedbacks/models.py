@@ -89,3 +89,54 @@ class Feedback(models.Model):
     def __str__(self):
         staff_name = self.staff.full_name if self.staff else 'Unknown'
         return f'Feedback for Assignment #{self.patient_assignment.id} - Staff: {self.staff_rating}/5 - Stay: {self.stay_rating}/5 - Attended by {staff_name}'
+
+
+class ProductRating(models.Model):
+    """
+    One product rating of a feedback, normalized out of Feedback.product_ratings
+    so rating reports can be answered with SQL aggregates
+    """
+    feedback = models.ForeignKey(
+        Feedback,
+        on_delete=models.CASCADE,
+        related_name='ratings',
+        verbose_name=_('feedback')
+    )
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='product_ratings',
+        verbose_name=_('order')
+    )
+    product = models.ForeignKey(
+        'catalog.Product',
+        on_delete=models.CASCADE,
+        related_name='feedback_ratings',
+        verbose_name=_('product')
+    )
+    rating = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(0), MaxValueValidator(5)],
+        verbose_name=_('rating'),
+        help_text=_('Product rating (0-5 stars)')
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_('created at'),
+        help_text=_('Copy of the feedback creation time')
+    )
+
+    class Meta:
+        verbose_name = _('product rating')
+        verbose_name_plural = _('product ratings')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', '-created_at']),
+            models.Index(fields=['-created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['feedback', 'order', 'product'], name='unique_feedback_order_product_rating'),
+        ]
+
+    def __str__(self):
+        return f'Product #{self.product_id}: {self.rating}/5 (Feedback #{self.feedback_id})'
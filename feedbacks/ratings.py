@@ -0,0 +1,162 @@
+"""
+Product rating aggregates and facts
+
+Product keeps rating_sum and rating_count, and rating = rating_sum / rating_count.
+A new feedback only adds its own ratings to the products it rates, instead
+of rescanning every feedback ever submitted.
+
+Every rating is also stored as a ProductRating row (feedback, order, product,
+rating, created_at), so rating reports run as SQL aggregates.
+"""
+from decimal import Decimal
+
+from django.db.models import Exists, OuterRef
+
+from catalog.menu import catalog_changed
+from catalog.models import Product
+from orders.models import Order
+from .models import Feedback, ProductRating
+
+
+def iter_product_ratings(product_ratings):
+    """
+    Valid (order_id, product_id, rating) triples of a feedback
+    product_ratings format: {order_id: {product_id: rating (0-5)}}; order_id is None when not numeric
+    """
+    for order_id, order_ratings in product_ratings.items():
+        try:
+            order_id = int(order_id)
+        except (ValueError, TypeError):
+            order_id = None
+        for product_id, rating in order_ratings.items():
+            try:
+                product_id = int(product_id)
+            except (ValueError, TypeError):
+                continue
+            if rating is not None and 0 <= rating <= 5:
+                yield order_id, product_id, rating
+
+
+def _sum_ratings(product_ratings, totals=None):
+    """Add the ratings of a feedback to totals {product_id: (sum, count)}"""
+    totals = {} if totals is None else totals
+    for _, product_id, rating in iter_product_ratings(product_ratings):
+        rating_sum, rating_count = totals.get(product_id, (0, 0))
+        totals[product_id] = (rating_sum + rating, rating_count + 1)
+    return totals
+
+
+def _average(rating_sum, rating_count):
+    return round(Decimal(rating_sum) / rating_count, 1) if rating_count else Decimal('0')
+
+
+def _rating_facts(feedback, product_ids, order_ids):
+    """ProductRating rows of a feedback, skipping products that no longer exist"""
+    return [
+        ProductRating(
+            feedback_id=feedback.id,
+            order_id=order_id if order_id in order_ids else None,
+            product_id=product_id,
+            rating=rating,
+            created_at=feedback.created_at
+        )
+        for order_id, product_id, rating in iter_product_ratings(feedback.product_ratings)
+        if product_id in product_ids
+    ]
+
+
+def record_feedback_ratings(feedback):
+    """
+    Store the product ratings of a new feedback and add them to the aggregates
+    Call inside the feedback transaction; the rated products are locked and
+    the work grows with the number of rated items, not with the feedback history.
+    """
+    totals = _sum_ratings(feedback.product_ratings)
+    if not totals:
+        return
+
+    products = list(
+        Product.objects.select_for_update().filter(id__in=totals).order_by('id').only('id', 'rating', 'rating_count', 'rating_sum')
+    )
+    facts = _rating_facts(feedback, {product.id for product in products}, _existing_order_ids([feedback]))
+    ProductRating.objects.bulk_create(facts)
+
+    for product in products:
+        rating_sum, rating_count = totals[product.id]
+        product.rating_sum += rating_sum
+        product.rating_count += rating_count
+        product.rating = _average(product.rating_sum, product.rating_count)
+    Product.objects.bulk_update(products, ['rating', 'rating_count', 'rating_sum'])
+
+    # bulk_update sends no post_save, the menu shows ratings
+    catalog_changed()
+
+
+def _existing_order_ids(feedbacks):
+    """Ids of the rated orders that still exist"""
+    return set(Order.objects.filter(id__in={
+        order_id
+        for feedback in feedbacks
+        for order_id, _, _ in iter_product_ratings(feedback.product_ratings)
+        if order_id is not None
+    }).values_list('id', flat=True))
+
+
+def backfill_rating_facts(batch_size=500, stdout=None):
+    """
+    Create the ProductRating rows of feedbacks that have none yet
+    Safe to run repeatedly; feedbacks are streamed and written in batches.
+    """
+    product_ids = set(Product.objects.values_list('id', flat=True))
+    feedbacks = Feedback.objects.exclude(product_ratings={}).filter(
+        ~Exists(ProductRating.objects.filter(feedback=OuterRef('pk')))
+    ).only('id', 'created_at', 'product_ratings').order_by('id')
+
+    processed = 0
+    created = 0
+    batch = []
+
+    def flush():
+        order_ids = _existing_order_ids(batch)
+        rows = [row for feedback in batch for row in _rating_facts(feedback, product_ids, order_ids)]
+        ProductRating.objects.bulk_create(rows)
+        return len(rows)
+
+    for feedback in feedbacks.iterator(chunk_size=batch_size):
+        batch.append(feedback)
+        if len(batch) >= batch_size:
+            created += flush()
+            processed += len(batch)
+            batch = []
+            if stdout:
+                stdout.write(f'  {processed} feedbacks read')
+    if batch:
+        created += flush()
+        processed += len(batch)
+
+    return processed, created
+
+
+def rebuild_product_ratings(batch_size=500, stdout=None):
+    """
+    Recompute the aggregates of every rated product from the feedback history
+    Feedbacks are streamed with a server-side cursor, only the running totals
+    are kept in memory. Products without feedback ratings keep their values.
+    """
+    totals = {}
+    processed = 0
+    feedbacks = Feedback.objects.exclude(product_ratings={}).values_list('product_ratings', flat=True)
+    for product_ratings in feedbacks.iterator(chunk_size=batch_size):
+        _sum_ratings(product_ratings, totals)
+        processed += 1
+        if stdout and processed % batch_size == 0:
+            stdout.write(f'  {processed} feedbacks read')
+
+    products = list(Product.objects.filter(id__in=totals).only('id', 'rating', 'rating_count', 'rating_sum'))
+    for product in products:
+        product.rating_sum, product.rating_count = totals[product.id]
+        product.rating = _average(product.rating_sum, product.rating_count)
+    Product.objects.bulk_update(products, ['rating', 'rating_count', 'rating_sum'], batch_size=batch_size)
+    catalog_changed()
+
+    return processed, len(products)
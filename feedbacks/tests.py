@@ -1,3 +1,84 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from catalog.models import ProductCategory, Product
+from clinic.models import Room, Device, Patient, PatientAssignment
+from orders.models import Order
+from .models import Feedback, ProductRating
+
+
+class ProductRatingAggregateTests(TestCase):
+    """
+    A feedback adds its ratings to the product aggregates without rescanning history
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        drinks = ProductCategory.objects.create(name='Bebidas', category_type='DRINK')
+        self.water = Product.objects.create(name='Agua', category=drinks)
+        self.juice = Product.objects.create(name='Jugo', category=drinks)
+        self.staff = User.objects.create_user(email='staff@example.com', password='staff123', full_name='Staff')
+        self.room = Room.objects.create(code='101')
+        self.device = Device.objects.create(device_uid='IPAD-01', room=self.room)
+
+        # An earlier stay already rated the water with a 2
+        Feedback.objects.create(
+            room=self.room,
+            product_ratings={'1': {str(self.water.id): 2}},
+            staff_rating=4,
+            stay_rating=4
+        )
+        call_command('rebuild_product_ratings', stdout=StringIO())
+
+    def _assignment_with_delivered_order(self):
+        assignment = PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient', phone_e164='+15550000001'),
+            staff=self.staff,
+            device=self.device,
+            room=self.room,
+            survey_enabled=True
+        )
+        order = Order.objects.create(patient_assignment=assignment, room=self.room, status='DELIVERED')
+        return assignment, order
+
+    def test_feedback_updates_aggregates(self):
+        self.water.refresh_from_db()
+        self.assertEqual((self.water.rating_sum, self.water.rating_count), (2, 1))
+
+        assignment, order = self._assignment_with_delivered_order()
+        response = self.client.post(reverse('public-feedback-create'), {
+            'patient_assignment_id': assignment.id,
+            'product_ratings': {str(order.id): {str(self.water.id): 5, str(self.juice.id): 4}},
+            'staff_rating': 5,
+            'stay_rating': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.water.refresh_from_db()
+        self.juice.refresh_from_db()
+        self.assertEqual((self.water.rating_sum, self.water.rating_count), (7, 2))
+        self.assertEqual(float(self.water.rating), 3.5)
+        self.assertEqual((self.juice.rating_sum, self.juice.rating_count), (4, 1))
+
+        # Each rating is also stored as a normalized row linked to its order
+        facts = ProductRating.objects.filter(feedback__patient_assignment=assignment)
+        self.assertEqual(sorted(facts.values_list('product_id', 'rating')), [(self.water.id, 5), (self.juice.id, 4)])
+        self.assertTrue(all(fact.order_id == order.id for fact in facts))
+
+        # A rebuild from history lands on the same aggregates
+        Product.objects.update(rating=0, rating_count=0, rating_sum=0)
+        call_command('rebuild_product_ratings', batch_size=1, stdout=StringIO())
+        self.water.refresh_from_db()
+        self.assertEqual((self.water.rating_sum, self.water.rating_count), (7, 2))
+
+    def test_backfill_creates_missing_facts_once(self):
+        call_command('backfill_product_rating_facts', stdout=StringIO())
+        call_command('backfill_product_rating_facts', stdout=StringIO())
 
-# Create your tests here.
+        fact = ProductRating.objects.get()
+        self.assertEqual((fact.product_id, fact.rating, fact.order_id), (self.water.id, 2, None))
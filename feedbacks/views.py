@@ -7,8 +7,11 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from accounts.permissions import IsStaffOrAdmin
+from common.outbox import publish
+from orders.groups import device_group, publish_to_staff
 
 from .models import Feedback
+from .ratings import record_feedback_ratings
 from orders.models import Order
 from clinic.models import Device
 from .serializers import CreateFeedbackSerializer, FeedbackSerializer
@@ -101,44 +104,31 @@ class PublicFeedbackViewSet(viewsets.ViewSet):
                 # Automatically end patient assignment session after feedback is submitted
                 patient_assignment.end_care()
                 
-                # Broadcast session ended to kiosk via WebSocket
-                try:
-                    if patient_assignment.device:
-                        from channels.layers import get_channel_layer
-                        from asgiref.sync import async_to_sync
-                        channel_layer = get_channel_layer()
-                        async_to_sync(channel_layer.group_send)(
-                            f'device_{patient_assignment.device.id}',
-                            {
-                                'type': 'session_ended',
-                                'assignment_id': patient_assignment.id,
-                                'ended_at': patient_assignment.ended_at.isoformat(),
-                            }
-                        )
-                except Exception as ws_error:
-                    # Log but don't fail the request
-                    print(f'WebSocket broadcast failed: {ws_error}')
-
-                # Broadcast session ended to staff via WebSocket
-                try:
-                    from channels.layers import get_channel_layer
-                    from asgiref.sync import async_to_sync
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        'staff_orders',
+                # Broadcast session ended to kiosk via WebSocket (sent after commit)
+                if patient_assignment.device:
+                    publish(
+                        device_group(patient_assignment.device.id),
                         {
-                            'type': 'patient_assignment_ended',
+                            'type': 'session_ended',
                             'assignment_id': patient_assignment.id,
-                            'staff_id': patient_assignment.staff.id if patient_assignment.staff else None,
                             'ended_at': patient_assignment.ended_at.isoformat(),
                         }
                     )
-                except Exception as ws_error:
-                    # Log but don't fail the request
-                    print(f'WebSocket broadcast to staff failed: {ws_error}')
 
-                # Calculate and update product ratings averages
-                self._update_product_ratings(product_ratings)
+                # Broadcast session ended to the staff of this device and admins
+                publish_to_staff(
+                    {
+                        'type': 'patient_assignment_ended',
+                        'assignment_id': patient_assignment.id,
+                        'staff_id': patient_assignment.staff.id if patient_assignment.staff else None,
+                        'ended_at': patient_assignment.ended_at.isoformat(),
+                    },
+                    device_id=patient_assignment.device_id,
+                    staff_id=patient_assignment.staff_id
+                )
+
+                # Store the product ratings and add them to the product aggregates
+                record_feedback_ratings(feedback)
 
                 return Response({
                     'success': True,
@@ -157,49 +147,6 @@ class PublicFeedbackViewSet(viewsets.ViewSet):
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def _update_product_ratings(self, product_ratings):
-        """
-        Calculate and update product rating averages from all feedbacks
-        product_ratings format: {order_id: {product_id: rating (0-5)}}
-        """
-        from catalog.models import Product
-        
-        # Get all unique product IDs from this feedback
-        product_ids = set()
-        for order_id, order_ratings in product_ratings.items():
-            for product_id_str in order_ratings.keys():
-                try:
-                    product_ids.add(int(product_id_str))
-                except (ValueError, TypeError):
-                    continue
-
-        # Update each product's rating average
-        for product_id in product_ids:
-            try:
-                product = Product.objects.get(id=product_id)
-                
-                # Get all ratings for this product from all feedbacks
-                all_ratings = []
-                all_feedbacks = Feedback.objects.exclude(product_ratings={})
-                
-                for feedback in all_feedbacks:
-                    # Extract ratings for this product from all orders in this feedback
-                    for order_id, order_ratings in feedback.product_ratings.items():
-                        product_id_str = str(product_id)
-                        if product_id_str in order_ratings:
-                            rating = order_ratings[product_id_str]
-                            if rating is not None and 0 <= rating <= 5:
-                                all_ratings.append(rating)
-                
-                # Calculate average
-                if all_ratings:
-                    avg_rating = sum(all_ratings) / len(all_ratings)
-                    product.rating = round(avg_rating, 2)
-                    product.rating_count = len(all_ratings)
-                    product.save(update_fields=['rating', 'rating_count'])
-            except Product.DoesNotExist:
-                continue
-
 
 class FeedbackManagementViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -266,12 +213,30 @@ class FeedbackManagementViewSet(viewsets.ReadOnlyModelViewSet):
         # Get base queryset
         feedbacks = Feedback.objects.all()
 
+        today = timezone.now().date()
+        today_start = timezone.make_aware(timezone.datetime.combine(today, timezone.datetime.min.time()))
+        seven_days_ago = timezone.now() - timedelta(days=7)
+        recent = Q(created_at__gte=seven_days_ago)
+
+        # Every count and average in a single query
+        totals = feedbacks.aggregate(
+            total=Count('id'),
+            avg_staff=Avg('staff_rating'),
+            avg_stay=Avg('stay_rating'),
+            today=Count('id', filter=Q(created_at__gte=today_start)),
+            recent=Count('id', filter=recent),
+            recent_avg_staff=Avg('staff_rating', filter=recent),
+            recent_avg_stay=Avg('stay_rating', filter=recent),
+            **{f'staff_{i}': Count('id', filter=Q(staff_rating=i)) for i in range(0, 6)},
+            **{f'stay_{i}': Count('id', filter=Q(stay_rating=i)) for i in range(0, 6)}
+        )
+
         # Total feedbacks
-        total_feedbacks = feedbacks.count()
+        total_feedbacks = totals['total']
 
         # Average staff and stay ratings
-        avg_staff_rating = feedbacks.aggregate(avg=Avg('staff_rating'))['avg'] or 0
-        avg_stay_rating = feedbacks.aggregate(avg=Avg('stay_rating'))['avg'] or 0
+        avg_staff_rating = totals['avg_staff'] or 0
+        avg_stay_rating = totals['avg_stay'] or 0
         # Calculate overall average (average of staff and stay ratings)
         if avg_staff_rating and avg_stay_rating:
             average_rating = (avg_staff_rating + avg_stay_rating) / 2
@@ -283,26 +248,16 @@ class FeedbackManagementViewSet(viewsets.ReadOnlyModelViewSet):
             average_rating = 0
 
         # Today's feedbacks
-        today = timezone.now().date()
-        today_start = timezone.make_aware(timezone.datetime.combine(today, timezone.datetime.min.time()))
-        today_feedbacks = feedbacks.filter(created_at__gte=today_start).count()
+        today_feedbacks = totals['today']
 
         # Response rate calculation (based on patient assignments)
         from clinic.models import PatientAssignment
         total_ended_assignments = PatientAssignment.objects.filter(is_active=False).count()
         response_rate = (total_feedbacks / total_ended_assignments * 100) if total_ended_assignments > 0 else 0
 
-        # Staff rating distribution
-        staff_rating_distribution = {}
-        for i in range(0, 6):
-            count = feedbacks.filter(staff_rating=i).count()
-            staff_rating_distribution[str(i)] = count
-
-        # Stay rating distribution
-        stay_rating_distribution = {}
-        for i in range(0, 6):
-            count = feedbacks.filter(stay_rating=i).count()
-            stay_rating_distribution[str(i)] = count
+        # Staff and stay rating distributions
+        staff_rating_distribution = {str(i): totals[f'staff_{i}'] for i in range(0, 6)}
+        stay_rating_distribution = {str(i): totals[f'stay_{i}'] for i in range(0, 6)}
 
         # Top rated staff
         top_staff = feedbacks.filter(staff__isnull=False).values(
@@ -314,10 +269,8 @@ class FeedbackManagementViewSet(viewsets.ReadOnlyModelViewSet):
         ).order_by('-avg_rating')[:5]
 
         # Recent trends (last 7 days)
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        recent_feedbacks = feedbacks.filter(created_at__gte=seven_days_ago)
-        recent_avg_staff = recent_feedbacks.aggregate(avg=Avg('staff_rating'))['avg'] or 0
-        recent_avg_stay = recent_feedbacks.aggregate(avg=Avg('stay_rating'))['avg'] or 0
+        recent_avg_staff = totals['recent_avg_staff'] or 0
+        recent_avg_stay = totals['recent_avg_stay'] or 0
 
         return Response({
             'total_feedbacks': total_feedbacks,
@@ -331,5 +284,5 @@ class FeedbackManagementViewSet(viewsets.ReadOnlyModelViewSet):
             'top_staff': list(top_staff),
             'recent_average_staff': round(recent_avg_staff, 2),
             'recent_average_stay': round(recent_avg_stay, 2),
-            'recent_feedbacks_count': recent_feedbacks.count()
+            'recent_feedbacks_count': totals['recent']
         })
@@ -68,6 +68,18 @@ export const ordersApi = {
     return response.data;
   },
 
+  // Orders changed since `cursor` and tombstones of the ones that left the queue;
+  // without a cursor the whole queue
+  getOrderQueueChanges: async (statuses?: string, myOrders?: boolean, cursor?: string | null) => {
+    const params = new URLSearchParams();
+    if (statuses) params.append('status', statuses);
+    if (myOrders) params.append('my_orders', 'true');
+    if (cursor) params.append('cursor', cursor);
+    const queryString = params.toString() ? `?${params.toString()}` : '';
+    const response = await apiClient.get(`/orders/queue/changes/${queryString}`);
+    return response.data;
+  },
+
   changeOrderStatus: async (id: number, statusData: any) => {
     const response = await apiClient.patch(`/orders/${id}/status/`, statusData);
     return response.data;
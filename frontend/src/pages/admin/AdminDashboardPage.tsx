@@ -1,23 +1,47 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import { useAuth } from '../../auth/AuthContext';
 import { adminApi } from '../../api/admin';
+import { useWebSocket } from '../../hooks/useWebSocket';
 import Sidebar from '../../components/admin/Sidebar';
 import {
   BarChart, Bar, PieChart, Pie, Cell,
   XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer
 } from 'recharts';
 
+const WS_BASE_URL = import.meta.env.VITE_WS_BASE_URL || 'ws://localhost:8000';
+
 const NewAdminDashboardPage: React.FC = () => {
   const { user, logout } = useAuth();
   const [stats, setStats] = useState<any>(null);
   const [loading, setLoading] = useState(true);
 
+  // Live updates: full stats on connect, then only the panels that changed
+  const token = localStorage.getItem('access_token');
+  const wsUrl = `${WS_BASE_URL}/ws/admin/dashboard/?token=${token}`;
+
+  const handleMessage = useCallback((message: any) => {
+    if (message.type === 'dashboard_snapshot') {
+      setStats(message.stats);
+      setLoading(false);
+    } else if (message.type === 'dashboard_delta') {
+      setStats((current: any) => ({ ...current, ...message.panels }));
+    }
+  }, []);
+
+  const { isConnected } = useWebSocket({
+    url: wsUrl,
+    onMessage: handleMessage,
+  });
+
   useEffect(() => {
+    // Polling only while the live connection is down
+    if (isConnected) {
+      return;
+    }
     loadDashboardStats();
-    // Refresh every 30 seconds
     const interval = setInterval(loadDashboardStats, 30000);
     return () => clearInterval(interval);
-  }, []);
+  }, [isConnected]);
 
   const loadDashboardStats = async () => {
     try {
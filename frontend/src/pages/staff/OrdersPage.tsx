@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import { ordersApi } from '../../api/orders';
 import { useAuth } from '../../auth/AuthContext';
@@ -7,12 +7,30 @@ import { colors } from '../../styles/colors';
 
 const WS_BASE_URL = import.meta.env.VITE_WS_BASE_URL || 'ws://localhost:8000';
 
+// Apply a queue delta: newer versions replace, tombstones remove
+const mergeOrders = (current: any[], changed: any[], removed: any[]) => {
+  const byId = new Map(current.map((order) => [order.id, order]));
+  removed.forEach((tombstone) => {
+    const order = byId.get(tombstone.id);
+    if (order && order.version <= tombstone.version) byId.delete(tombstone.id);
+  });
+  changed.forEach((order) => {
+    const known = byId.get(order.id);
+    if (!known || known.version < order.version) byId.set(order.id, order);
+  });
+  return Array.from(byId.values()).sort(
+    (a, b) => new Date(b.placed_at).getTime() - new Date(a.placed_at).getTime()
+  );
+};
+
 const OrdersPage: React.FC = () => {
   const [windowWidth, setWindowWidth] = useState(window.innerWidth);
   const [orders, setOrders] = useState<any[]>([]);
   const [loading, setLoading] = useState(true);
   const [filter, setFilter] = useState<string>('PLACED,PREPARING');
   const { user, logout } = useAuth();
+  // Cursor of the last queue sync, null until the first full load of the filter
+  const cursorRef = useRef<string | null>(null);
 
   const handleLogout = async () => {
     await logout();
@@ -27,7 +45,7 @@ const OrdersPage: React.FC = () => {
     onMessage: (message: any) => {
       if (message.type === 'new_order') {
         console.log('✅ New order received:', message.order_id);
-        loadOrders();
+        syncOrders();
       }
     },
     onOpen: () => {
@@ -44,6 +62,7 @@ const OrdersPage: React.FC = () => {
   });
 
   useEffect(() => {
+    cursorRef.current = null;
     loadOrders();
   }, [filter]);
 
@@ -66,8 +85,9 @@ const OrdersPage: React.FC = () => {
       setLoading(true);
       // Admins see all orders, staff see only their assigned patient's orders
       const myOrdersFilter = !user?.is_superuser;
-      const response = await ordersApi.getOrderQueue(filter, myOrdersFilter);
+      const response = await ordersApi.getOrderQueueChanges(filter, myOrdersFilter);
       setOrders(response.orders);
+      cursorRef.current = response.cursor;
     } catch (err) {
       console.error('Failed to load orders:', err);
     } finally {
@@ -75,6 +95,26 @@ const OrdersPage: React.FC = () => {
     }
   };
 
+  // Fetch only the orders changed since the last load or sync
+  const syncOrders = async () => {
+    const cursor = cursorRef.current;
+    if (!cursor) {
+      loadOrders();
+      return;
+    }
+    try {
+      const myOrdersFilter = !user?.is_superuser;
+      const response = await ordersApi.getOrderQueueChanges(filter, myOrdersFilter, cursor);
+      // The filter changed (or another sync finished) meanwhile
+      if (cursorRef.current !== cursor) return;
+      setOrders((current) => mergeOrders(current, response.orders, response.removed));
+      cursorRef.current = response.cursor;
+    } catch (err) {
+      console.error('Failed to sync orders:', err);
+      cursorRef.current = null;
+    }
+  };
+
   const getStatusColor = (status: string) => {
     switch (status) {
       case 'PLACED':
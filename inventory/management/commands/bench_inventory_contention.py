@@ -0,0 +1,200 @@
+"""
+Management command to benchmark inventory reservation under contention
+Runs N threads placing orders against one hot product and compares the
+'locking' (select_for_update) and 'conditional' (guarded UPDATE) modes.
+Usage: python manage.py bench_inventory_contention --threads 8 --orders 50
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from accounts.models import User
+from catalog.models import ProductCategory, Product, ProductPopularity
+from clinic.models import Room, Device, Patient, PatientAssignment
+from common.benchmarks import percentile
+from common.models import OutboxEvent
+from inventory.models import InventoryBalance, InventoryMovement
+from inventory.reservations import RESERVATION_MODES
+from orders.groups import device_group, staff_group
+from orders.models import Order
+from orders.services import place_order
+from report_analytics.models import OrderRollup, ProductRollup
+
+PREFIX = 'bench-contention'
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks order placement throughput against one hot product for each reservation mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent kiosks placing orders')
+        parser.add_argument('--orders', type=int, default=50, help='Orders placed by each thread')
+        parser.add_argument('--quantity', type=int, default=1, help='Units of the hot product per order')
+        parser.add_argument(
+            '--modes',
+            default=','.join(RESERVATION_MODES),
+            help='Comma separated reservation modes to compare'
+        )
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        orders_per_thread = options['orders']
+        quantity = options['quantity']
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+
+        for mode in modes:
+            if mode not in RESERVATION_MODES:
+                raise CommandError(f'Unknown reservation mode: {mode}')
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite serializes all writers, expect "database is locked" errors. '
+                'Run against PostgreSQL for meaningful numbers.'
+            ))
+
+        fixtures = self._create_fixtures(threads)
+        results = {}
+        try:
+            for mode in modes:
+                # Enough stock for every order, reservations start at zero
+                InventoryBalance.objects.filter(product=fixtures['product']).update(
+                    on_hand=threads * orders_per_thread * quantity * 2,
+                    reserved=0
+                )
+                results[mode] = self._run(mode, fixtures, orders_per_thread, quantity)
+                self._report(mode, results[mode])
+        finally:
+            self._delete_fixtures(fixtures)
+
+        if len(results) > 1:
+            baseline = results[modes[0]]['throughput']
+            self.stdout.write('')
+            for mode in modes[1:]:
+                ratio = results[mode]['throughput'] / baseline if baseline else 0
+                self.stdout.write(self.style.SUCCESS(f'{mode} vs {modes[0]}: {ratio:.2f}x throughput'))
+
+    def _run(self, mode, fixtures, orders_per_thread, quantity):
+        """Place orders from every thread at once and collect latencies"""
+        product = fixtures['product']
+        barrier = threading.Barrier(len(fixtures['assignments']))
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+
+        def worker(assignment):
+            thread_latencies = []
+            thread_errors = Counter()
+            try:
+                barrier.wait()
+                for _ in range(orders_per_thread):
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            # Same device lock the kiosk endpoint takes
+                            device = Device.objects.select_for_update().get(id=assignment.device_id)
+                            place_order(
+                                device=device,
+                                patient_assignment=assignment,
+                                items_data=[{'product_id': product.id, 'quantity': quantity}],
+                                mode=mode
+                            )
+                        thread_latencies.append(time.perf_counter() - started)
+                    except Exception as e:
+                        # Counted by type: lock timeouts and stock errors mean different things
+                        thread_errors[type(e).__name__] += 1
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(thread_latencies)
+                    errors.update(thread_errors)
+
+        workers = [threading.Thread(target=worker, args=(assignment,)) for assignment in fixtures['assignments']]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'orders': len(latencies),
+            'errors': sum(errors.values()),
+            'error_types': dict(errors),
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+
+    def _report(self, mode, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Mode: {mode}'))
+        self.stdout.write(f"  Orders placed: {result['orders']} ({result['errors']} errors)")
+        if result['error_types']:
+            self.stdout.write(self.style.WARNING('  Errors: ' + ', '.join(
+                f'{name} x{count}' for name, count in sorted(result['error_types'].items())
+            )))
+        self.stdout.write(f"  Elapsed: {result['elapsed']:.2f}s")
+        self.stdout.write(f"  Throughput: {result['throughput']:.1f} orders/s")
+        self.stdout.write(
+            f"  Latency p50/p95/p99: {result['p50_ms']:.1f} / {result['p95_ms']:.1f} / {result['p99_ms']:.1f} ms"
+        )
+
+    def _create_fixtures(self, threads):
+        """One hot product and one device with an active patient per thread"""
+        last_event = OutboxEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        staff, _ = User.objects.get_or_create(
+            email=f'{PREFIX}@example.com',
+            defaults={'full_name': 'Benchmark Staff', 'is_staff': True}
+        )
+        category = ProductCategory.objects.create(name=f'{PREFIX} category')
+        product = Product.objects.create(name=f'{PREFIX} water', category=category)
+        InventoryBalance.objects.get_or_create(product=product)
+
+        assignments = []
+        for i in range(threads):
+            room = Room.objects.create(code=f'{PREFIX}-{i}')
+            device = Device.objects.create(device_uid=f'{PREFIX}-{i}', room=room)
+            device.assigned_staff.add(staff)
+            patient = Patient.objects.create(full_name=f'Benchmark Patient {i}', phone_e164='+15550000000')
+            assignments.append(PatientAssignment.objects.create(
+                patient=patient,
+                staff=staff,
+                device=device,
+                room=room
+            ))
+
+        return {
+            'staff': staff,
+            'category': category,
+            'product': product,
+            'assignments': assignments,
+            'last_event': last_event,
+        }
+
+    def _delete_fixtures(self, fixtures):
+        devices = [assignment.device_id for assignment in fixtures['assignments']]
+        patients = [assignment.patient_id for assignment in fixtures['assignments']]
+        rooms = [assignment.room_id for assignment in fixtures['assignments']]
+        groups = {device_group(device_id) for device_id in devices} | {staff_group(fixtures['staff'].id)}
+
+        # Counters the benchmark orders added; rollups of deleted rooms would stay behind with room=NULL
+        OrderRollup.objects.filter(room_id__in=rooms).delete()
+        ProductRollup.objects.filter(product=fixtures['product']).delete()
+        ProductPopularity.objects.filter(product=fixtures['product']).delete()
+
+        Order.objects.filter(assignment_id__in=devices).delete()
+        InventoryMovement.objects.filter(product=fixtures['product']).delete()
+        PatientAssignment.objects.filter(device_id__in=devices).delete()
+        Device.objects.filter(id__in=devices).delete()
+        Patient.objects.filter(id__in=patients).delete()
+        Room.objects.filter(id__in=rooms).delete()
+        fixtures['product'].delete()
+        fixtures['category'].delete()
+        fixtures['staff'].delete()
+
+        # Kiosk and staff notifications of the fixtures, the deletions above included
+        OutboxEvent.objects.filter(id__gt=fixtures['last_event'], group__in=groups).delete()
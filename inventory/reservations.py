@@ -0,0 +1,187 @@
+"""
+Inventory reservation primitives (RESERVE, CONSUME, RELEASE)
+
+Every operation is applied with one guarded UPDATE statement, e.g.
+UPDATE ... SET reserved = reserved + n WHERE on_hand - reserved >= n
+and fewer affected rows than products means the guard failed.
+
+Two modes are supported (settings.INVENTORY_RESERVATION_MODE):
+- 'locking': balance rows are locked with select_for_update() before
+  they are updated, serializing concurrent orders on the same product.
+- 'conditional': no row locks are taken up front, the guarded UPDATE is
+  the only synchronization point.
+
+All functions must be called inside transaction.atomic(); when a guard
+fails the exception rolls back whatever the statement already changed.
+"""
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import InventoryBalance
+from .signals import balances_changed
+
+
+LOCKING = 'locking'
+CONDITIONAL = 'conditional'
+RESERVATION_MODES = (LOCKING, CONDITIONAL)
+
+
+class InsufficientStock(Exception):
+    """Raised when a product does not have enough available stock to reserve"""
+
+    def __init__(self, product_id, available, requested):
+        super().__init__(f'Insufficient inventory for product {product_id}. Available: {available}, Requested: {requested}')
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+
+
+class InventoryConflict(Exception):
+    """Raised when a CONSUME or RELEASE does not match the reserved quantities"""
+
+    def __init__(self, product_ids, movement_type):
+        super().__init__(f'Inventory does not cover the {movement_type.lower()} quantity for products {product_ids}')
+        self.product_ids = product_ids
+        self.movement_type = movement_type
+
+
+def get_reservation_mode():
+    """Return the configured reservation mode"""
+    mode = getattr(settings, 'INVENTORY_RESERVATION_MODE', LOCKING)
+    return mode if mode in RESERVATION_MODES else LOCKING
+
+
+def lock_balances(product_ids):
+    """
+    Lock the balances of the given products (ordered to avoid deadlocks)
+    Returns the ids of the products that have a balance row
+    """
+    return set(
+        InventoryBalance.objects.select_for_update().filter(
+            product_id__in=product_ids
+        ).order_by('product_id').values_list('product_id', flat=True)
+    )
+
+
+def _quantity_case(quantities):
+    """CASE expression mapping each product_id to its quantity"""
+    return Case(
+        *[When(product_id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def _guard_condition(quantities, guard):
+    """OR of the per-product guards"""
+    condition = Q()
+    for product_id, quantity in quantities.items():
+        condition |= guard(product_id, quantity)
+    return condition
+
+
+def _guarded_update(quantities, guard, **updates):
+    """
+    Apply `updates` to the balances of `quantities` in one statement,
+    only where `guard(product_id, quantity)` holds. Returns affected rows.
+    """
+    return InventoryBalance.objects.filter(_guard_condition(quantities, guard)).update(
+        updated_at=timezone.now(),
+        **updates
+    )
+
+
+def reserve(quantities):
+    """
+    Reserve stock: reserved += qty where on_hand - reserved >= qty
+    quantities: {product_id: quantity} (only products with a balance row)
+    In locking mode the caller is expected to hold the balance locks already.
+    Raises InsufficientStock if any product cannot be reserved.
+    """
+    if not quantities:
+        return
+
+    updated = _guarded_update(
+        quantities,
+        lambda product_id, quantity: Q(product_id=product_id, on_hand__gte=F('reserved') + quantity),
+        reserved=F('reserved') + _quantity_case(quantities)
+    )
+
+    if updated != len(quantities):
+        # Find which product failed the guard to build a useful error
+        balances = InventoryBalance.objects.filter(product_id__in=list(quantities)).values_list(
+            'product_id', 'on_hand', 'reserved'
+        )
+        available_by_product = {product_id: on_hand - reserved for product_id, on_hand, reserved in balances}
+        for product_id, quantity in quantities.items():
+            available = available_by_product.get(product_id, 0)
+            if available < quantity:
+                raise InsufficientStock(product_id, available, quantity)
+        # Stock was released while we were checking, report on the first product
+        product_id = next(iter(quantities))
+        raise InsufficientStock(product_id, available_by_product.get(product_id, 0), quantities[product_id])
+
+    balances_changed.send(sender=InventoryBalance, product_ids=list(quantities))
+
+
+def _apply_reserved_movement(quantities, guard, movement_type, mode=None, **updates):
+    """
+    Shared implementation of CONSUME and RELEASE
+    Products without a balance row (not tracked in inventory) are skipped.
+    Returns the {product_id: quantity} that was applied.
+    """
+    if not quantities:
+        return {}
+
+    mode = mode or get_reservation_mode()
+    if mode == LOCKING:
+        tracked = lock_balances(list(quantities))
+        quantities = {product_id: quantity for product_id, quantity in quantities.items() if product_id in tracked}
+        if not quantities:
+            return {}
+
+    updated = _guarded_update(quantities, guard, **updates)
+    if updated != len(quantities):
+        # Either some products are not tracked or a guard failed
+        tracked = set(
+            InventoryBalance.objects.filter(product_id__in=list(quantities)).values_list('product_id', flat=True)
+        )
+        if updated != len(tracked):
+            raise InventoryConflict(sorted(tracked), movement_type)
+        quantities = {product_id: quantity for product_id, quantity in quantities.items() if product_id in tracked}
+
+    if quantities:
+        balances_changed.send(sender=InventoryBalance, product_ids=list(quantities))
+    return quantities
+
+
+def consume(quantities, mode=None):
+    """
+    Consume reserved stock on delivery: reserved -= qty, on_hand -= qty
+    where reserved >= qty and on_hand >= qty
+    Raises InventoryConflict if the balance does not cover the quantity.
+    """
+    quantity_case = _quantity_case(quantities)
+    return _apply_reserved_movement(
+        quantities,
+        lambda product_id, quantity: Q(product_id=product_id, reserved__gte=quantity, on_hand__gte=quantity),
+        'CONSUME',
+        mode=mode,
+        reserved=F('reserved') - quantity_case,
+        on_hand=F('on_hand') - quantity_case
+    )
+
+
+def release(quantities, mode=None):
+    """
+    Release reserved stock on cancellation: reserved -= qty where reserved >= qty
+    Raises InventoryConflict if the balance does not cover the quantity.
+    """
+    return _apply_reserved_movement(
+        quantities,
+        lambda product_id, quantity: Q(product_id=product_id, reserved__gte=quantity),
+        'RELEASE',
+        mode=mode,
+        reserved=F('reserved') - _quantity_case(quantities)
+    )
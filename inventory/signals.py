@@ -1,9 +1,14 @@
 from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
 from catalog.models import Product
 from .models import InventoryBalance
 
 
+# Sent after balances are changed with queryset.update() (no post_save), e.g. by
+# inventory.reservations. Arguments: product_ids
+balances_changed = Signal()
+
+
 @receiver(post_save, sender=Product)
 def create_inventory_balance(sender, instance, created, **kwargs):
     """
@@ -1,3 +1,130 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from accounts.models import User
+from catalog.models import Product, ProductCategory, ProductPopularity
+from clinic.models import Device, Patient, PatientAssignment, Room
+from common.models import OutboxEvent
+from orders.groups import DASHBOARD_GROUP
+from orders.models import Order
+from orders.services import OrderPlacementError, place_order
+from report_analytics.models import OrderRollup, ProductRollup
+from .models import InventoryBalance, InventoryMovement
+from .reservations import CONDITIONAL, LOCKING, RESERVATION_MODES, InsufficientStock, InventoryConflict, consume, release, reserve
+
+
+class ReservationTests(TestCase):
+    """
+    Reservations are all-or-nothing guarded UPDATEs, with the same outcome in both modes
+    """
+
+    def setUp(self):
+        drinks = ProductCategory.objects.create(name='Bebidas', category_type='DRINK')
+        self.water = Product.objects.create(name='Agua', category=drinks)
+        self.juice = Product.objects.create(name='Jugo', category=drinks)
+        self.untracked = Product.objects.create(name='Te', category=drinks)
+        InventoryBalance.objects.filter(product=self.untracked).delete()
+        InventoryBalance.objects.filter(product=self.water).update(on_hand=5)
+        InventoryBalance.objects.filter(product=self.juice).update(on_hand=2)
+
+        device = Device.objects.create(device_uid='IPAD-01', room=Room.objects.create(code='101'))
+        self.assignment = PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient', phone_e164='+15550000001'),
+            staff=User.objects.create_user(email='staff@example.com', password='staff123', full_name='Staff'),
+            device=device,
+            room=device.room
+        )
+
+    def balance(self, product):
+        balance = InventoryBalance.objects.get(product=product)
+        return balance.on_hand, balance.reserved
+
+    def test_insufficient_stock_rolls_back_every_line(self):
+        with self.assertRaises(InsufficientStock) as raised, transaction.atomic():
+            reserve({self.water.id: 2, self.juice.id: 3})
+        self.assertEqual((raised.exception.product_id, raised.exception.available), (self.juice.id, 2))
+        self.assertEqual((self.balance(self.water), self.balance(self.juice)), ((5, 0), (2, 0)))
+
+    def test_consume_and_release(self):
+        for mode in RESERVATION_MODES:
+            with self.subTest(mode=mode):
+                InventoryBalance.objects.update(reserved=0)
+                InventoryBalance.objects.filter(product=self.water).update(on_hand=5)
+                with transaction.atomic():
+                    reserve({self.water.id: 3, self.juice.id: 1})
+                    # Untracked products are skipped, not a conflict
+                    self.assertEqual(consume({self.water.id: 2, self.untracked.id: 1}, mode=mode), {self.water.id: 2})
+                    self.assertEqual(release({self.water.id: 1, self.juice.id: 1}, mode=mode), {self.water.id: 1, self.juice.id: 1})
+                self.assertEqual((self.balance(self.water), self.balance(self.juice)), ((3, 0), (2, 0)))
+
+    def test_conflict_rolls_back_every_line(self):
+        reserve({self.water.id: 2, self.juice.id: 1})
+        for mode in RESERVATION_MODES:
+            with self.subTest(mode=mode):
+                with self.assertRaises(InventoryConflict), transaction.atomic():
+                    release({self.water.id: 1, self.juice.id: 2}, mode=mode)
+                with self.assertRaises(InventoryConflict), transaction.atomic():
+                    consume({self.water.id: 1, self.juice.id: 2}, mode=mode)
+                self.assertEqual((self.balance(self.water), self.balance(self.juice)), ((5, 2), (2, 1)))
+
+    def test_modes_write_the_same_balances_and_movements(self):
+        outcomes = {}
+        for mode in (LOCKING, CONDITIONAL):
+            InventoryBalance.objects.filter(product=self.water).update(on_hand=5, reserved=0)
+            InventoryBalance.objects.filter(product=self.juice).update(on_hand=2, reserved=0)
+            with transaction.atomic():
+                order, _ = place_order(
+                    device=self.assignment.device, patient_assignment=self.assignment, mode=mode, enforce_limits=False,
+                    items_data=[{'product_id': self.water.id, 'quantity': 2}, {'product_id': self.juice.id, 'quantity': 2}]
+                )
+            with self.assertRaises(OrderPlacementError), transaction.atomic():
+                place_order(
+                    device=self.assignment.device, patient_assignment=self.assignment, mode=mode, enforce_limits=False,
+                    items_data=[{'product_id': self.water.id, 'quantity': 1}, {'product_id': self.juice.id, 'quantity': 1}]
+                )
+            with transaction.atomic():
+                consume({self.water.id: 2}, mode=mode)
+                release({self.juice.id: 2}, mode=mode)
+
+            outcomes[mode] = (
+                [self.balance(self.water), self.balance(self.juice)],
+                list(InventoryMovement.objects.filter(order=order).values_list('product_id', 'movement_type', 'quantity'))
+            )
+            self.assertEqual(Order.objects.count(), 1)
+            Order.objects.all().delete()
+            InventoryMovement.objects.all().delete()
+
+        self.assertEqual(outcomes[LOCKING], outcomes[CONDITIONAL])
+        self.assertEqual(outcomes[LOCKING][0], [(3, 0), (2, 0)])
+
+
+class ContentionBenchmarkTests(TransactionTestCase):
+    """
+    The contention benchmark places real orders and leaves nothing behind
+    """
+
+    def test_fixtures_and_counters_are_deleted(self):
+        stdout = StringIO()
+        call_command('bench_inventory_contention', threads=1, orders=3, stdout=stdout)
+
+        self.assertIn('Orders placed: 3 (0 errors)', stdout.getvalue())
+        for model in (Order, Room, Product, OrderRollup, ProductRollup, ProductPopularity):
+            with self.subTest(model=model.__name__):
+                self.assertFalse(model.objects.exists())
+        # Dashboard refreshes are not the benchmark's own
+        self.assertFalse(OutboxEvent.objects.exclude(group=DASHBOARD_GROUP).exists())
+
+    def test_errors_are_reported_by_type(self):
+        stdout = StringIO()
+        with mock.patch(
+            'inventory.management.commands.bench_inventory_contention.place_order',
+            side_effect=OrderPlacementError({'error': 'Insufficient inventory'})
+        ):
+            call_command('bench_inventory_contention', threads=1, orders=3, modes='locking', stdout=stdout)
+
+        self.assertIn('Orders placed: 0 (3 errors)', stdout.getvalue())
+        self.assertIn('Errors: OrderPlacementError x3', stdout.getvalue())
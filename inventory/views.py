@@ -35,13 +35,15 @@ class InventoryBalanceViewSet(viewsets.ReadOnlyModelViewSet):
         GET /api/inventory/balances/all_products/
         """
         # Get all active products
-        products = Product.objects.filter(is_active=True).select_related('category').order_by('category__name', 'name')
+        products = Product.objects.filter(is_active=True).select_related(
+            'category', 'inventory_balance'
+        ).order_by('category__name', 'name')
 
         result = []
         for product in products:
             try:
-                # Try to get inventory balance
-                balance = InventoryBalance.objects.get(product=product)
+                # Inventory balance, loaded with the product
+                balance = product.inventory_balance
                 result.append({
                     'id': product.id,
                     'name': product.name,
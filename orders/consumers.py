@@ -1,52 +1,102 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+from accounts.authentication import user_from_token
+from accounts.roles import get_user_roles
+from clinic.device_tokens import DeviceTokenError, device_from_query_string
 from clinic.models import Device
+from clinic.kiosk_session import get_session_snapshot, session_etag
+from clinic.presence import device_presence
+from .dashboard_stats import get_dashboard_stats
+from .groups import DASHBOARD_GROUP, staff_groups_for, device_group
 
-User = get_user_model()
 
-
-class StaffOrderConsumer(AsyncWebsocketConsumer):
+class StaffAuthMixin:
     """
-    WebSocket consumer for staff to receive real-time order notifications
-    Requires JWT authentication
+    JWT authentication of staff and admin sockets (?token=<access token>)
     """
 
-    async def connect(self):
+    async def authenticate(self):
         """
-        Handle WebSocket connection
-        Validates JWT token and adds user to staff_orders group
+        Return the staff user of the token, or close the socket and return None
         """
         # Get token from query string
         token = self.scope['query_string'].decode().split('token=')[-1] if b'token=' in self.scope['query_string'] else None
 
         if not token:
             await self.close(code=4001)
-            return
+            return None
 
         # Validate token and get user
         user = await self.get_user_from_token(token)
         if not user:
             await self.close(code=4001)
-            return
+            return None
 
         # Check if user is staff or admin
         is_authorized = await self.check_user_authorization(user)
         if not is_authorized:
             await self.close(code=4003)
+            return None
+
+        return user
+
+    @database_sync_to_async
+    def get_user_from_token(self, token):
+        """
+        Validate JWT token and return user (built from its claims, see accounts.authentication)
+        """
+        try:
+            access_token = AccessToken(token)
+            user = user_from_token(access_token)
+            self.access_token = access_token
+            return user
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+
+    @database_sync_to_async
+    def check_user_authorization(self, user):
+        """
+        Check if user has staff or admin role (from the token claims, see accounts.roles)
+        """
+        if user.is_staff or user.is_superuser:
+            return True
+        roles = get_user_roles(user, getattr(self, 'access_token', None))
+        return 'STAFF' in roles or 'ADMIN' in roles
+
+
+class StaffOrderConsumer(StaffAuthMixin, AsyncWebsocketConsumer):
+    """
+    WebSocket consumer for staff to receive real-time order notifications
+    Requires JWT authentication
+    Admins join the global staff_orders group, other staff join their own
+    group and one group per device they attend (see orders.groups)
+    """
+
+    async def connect(self):
+        """
+        Handle WebSocket connection
+        Validates JWT token and adds user to its staff groups
+        """
+        user = await self.authenticate()
+        if not user:
             return
 
         self.user = user
-        self.group_name = 'staff_orders'
+        self.group_names = await self.get_group_names(user)
 
-        # Join staff_orders group
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+        # Join admin or per-staff and per-device groups
+        for group_name in self.group_names:
+            await self.channel_layer.group_add(
+                group_name,
+                self.channel_name
+            )
 
         await self.accept()
 
@@ -54,12 +104,23 @@ class StaffOrderConsumer(AsyncWebsocketConsumer):
         """
         Handle WebSocket disconnection
         """
-        if hasattr(self, 'group_name'):
+        for group_name in getattr(self, 'group_names', ()):
             await self.channel_layer.group_discard(
-                self.group_name,
+                group_name,
                 self.channel_name
             )
 
+    async def refresh_groups(self):
+        """
+        Recompute the groups of this socket and join/leave the difference
+        """
+        group_names = await self.get_group_names(self.user)
+        for group_name in group_names - self.group_names:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        for group_name in self.group_names - group_names:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+        self.group_names = group_names
+
     async def receive(self, text_data):
         """
         Handle incoming WebSocket messages (not used in this implementation)
@@ -104,56 +165,48 @@ class StaffOrderConsumer(AsyncWebsocketConsumer):
             'ended_at': event.get('ended_at'),
         }))
 
-    @database_sync_to_async
-    def get_user_from_token(self, token):
+        # The attending staff may no longer follow this device
+        await self.refresh_groups()
+
+    async def groups_changed(self, event):
         """
-        Validate JWT token and return user
+        Handle groups_changed event from channel layer
+        Sent when device or patient assignments of this staff member change
         """
-        try:
-            access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            user = User.objects.get(id=user_id)
-            return user
-        except (InvalidToken, TokenError, User.DoesNotExist):
-            return None
+        await self.refresh_groups()
 
     @database_sync_to_async
-    def check_user_authorization(self, user):
+    def get_group_names(self, user):
         """
-        Check if user has staff or admin role
+        Groups this staff member listens to
         """
-        return user.has_role('STAFF') or user.has_role('ADMIN') or user.is_staff or user.is_superuser
+        return staff_groups_for(user)
 
 
 class KioskOrderConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for kiosk/iPad to receive order status updates
-    Uses device_uid for authentication (no JWT required)
+    Authenticated by the device token (?device_token=..., no query needed) or,
+    for kiosks not enrolled yet, by ?device_uid=... (no JWT required)
+    Sends the session snapshot (active patient, limits, survey) on connect
+    and again whenever it changes, so the kiosk does not need to poll
     """
 
     async def connect(self):
         """
         Handle WebSocket connection
-        Validates device_uid and adds to room-specific group
+        Validates the device token (or device_uid) and adds to room-specific group
         """
-        # Get device_uid from query string
-        device_uid = self.scope['query_string'].decode().split('device_uid=')[-1] if b'device_uid=' in self.scope['query_string'] else None
-
-        if not device_uid:
+        identity = await self.get_device_and_validate(self.scope['query_string'])
+        if not identity:
             await self.close(code=4001)
             return
 
-        # Validate device and get room
-        device = await self.get_device_and_validate(device_uid)
-        if not device:
-            await self.close(code=4001)
-            return
-
-        self.device = device
-        self.device_uid = device_uid
+        self.device_id = identity.device_id
+        self.device_uid = identity.device_uid
 
         # Join device-specific group
-        self.group_name = f'device_{device.id}'
+        self.group_name = device_group(identity.device_id)
 
         await self.channel_layer.group_add(
             self.group_name,
@@ -161,6 +214,35 @@ class KioskOrderConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        await self.send_session('session_snapshot')
+
+    async def send_session(self, message_type):
+        """
+        Send the current session snapshot unless this socket already has it
+        """
+        snapshot = await self.get_session_snapshot()
+        if snapshot is None:
+            return
+
+        version, status_code, payload = snapshot
+        if version == getattr(self, 'session_version', None):
+            return
+        self.session_version = version
+
+        await self.send(text_data=json.dumps({
+            'type': message_type,
+            'version': version,
+            'etag': session_etag(version),
+            'active': status_code == 200,
+            'session': payload,
+        }))
+
+    async def session_changed(self, event):
+        """
+        Handle session_changed event from channel layer
+        Push the new session snapshot to the kiosk
+        """
+        await self.send_session('session_updated')
 
     async def disconnect(self, close_code):
         """
@@ -174,9 +256,16 @@ class KioskOrderConsumer(AsyncWebsocketConsumer):
 
     async def receive(self, text_data):
         """
-        Handle incoming WebSocket messages (not used in this implementation)
+        Handle incoming WebSocket messages
+        Any message is a heartbeat (clinic.presence); {"type": "ping"} gets a pong
         """
-        pass
+        device_presence.seen(self.device_id)
+        try:
+            message = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        if isinstance(message, dict) and message.get('type') == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
 
     async def order_status_changed(self, event):
         """
@@ -251,12 +340,113 @@ class KioskOrderConsumer(AsyncWebsocketConsumer):
         }))
 
     @database_sync_to_async
-    def get_device_and_validate(self, device_uid):
+    def get_device_and_validate(self, query_string):
         """
-        Validate device_uid and return device if active
+        Identity of the device from its token or active device_uid, None if invalid
         """
         try:
-            device = Device.objects.get(device_uid=device_uid, is_active=True)
-            return device
+            return device_from_query_string(query_string)
+        except (DeviceTokenError, Device.DoesNotExist):
+            return None
+
+    @database_sync_to_async
+    def get_session_snapshot(self):
+        """
+        Cached session snapshot of this device, None if it was deactivated
+        """
+        try:
+            return get_session_snapshot(self.device_id)
         except Device.DoesNotExist:
             return None
+
+
+class AdminDashboardConsumer(StaffAuthMixin, AsyncWebsocketConsumer):
+    """
+    WebSocket consumer for the live admin dashboard
+    Requires JWT authentication, same access as the dashboard/stats/ endpoint
+    Sends the full statistics on connect (dashboard_snapshot), then only the
+    panels that changed (dashboard_delta). Refreshes are triggered by the
+    dashboard_changed events and, for the time based figures, every
+    DASHBOARD_STATS_TTL seconds.
+    """
+
+    # Bursts of changes (e.g. an order and its stock reservation) are sent as one delta
+    PUSH_DELAY = 0.25  # seconds
+
+    async def connect(self):
+        """
+        Handle WebSocket connection
+        Validates JWT token, joins the dashboard group and sends the snapshot
+        """
+        user = await self.authenticate()
+        if not user:
+            return
+
+        self.user = user
+        self.panels = {}
+        self.pending_refresh = None
+
+        await self.channel_layer.group_add(DASHBOARD_GROUP, self.channel_name)
+        await self.accept()
+
+        await self.push_stats()
+        self.periodic_refresh = asyncio.create_task(self.refresh_periodically())
+
+    async def disconnect(self, close_code):
+        """
+        Handle WebSocket disconnection
+        """
+        for task in (getattr(self, 'periodic_refresh', None), getattr(self, 'pending_refresh', None)):
+            if task:
+                task.cancel()
+        if hasattr(self, 'user'):
+            await self.channel_layer.group_discard(DASHBOARD_GROUP, self.channel_name)
+
+    async def receive(self, text_data):
+        """
+        Handle incoming WebSocket messages (not used in this implementation)
+        """
+        pass
+
+    async def push_stats(self):
+        """
+        Send the panels that differ from what this socket already has
+        """
+        stats = await self.get_stats()
+        changed = {panel: data for panel, data in stats.items() if self.panels.get(panel) != data}
+        if not changed:
+            return
+
+        if self.panels:
+            message = {'type': 'dashboard_delta', 'panels': changed}
+        else:
+            message = {'type': 'dashboard_snapshot', 'stats': stats}
+        self.panels = stats
+        await self.send(text_data=json.dumps(message, cls=JSONEncoder))
+
+    async def refresh_periodically(self):
+        while True:
+            await asyncio.sleep(settings.DASHBOARD_STATS_TTL)
+            await self.push_stats()
+
+    async def refresh_soon(self):
+        await asyncio.sleep(self.PUSH_DELAY)
+        self.pending_refresh = None
+        await self.push_stats()
+
+    async def dashboard_changed(self, event):
+        """
+        Handle dashboard_changed event from channel layer
+        Schedule a refresh unless one is already pending
+        """
+        if self.pending_refresh is None:
+            self.pending_refresh = asyncio.create_task(self.refresh_soon())
+
+    @database_sync_to_async
+    def get_stats(self):
+        """
+        Current statistics, shared with the other sockets through the cache
+        Never sends a stale one: computes its own copy while another caller
+        computes the shared snapshot.
+        """
+        return get_dashboard_stats(allow_stale=False)
@@ -1,5 +1,8 @@
-from django.db.models import Count, Q, Avg, F, ExpressionWrapper, DurationField
-from django.db.models.functions import TruncHour, TruncDate
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Avg, F, Sum, ExpressionWrapper, DurationField
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import timedelta
 from rest_framework.decorators import api_view, permission_classes
@@ -7,17 +10,26 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from accounts.permissions import IsStaffOrAdmin
 
+from common.outbox import publish
+from .groups import DASHBOARD_GROUP
 from .models import Order, OrderItem
 from clinic.models import Room, Device, PatientAssignment
 from feedbacks.models import Feedback
 from catalog.models import Product
+from report_analytics.models import OrderRollup, ProductRollup
+from report_analytics.rollups import DAY, HOUR, STATUS_FIELDS, hour_bucket
 
 
-@api_view(['GET'])
-@permission_classes([IsStaffOrAdmin])
-def dashboard_stats(request):
+STATS_KEY = 'dashboard:stats'
+STALE_KEY = 'dashboard:stats:stale'
+LOCK_KEY = 'dashboard:stats:lock'
+INVALIDATED_KEY = 'dashboard:stats:invalidated'
+LOCK_TIMEOUT = 10  # seconds, longer than any computation
+
+
+def build_dashboard_stats():
     """
-    Get comprehensive dashboard statistics
+    Compute the dashboard statistics from the database
     """
     now = timezone.now()
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -25,17 +37,20 @@ def dashboard_stats(request):
     last_7d = now - timedelta(days=7)
 
     # Panel 1: Orders in Real Time
-    orders_by_status = Order.objects.values('status').annotate(count=Count('id'))
-    orders_status_dict = {item['status']: item['count'] for item in orders_by_status}
-
-    orders_last_24h = Order.objects.filter(
-        placed_at__gte=last_24h
-    ).annotate(
-        hour=TruncHour('placed_at')
-    ).values('hour').annotate(count=Count('id')).order_by('hour')
+    # Current status counts, summed from the daily rollups
+    status_totals = OrderRollup.objects.filter(period=DAY).aggregate(
+        **{order_status: Sum(field) for order_status, field in STATUS_FIELDS.items()}
+    )
+    orders_status_dict = {order_status: count for order_status, count in status_totals.items() if count}
+    active_count = sum(status_totals[order_status] or 0 for order_status in ['PLACED', 'PREPARING', 'READY'])
+
+    orders_last_24h = OrderRollup.objects.filter(
+        period=HOUR,
+        bucket__gte=hour_bucket(last_24h)
+    ).values(hour=F('bucket')).annotate(count=Sum('order_count')).order_by('hour')
 
     # Panel 2: Room Occupancy
-    active_assignments = PatientAssignment.objects.filter(is_active=True).select_related('room', 'patient')
+    active_assignments = PatientAssignment.objects.filter(is_active=True).select_related('room', 'patient', 'staff')
     rooms_with_patients = {}
     for assignment in active_assignments:
         room_code = assignment.room.code if assignment.room else 'N/A'
@@ -51,9 +66,11 @@ def dashboard_stats(request):
         })
 
     # Add order counts per room
-    orders_by_room = Order.objects.filter(
-        status__in=['PLACED', 'PREPARING', 'READY']
-    ).values('room__code').annotate(count=Count('id'))
+    orders_by_room = OrderRollup.objects.filter(
+        period=DAY
+    ).values('room__code').annotate(
+        count=Sum(F('placed_count') + F('preparing_count') + F('ready_count'))
+    )
 
     for item in orders_by_room:
         room_code = item['room__code'] or 'N/A'
@@ -61,12 +78,11 @@ def dashboard_stats(request):
             rooms_with_patients[room_code]['order_count'] = item['count']
 
     # Panel 3: Active Devices
-    total_devices = Device.objects.filter(is_active=True).count()
     active_threshold = now - timedelta(minutes=30)
-    active_devices = Device.objects.filter(
-        is_active=True,
-        last_seen_at__gte=active_threshold
-    ).count()
+    device_counts = Device.objects.filter(is_active=True).aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(last_seen_at__gte=active_threshold))
+    )
 
     devices_by_type = Device.objects.filter(is_active=True).values('device_type').annotate(count=Count('id'))
 
@@ -79,19 +95,15 @@ def dashboard_stats(request):
 
     # Calculate average satisfaction from staff_rating and stay_rating
     # Use staff_rating as primary metric (or average of both if needed)
-    satisfaction_distribution = []
-    for rating in range(1, 6):
-        count = feedbacks_last_7d.filter(staff_rating=rating).count()
-        if count > 0:
-            satisfaction_distribution.append({
-                'satisfaction_rating': rating,
-                'count': count
-            })
+    satisfaction_distribution = feedbacks_last_7d.filter(
+        staff_rating__gte=1
+    ).values(
+        satisfaction_rating=F('staff_rating')
+    ).annotate(count=Count('id')).order_by('satisfaction_rating')
 
     # Calculate average satisfaction from staff_rating
-    avg_satisfaction = feedbacks_last_7d.aggregate(avg=Avg('staff_rating'))['avg'] or 0
-    if avg_satisfaction is None:
-        avg_satisfaction = 0
+    satisfaction = feedbacks_last_7d.aggregate(avg=Avg('staff_rating'), count=Count('id'))
+    avg_satisfaction = satisfaction['avg'] or 0
 
     # Satisfaction trend based on staff_rating
     satisfaction_trend = feedbacks_last_7d.annotate(
@@ -114,14 +126,15 @@ def dashboard_stats(request):
     ).order_by('-avg_rating')[:3]
 
     # Panel 5: Most Requested Products
-    top_products = OrderItem.objects.filter(
-        order__placed_at__gte=last_7d
+    top_products = ProductRollup.objects.filter(
+        period=HOUR,
+        bucket__gte=hour_bucket(last_7d)
     ).values(
         'product__id',
         'product__name',
         'product__category__name'
     ).annotate(
-        total_quantity=Count('id')
+        total_quantity=Sum('line_count')
     ).order_by('-total_quantity')[:10]
 
     # Low stock alerts
@@ -134,13 +147,11 @@ def dashboard_stats(request):
         'reorder_level'
     )[:5]
 
-    return Response({
+    return {
         'orders': {
             'by_status': orders_status_dict,
             'last_24h': list(orders_last_24h),
-            'active_count': Order.objects.filter(
-                status__in=['PLACED', 'PREPARING', 'READY']
-            ).count()
+            'active_count': active_count
         },
         'rooms': {
             'occupied': list(rooms_with_patients.values()),
@@ -148,8 +159,8 @@ def dashboard_stats(request):
             'total_rooms': Room.objects.filter(is_active=True).count()
         },
         'devices': {
-            'total': total_devices,
-            'active': active_devices,
+            'total': device_counts['total'],
+            'active': device_counts['active'],
             'by_type': list(devices_by_type),
             'recent': [{
                 'device_uid': d.device_uid,
@@ -163,10 +174,75 @@ def dashboard_stats(request):
             'distribution': list(satisfaction_distribution),
             'trend': list(satisfaction_trend),
             'top_staff': list(top_staff),
-            'total_responses': feedbacks_last_7d.count()
+            'total_responses': satisfaction['count']
         },
         'products': {
             'top_requested': list(top_products),
             'low_stock': list(low_stock)
         }
-    })
+    }
+
+
+def _store(stats):
+    cache.set(STATS_KEY, stats, settings.DASHBOARD_STATS_TTL)
+    cache.set(STALE_KEY, stats, settings.DASHBOARD_STATS_STALE_TTL)
+
+
+def get_dashboard_stats(allow_stale=True):
+    """
+    Dashboard statistics shared by every caller for DASHBOARD_STATS_TTL seconds
+    A hit costs one cache read. On a miss only the caller holding the lock
+    computes and stores the snapshot; the others get the previous snapshot
+    (allow_stale) or, without one, compute their own copy rather than wait.
+    """
+    stats = cache.get(STATS_KEY)
+    if stats is not None:
+        return stats
+
+    if cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        try:
+            cache.delete(INVALIDATED_KEY)
+            stats = build_dashboard_stats()
+            if cache.get(INVALIDATED_KEY):
+                # Something changed while computing, do not serve this snapshot as fresh
+                cache.set(STALE_KEY, stats, settings.DASHBOARD_STATS_STALE_TTL)
+            else:
+                _store(stats)
+        finally:
+            cache.delete(LOCK_KEY)
+        return stats
+
+    if allow_stale:
+        stats = cache.get(STALE_KEY)
+        if stats is not None:
+            return stats
+
+    return build_dashboard_stats()
+
+
+def invalidate_dashboard_stats():
+    """
+    Drop the cached snapshot and tell the live dashboards to refresh
+    Only a change that drops a snapshot, or lands while one is computed,
+    is published: the changes after it are picked up by the refresh that
+    the first event triggers.
+    """
+    cache.set(INVALIDATED_KEY, True, LOCK_TIMEOUT)
+    if cache.delete(STATS_KEY) or cache.get(LOCK_KEY):
+        publish(DASHBOARD_GROUP, {'type': 'dashboard_changed'})
+
+
+def dashboard_changed():
+    """Drop the cached dashboard snapshot once the current transaction commits"""
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+@api_view(['GET'])
+@permission_classes([IsStaffOrAdmin])
+def dashboard_stats(request):
+    """
+    Get comprehensive dashboard statistics
+    Served from a short-lived shared snapshot, see get_dashboard_stats().
+    The live version is pushed by AdminDashboardConsumer (ws/admin/dashboard/).
+    """
+    return Response(get_dashboard_stats())
@@ -0,0 +1,75 @@
+"""
+Channel layer groups used for WebSocket fan-out
+
+- ADMIN_GROUP ('staff_orders'): admins only, receive every staff notification
+- staff_<user_id>: every socket of one staff member (direct messages, group refresh)
+- staff_device_<device_id>: staff responsible for a device, either through
+  Device.assigned_staff or an active PatientAssignment on it
+- device_<device_id>: the kiosk itself
+- DASHBOARD_GROUP ('admin_dashboard'): live admin dashboards, told when the
+  dashboard statistics change (see orders.dashboard_stats)
+
+Staff sockets join their own group plus one group per device they attend, so
+an order from one room is only pushed to the nurses of that room and to admins.
+"""
+from django.db.models import Q
+
+from accounts.roles import get_user_roles
+from common.outbox import publish
+
+
+ADMIN_GROUP = 'staff_orders'
+DASHBOARD_GROUP = 'admin_dashboard'
+
+
+def staff_group(user_id):
+    return f'staff_{user_id}'
+
+
+def staff_device_group(device_id):
+    return f'staff_device_{device_id}'
+
+
+def device_group(device_id):
+    return f'device_{device_id}'
+
+
+def is_admin(user):
+    return user.is_superuser or 'ADMIN' in get_user_roles(user)
+
+
+def staff_device_ids(user):
+    """Ids of the devices a staff member receives notifications for"""
+    from clinic.models import Device
+
+    return set(
+        Device.objects.filter(
+            Q(assigned_staff=user) |
+            Q(patient_assignments__staff=user, patient_assignments__is_active=True)
+        ).values_list('id', flat=True).distinct()
+    )
+
+
+def staff_groups_for(user):
+    """Groups a staff socket should be in"""
+    if is_admin(user):
+        return {ADMIN_GROUP}
+    return {staff_group(user.id)} | {staff_device_group(device_id) for device_id in staff_device_ids(user)}
+
+
+def publish_to_staff(message, device_id=None, staff_id=None):
+    """
+    Publish a staff notification to admins and to the staff attending the device
+    Falls back to the staff member's own group when there is no device.
+    """
+    publish(ADMIN_GROUP, message)
+    if device_id:
+        publish(staff_device_group(device_id), message)
+    elif staff_id:
+        publish(staff_group(staff_id), message)
+
+
+def refresh_staff_groups(user_ids):
+    """Ask the sockets of these staff members to recompute their groups"""
+    for user_id in sorted(set(user_ids)):
+        publish(staff_group(user_id), {'type': 'groups_changed'})
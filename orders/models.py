@@ -74,6 +74,11 @@ class Order(models.Model):
         null=True,
         help_text=_('When the order was cancelled')
     )
+    version = models.PositiveIntegerField(
+        _('version'),
+        default=1,
+        help_text=_('Incremented on every save, lets staff clients drop stale changes')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -81,10 +86,25 @@ class Order(models.Model):
         verbose_name = _('order')
         verbose_name_plural = _('orders')
         ordering = ['-placed_at']
+        indexes = [
+            # Staff queue delta sync (orders.queue_sync)
+            models.Index(fields=['status', 'updated_at'], name='order_status_updated_idx'),
+        ]
 
     def __str__(self):
         return f'Order #{self.id} - {self.get_status_display()} - {self.placed_at.strftime("%Y-%m-%d %H:%M")}'
 
+    def save(self, *args, **kwargs):
+        """
+        Move the version on every update; queryset update() calls must set
+        version and updated_at themselves or the queue sync misses the change
+        """
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     """
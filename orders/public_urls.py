@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import PublicOrderViewSet
+from .views import PublicOrderViewSet, active_orders_async
 
 urlpatterns = [
     path('orders/create', PublicOrderViewSet.as_view({'post': 'create_order'}), name='public-order-create'),
     path('orders/active', PublicOrderViewSet.as_view({'get': 'active_orders'}), name='public-order-active'),
     path('orders/by-assignment/<int:assignment_id>/', PublicOrderViewSet.as_view({'get': 'orders_by_assignment'}), name='public-order-by-assignment'),
+    # Async version (same JSON), served on the event loop under ASGI
+    path('async/orders/active', active_orders_async, name='async-public-order-active'),
 ]
@@ -0,0 +1,64 @@
+"""
+Delta sync of the staff order queue
+
+GET /api/orders/queue/changes/ without a cursor returns the whole queue and
+a cursor. With ?cursor= it returns only the orders whose updated_at moved
+past the cursor: the ones in the requested statuses in full, and tombstones
+(id, status, version) for the ones that left those statuses. Both lists are
+read through the (status, updated_at) index, so a refresh costs as much as
+the changes since the previous one, not the size of the queue.
+
+updated_at is set before the transaction commits, so an order saved just
+before a sync can commit after it with an older timestamp than the cursor.
+Every sync therefore looks ORDER_SYNC_OVERLAP seconds behind its cursor and
+may send an order twice; clients keep the copy with the highest version.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Order
+
+
+STATUSES = [code for code, _ in Order.STATUS_CHOICES]
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    """Cursor not issued by changes_since"""
+
+
+def make_cursor(moment):
+    """Opaque cursor for a point in time (microseconds since the epoch)"""
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def read_cursor(cursor):
+    try:
+        return EPOCH + timedelta(microseconds=int(cursor))
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def changes_since(queryset, statuses, cursor=None):
+    """
+    Returns (orders, removed, cursor): the orders of `queryset` in `statuses`
+    changed since `cursor` (all of them without one), tombstones of the
+    orders that left `statuses` since then and the cursor of the next sync
+    Raises InvalidCursor.
+    """
+    next_cursor = make_cursor(timezone.now())
+    orders = queryset.filter(status__in=statuses)
+    if not cursor:
+        return orders, [], next_cursor
+
+    since = read_cursor(cursor) - timedelta(seconds=settings.ORDER_SYNC_OVERLAP)
+    orders = orders.filter(updated_at__gte=since)
+    removed = []
+    left = [code for code in STATUSES if code not in statuses]
+    if left:
+        removed = list(queryset.prefetch_related(None).filter(
+            status__in=left, updated_at__gte=since
+        ).values('id', 'status', 'version'))
+    return orders, removed, next_cursor
@@ -1,7 +1,8 @@
 from django.urls import path
-from .consumers import StaffOrderConsumer, KioskOrderConsumer
+from .consumers import StaffOrderConsumer, KioskOrderConsumer, AdminDashboardConsumer
 
 websocket_urlpatterns = [
     path('ws/staff/orders/', StaffOrderConsumer.as_asgi()),
     path('ws/kiosk/orders/', KioskOrderConsumer.as_asgi()),
+    path('ws/admin/dashboard/', AdminDashboardConsumer.as_asgi()),
 ]
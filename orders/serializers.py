@@ -1,9 +1,48 @@
 from rest_framework import serializers
 from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 from .models import Order, OrderItem, OrderStatusEvent
 from catalog.models import Product
-from clinic.models import Device
+
+
+def validate_order_items(value):
+    """
+    Validate items structure and products
+    Normalizes product_id and quantity to integers and checks every
+    product with a single query
+    """
+    if not value:
+        raise serializers.ValidationError("At least one item is required")
+
+    for item in value:
+        if 'product_id' not in item:
+            raise serializers.ValidationError("Each item must have product_id")
+        if 'quantity' not in item:
+            raise serializers.ValidationError("Each item must have quantity")
+
+        # Validate quantity
+        try:
+            quantity = int(item['quantity'])
+        except (ValueError, TypeError):
+            raise serializers.ValidationError("Quantity must be a number")
+        if quantity < 1:
+            raise serializers.ValidationError("Quantity must be at least 1")
+        item['quantity'] = quantity
+
+        try:
+            item['product_id'] = int(item['product_id'])
+        except (ValueError, TypeError):
+            raise serializers.ValidationError(f"Product {item['product_id']} not found or inactive")
+
+    # Validate products exist and are active
+    product_ids = {item['product_id'] for item in value}
+    active_ids = set(Product.objects.filter(id__in=product_ids, is_active=True).values_list('id', flat=True))
+    for item in value:
+        if item['product_id'] not in active_ids:
+            raise serializers.ValidationError(f"Product {item['product_id']} not found or inactive")
+
+    return value
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -75,17 +114,27 @@ class OrderSerializer(serializers.ModelSerializer):
             'cancelled_at',
             'items',
             'status_events',
+            'version',
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'placed_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'placed_at', 'version', 'created_at', 'updated_at']
+
+    @staticmethod
+    def prefetch(queryset):
+        """Load everything the serializer reads, in a fixed number of queries"""
+        return queryset.select_related('assignment', 'room', 'patient').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product__category')),
+            Prefetch('status_events', queryset=OrderStatusEvent.objects.select_related('changed_by'))
+        )
 
 
 class PublicOrderSerializer(serializers.ModelSerializer):
     """
     Serializer for Order (Public/Kiosk view)
+    The items of an order just placed can be passed in context['items'].
     """
-    items = OrderItemSerializer(many=True, read_only=True)
+    items = serializers.SerializerMethodField()
     status_display = serializers.CharField(source='get_status_display', read_only=True)
 
     class Meta:
@@ -100,52 +149,35 @@ class PublicOrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'status', 'placed_at', 'delivered_at']
 
+    @staticmethod
+    def prefetch(queryset):
+        """Load everything the serializer reads, in a fixed number of queries"""
+        return queryset.prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product__category'))
+        )
+
+    def get_items(self, obj):
+        items = self.context.get('items')
+        if items is None:
+            items = obj.items.all()
+        return OrderItemSerializer(items, many=True).data
+
 
 class CreateOrderSerializer(serializers.Serializer):
     """
     Serializer for creating orders from kiosk
     """
-    device_uid = serializers.CharField(required=True)
+    # Only read from kiosks without a device token; the view resolves the device
+    device_uid = serializers.CharField(required=False)
     items = serializers.ListField(
         child=serializers.DictField(),
         min_length=1,
         help_text='List of items: [{"product_id": 1, "quantity": 2}, ...]'
     )
 
-    def validate_device_uid(self, value):
-        """Validate device exists"""
-        try:
-            Device.objects.get(device_uid=value)
-        except Device.DoesNotExist:
-            raise serializers.ValidationError("Device not found")
-        return value
-
     def validate_items(self, value):
         """Validate items structure and products"""
-        if not value:
-            raise serializers.ValidationError("At least one item is required")
-
-        for item in value:
-            if 'product_id' not in item:
-                raise serializers.ValidationError("Each item must have product_id")
-            if 'quantity' not in item:
-                raise serializers.ValidationError("Each item must have quantity")
-
-            # Validate quantity
-            try:
-                quantity = int(item['quantity'])
-                if quantity < 1:
-                    raise serializers.ValidationError("Quantity must be at least 1")
-            except (ValueError, TypeError):
-                raise serializers.ValidationError("Quantity must be a number")
-
-            # Validate product exists and is active
-            try:
-                product = Product.objects.get(id=item['product_id'], is_active=True)
-            except Product.DoesNotExist:
-                raise serializers.ValidationError(f"Product {item['product_id']} not found or inactive")
-
-        return value
+        return validate_order_items(value)
 
 
 class OrderStatusChangeSerializer(serializers.Serializer):
@@ -177,27 +209,4 @@ class StaffCreateOrderSerializer(serializers.Serializer):
 
     def validate_items(self, value):
         """Validate items structure and products"""
-        if not value:
-            raise serializers.ValidationError("At least one item is required")
-
-        for item in value:
-            if 'product_id' not in item:
-                raise serializers.ValidationError("Each item must have product_id")
-            if 'quantity' not in item:
-                raise serializers.ValidationError("Each item must have quantity")
-
-            # Validate quantity
-            try:
-                quantity = int(item['quantity'])
-                if quantity < 1:
-                    raise serializers.ValidationError("Quantity must be at least 1")
-            except (ValueError, TypeError):
-                raise serializers.ValidationError("Quantity must be a number")
-
-            # Validate product exists and is active
-            try:
-                product = Product.objects.get(id=item['product_id'], is_active=True)
-            except Product.DoesNotExist:
-                raise serializers.ValidationError(f"Product {item['product_id']} not found or inactive")
-
-        return value
+        return validate_order_items(value)
@@ -0,0 +1,187 @@
+from .models import Order, OrderItem, OrderStatusEvent
+from catalog.models import Product
+from catalog.popularity import record_order_placed
+from inventory.models import InventoryBalance, InventoryMovement
+from inventory.reservations import LOCKING, InsufficientStock, get_reservation_mode, reserve
+from report_analytics import rollups
+
+
+CATEGORY_LIMIT_LABELS = {
+    'DRINK': 'bebidas',
+    'SNACK': 'snacks',
+    'OTHER': 'productos'
+}
+
+
+class OrderPlacementError(Exception):
+    """
+    Raised when an order cannot be placed.
+    Carries the error payload and HTTP status the API should answer with.
+    """
+
+    def __init__(self, payload, status_code=400):
+        super().__init__(payload.get('error'))
+        self.payload = payload
+        self.status_code = status_code
+
+
+def _group_lines(items_data):
+    """
+    Normalize item lines and sum the requested quantity per product
+    Returns (lines, requested) where lines keeps the original line order
+    """
+    lines = []
+    requested = {}
+    for item_data in items_data:
+        product_id = int(item_data['product_id'])
+        quantity = int(item_data['quantity'])
+        lines.append((product_id, quantity))
+        requested[product_id] = requested.get(product_id, 0) + quantity
+    return lines, requested
+
+
+def _load_products_and_balances(product_ids, lock=True):
+    """
+    Load every product of the order together with its inventory balance.
+    Balances are loaded in a single query, locked when `lock` is set (ordered
+    by product to avoid deadlocks); products without a balance row are fetched separately.
+    """
+    queryset = InventoryBalance.objects.select_related('product__category')
+    if lock:
+        queryset = queryset.select_for_update(of=('self',))
+    balances = {
+        balance.product_id: balance
+        for balance in queryset.filter(product_id__in=product_ids).order_by('product_id')
+    }
+    products = {product_id: balance.product for product_id, balance in balances.items()}
+
+    missing_ids = set(product_ids) - set(products)
+    if missing_ids:
+        for product in Product.objects.select_related('category').filter(id__in=missing_ids):
+            products[product.id] = product
+
+    return products, balances
+
+
+def _check_order_limits(order_limits, lines, products):
+    """Validate requested quantities against the assignment limits by category type"""
+    category_counts = {}
+    for product_id, quantity in lines:
+        category_type = products[product_id].category.category_type
+        category_counts[category_type] = category_counts.get(category_type, 0) + quantity
+
+    for category_type, count in category_counts.items():
+        max_allowed = order_limits.get(category_type, 999)  # 999 = no limit
+        if count > max_allowed:
+            category_label = CATEGORY_LIMIT_LABELS.get(category_type, 'productos')
+            raise OrderPlacementError({
+                'error': f'Has alcanzado tu límite de {category_label}. Máximo permitido: {max_allowed}',
+                'limit_reached': True,
+                'category_type': category_type,
+                'max_allowed': max_allowed,
+                'requested': count
+            })
+
+
+def place_order(*, device, patient_assignment, items_data, enforce_limits=True,
+                allow_untracked=False, created_by=None,
+                reserve_note='Reserved for order #{order_id}',
+                status_note='Order placed from kiosk', mode=None):
+    """
+    Place an order and reserve its inventory.
+    Must be called inside transaction.atomic().
+
+    All products and balances are loaded with one query, limits and stock
+    are validated in memory, items and movements are bulk inserted and every
+    balance is reserved with a single guarded UPDATE statement.
+    In 'locking' mode the balances are loaded with select_for_update(); in
+    'conditional' mode no locks are taken and the guarded UPDATE decides.
+
+    Returns (order, items); the items carry their products and categories,
+    so PublicOrderSerializer(order, context={'items': items}) needs no query.
+    Raises Product.DoesNotExist if a product is missing or inactive and
+    OrderPlacementError when a limit or the available stock is exceeded.
+    """
+    mode = mode or get_reservation_mode()
+    lines, requested = _group_lines(items_data)
+    products, balances = _load_products_and_balances(list(requested), lock=(mode == LOCKING))
+
+    for product_id in requested:
+        product = products.get(product_id)
+        if product is None or not product.is_active:
+            raise Product.DoesNotExist(f'Product {product_id} not found or inactive')
+
+    if enforce_limits:
+        _check_order_limits(patient_assignment.order_limits or {}, lines, products)
+
+    # Validate inventory availability for all products first
+    for product_id, quantity in requested.items():
+        balance = balances.get(product_id)
+        if balance is None:
+            if allow_untracked:
+                # Product not tracked in inventory, allow order
+                continue
+            available = 0
+        else:
+            available = balance.available
+
+        if available < quantity:
+            raise OrderPlacementError({
+                'error': f'Insufficient inventory for {products[product_id].name}. Available: {available}, Requested: {quantity}'
+            })
+
+    # Reserve inventory for every product in one statement
+    reserved = {product_id: quantity for product_id, quantity in requested.items() if product_id in balances}
+    try:
+        reserve(reserved)
+    except InsufficientStock as e:
+        raise OrderPlacementError({
+            'error': f'Insufficient inventory for {products[e.product_id].name}. Available: {e.available}, Requested: {e.requested}'
+        })
+    for product_id, quantity in reserved.items():
+        balances[product_id].reserved += quantity
+
+    order = Order.objects.create(
+        assignment=device,
+        patient_assignment=patient_assignment,
+        patient=patient_assignment.patient,
+        room=patient_assignment.room,
+        status='PLACED'
+    )
+
+    items = OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=products[product_id],
+            quantity=quantity,
+            unit_label=products[product_id].unit_label  # Snapshot unit_label
+        )
+        for product_id, quantity in lines
+    ])
+
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(
+            product=products[product_id],
+            movement_type='RESERVE',
+            quantity=quantity,
+            order=order,
+            created_by=created_by,
+            note=reserve_note.format(order_id=order.id)
+        )
+        for product_id, quantity in lines
+        if product_id in reserved
+    ])
+
+    # Create initial status event
+    OrderStatusEvent.objects.create(
+        order=order,
+        from_status='',
+        to_status='PLACED',
+        changed_by=created_by,
+        note=status_note
+    )
+
+    record_order_placed(order, items)
+    rollups.record_order_placed(order, items)
+
+    return order, items
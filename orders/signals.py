@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from clinic.models import Device, PatientAssignment
+from feedbacks.models import Feedback
+from inventory.models import InventoryBalance
+from inventory.signals import balances_changed
+from report_analytics.signals import rollups_changed
+from .dashboard_stats import dashboard_changed, invalidate_dashboard_stats
+
+
+@receiver(rollups_changed)
+def rollups_updated(sender, **kwargs):
+    """
+    Order counts on the dashboard come from the rollups
+    """
+    invalidate_dashboard_stats()
+
+
+@receiver(post_save, sender=Device)
+def device_saved(sender, instance, created, update_fields, **kwargs):
+    # Heartbeats only move the active device count, the TTL is enough for those
+    if update_fields and set(update_fields) <= {'last_seen_at', 'updated_at'}:
+        return
+    dashboard_changed()
+
+
+@receiver(post_save, sender=PatientAssignment)
+@receiver(post_delete, sender=PatientAssignment)
+@receiver(post_save, sender=Feedback)
+@receiver(post_save, sender=InventoryBalance)
+def dashboard_source_changed(sender, **kwargs):
+    dashboard_changed()
+
+
+@receiver(balances_changed)
+def stock_changed(sender, **kwargs):
+    dashboard_changed()
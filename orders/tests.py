@@ -1,3 +1,424 @@
-from django.test import TestCase
+import json
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.layers import channel_layers
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User, Role, UserRole
+from catalog.models import Product, ProductCategory
+from clinic.device_tokens import issue_device_token
+from clinic.models import Room, Device, Patient, PatientAssignment
+from common.outbox import dispatch_pending
+from common.models import OutboxEvent
+from feedbacks.models import Feedback
+from inventory.models import InventoryBalance, InventoryMovement
+from .dashboard_stats import LOCK_KEY, STATS_KEY, STALE_KEY, get_dashboard_stats, invalidate_dashboard_stats
+from .groups import DASHBOARD_GROUP, publish_to_staff
+from .models import Order, OrderItem, OrderStatusEvent
+from .queue_sync import EPOCH
+from .services import OrderPlacementError, place_order
+from common.redis_standin import RedisStandIn
+from .consumers import StaffOrderConsumer, KioskOrderConsumer, AdminDashboardConsumer
+
+
+class MultiWorkerChannelLayerTests(TestCase):
+    """
+    Two ASGI workers, each with its own channel layer connection, share the
+    staff_orders and device_<id> groups through a Redis-compatible server
+    """
+
+    def setUp(self):
+        self.standin = RedisStandIn(port=0).start()
+        self.addCleanup(self.standin.stop)
+
+        layer = {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {'hosts': [self.standin.url]},
+        }
+        # 'default' is worker A (views and outbox dispatcher), 'worker_b' serves the consumers
+        settings_override = override_settings(CHANNEL_LAYERS={'default': layer, 'worker_b': layer})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.staff = User.objects.create_user(email='staff@example.com', password='staff123', full_name='Staff')
+        UserRole.objects.create(user=self.staff, role=Role.objects.get_or_create(name=Role.STAFF)[0])
+        room = Room.objects.create(code='101')
+        self.device = Device.objects.create(device_uid='IPAD-TEST', room=room)
+        self.device.assigned_staff.add(self.staff)
+
+    async def _flush_layers(self):
+        await channel_layers['default'].flush()
+        await channel_layers['worker_b'].flush()
+
+    async def test_group_send_from_worker_a_reaches_kiosk_on_worker_b(self):
+        application = KioskOrderConsumer.as_asgi(channel_layer_alias='worker_b')
+        communicator = WebsocketCommunicator(application, '/ws/kiosk/orders/?device_uid=IPAD-TEST')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from(timeout=2))['type'], 'session_snapshot')
+
+        await channel_layers['default'].group_send(f'device_{self.device.id}', {
+            'type': 'order_status_changed',
+            'order_id': 1,
+            'status': 'READY',
+            'from_status': 'PREPARING',
+            'changed_at': '2025-01-01T12:00:00+00:00',
+        })
+
+        message = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(message['type'], 'order_status_changed')
+        self.assertEqual(message['status'], 'READY')
+
+        await communicator.disconnect()
+        await self._flush_layers()
+
+    async def test_outbox_dispatch_on_worker_a_reaches_staff_on_worker_b(self):
+        token = str(AccessToken.for_user(self.staff))
+        application = StaffOrderConsumer.as_asgi(channel_layer_alias='worker_b')
+        communicator = WebsocketCommunicator(application, f'/ws/staff/orders/?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await database_sync_to_async(publish_to_staff)({
+            'type': 'new_order',
+            'order_id': 7,
+            'room_code': '101',
+            'device_uid': 'IPAD-TEST',
+            'placed_at': '2025-01-01T12:00:00+00:00',
+        }, device_id=self.device.id)
+        await dispatch_pending()
+
+        message = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(message['type'], 'new_order')
+        self.assertEqual(message['order_id'], 7)
+
+        await communicator.disconnect()
+        await self._flush_layers()
+
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class StaffFanOutTests(TestCase):
+    """
+    Staff notifications only reach the staff attending the device and admins
+    """
+
+    def setUp(self):
+        staff_role = Role.objects.get_or_create(name=Role.STAFF)[0]
+        self.nurse_a = User.objects.create_user(email='a@example.com', password='staff123', full_name='Nurse A')
+        self.nurse_b = User.objects.create_user(email='b@example.com', password='staff123', full_name='Nurse B')
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        for nurse in (self.nurse_a, self.nurse_b):
+            UserRole.objects.create(user=nurse, role=staff_role)
+
+        self.device_a = Device.objects.create(device_uid='IPAD-A', room=Room.objects.create(code='101'))
+        self.device_b = Device.objects.create(device_uid='IPAD-B', room=Room.objects.create(code='102'))
+        self.device_a.assigned_staff.add(self.nurse_a)
+        PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient B', phone_e164='+15550000001'),
+            staff=self.nurse_b,
+            device=self.device_b,
+            room=self.device_b.room
+        )
+
+    async def _connect(self, user):
+        token = str(AccessToken.for_user(user))
+        communicator = WebsocketCommunicator(StaffOrderConsumer.as_asgi(), f'/ws/staff/orders/?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_new_order_reaches_device_staff_and_admins_only(self):
+        nurse_a = await self._connect(self.nurse_a)
+        nurse_b = await self._connect(self.nurse_b)
+        admin = await self._connect(self.admin)
+
+        await database_sync_to_async(publish_to_staff)({
+            'type': 'new_order',
+            'order_id': 1,
+            'room_code': '102',
+            'device_uid': 'IPAD-B',
+            'placed_at': '2025-01-01T12:00:00+00:00',
+        }, device_id=self.device_b.id)
+        await dispatch_pending()
+
+        self.assertEqual((await nurse_b.receive_json_from(timeout=1))['order_id'], 1)
+        self.assertEqual((await admin.receive_json_from(timeout=1))['order_id'], 1)
+        self.assertTrue(await nurse_a.receive_nothing())
+
+        for communicator in (nurse_a, nurse_b, admin):
+            await communicator.disconnect()
+
+
+class PlaceOrderTests(TestCase):
+    """
+    Kiosk and staff orders go through place_order: limits and stock are
+    checked before anything is written
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        drinks = ProductCategory.objects.create(name='Bebidas', category_type='DRINK')
+        snacks = ProductCategory.objects.create(name='Snacks', category_type='SNACK')
+        self.water = Product.objects.create(name='Agua', category=drinks, unit_label='vaso')
+        self.juice = Product.objects.create(name='Jugo', category=drinks)
+        self.cookie = Product.objects.create(name='Galleta', category=snacks)
+        InventoryBalance.objects.update(on_hand=5)
+
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        self.device = Device.objects.create(device_uid='IPAD-01', room=Room.objects.create(code='101'))
+        self.assignment = PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient', phone_e164='+15550000001'),
+            staff=self.admin,
+            device=self.device,
+            room=self.device.room
+        )
+
+    def place(self, items, **kwargs):
+        with transaction.atomic():
+            return place_order(
+                device=self.device,
+                patient_assignment=self.assignment,
+                items_data=[{'product_id': product.id, 'quantity': quantity} for product, quantity in items],
+                **kwargs
+            )
+
+    def assertNothingWritten(self):
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(InventoryMovement.objects.exists())
+        self.assertEqual(sum(InventoryBalance.objects.values_list('reserved', flat=True)), 0)
+
+    def test_category_limits(self):
+        # Default limits: one drink and one snack, summed over the lines of a category
+        with self.assertRaises(OrderPlacementError) as raised:
+            self.place([(self.water, 1), (self.juice, 1)])
+        self.assertEqual(raised.exception.payload['category_type'], 'DRINK')
+        self.assertEqual((raised.exception.payload['max_allowed'], raised.exception.payload['requested']), (1, 2))
+        self.assertNothingWritten()
+
+        order, items = self.place([(self.water, 1), (self.juice, 1)], enforce_limits=False)
+        self.assertEqual([item.product_id for item in items], [self.water.id, self.juice.id])
+        self.assertEqual(order.items.count(), 2)
+
+    def test_untracked_products(self):
+        InventoryBalance.objects.filter(product=self.cookie).delete()
+        with self.assertRaises(OrderPlacementError):
+            self.place([(self.water, 1), (self.cookie, 1)])
+        self.assertNothingWritten()
+
+        order, _ = self.place([(self.water, 1), (self.cookie, 1)], allow_untracked=True)
+        # Only tracked products are reserved
+        self.assertEqual(list(order.inventory_movements.values_list('product_id', flat=True)), [self.water.id])
+        self.assertEqual(InventoryBalance.objects.get(product=self.water).reserved, 1)
+
+    def test_insufficient_stock(self):
+        InventoryBalance.objects.filter(product=self.juice).update(on_hand=1)
+        with self.assertRaises(OrderPlacementError) as raised:
+            self.place([(self.water, 3), (self.juice, 2)], enforce_limits=False)
+        self.assertIn('Available: 1, Requested: 2', raised.exception.payload['error'])
+        self.assertNothingWritten()
+
+        with self.assertRaises(Product.DoesNotExist):
+            self.place([(self.water, 1)] + [(Product(id=0), 1)], enforce_limits=False)
+
+    def test_kiosk_and_staff_orders_write_the_same_rows(self):
+        items = {'items': [{'product_id': self.water.id, 'quantity': 1}, {'product_id': self.cookie.id, 'quantity': 1}]}
+        kiosk = self.client.post(
+            reverse('public-order-create'), items, format='json',
+            HTTP_X_DEVICE_TOKEN=issue_device_token(self.device)
+        )
+        self.client.force_authenticate(self.admin)
+        staff = self.client.post(reverse('order-create-order-for-patient', args=[self.assignment.id]), items, format='json')
+        self.assertEqual((kiosk.status_code, staff.status_code), (201, 201))
+
+        orders = [Order.objects.get(id=response.data['order']['id']) for response in (kiosk, staff)]
+        self.assertEqual(*[
+            list(OrderItem.objects.filter(order=order).values_list('product_id', 'quantity', 'unit_label'))
+            for order in orders
+        ])
+        self.assertEqual(*[
+            list(InventoryMovement.objects.filter(order=order).values_list('product_id', 'movement_type', 'quantity'))
+            for order in orders
+        ])
+        self.assertEqual(*[
+            list(OrderStatusEvent.objects.filter(order=order).values_list('from_status', 'to_status'))
+            for order in orders
+        ])
+        self.assertEqual(*[
+            [(item['product_name'], item['product_category'], item['unit_label']) for item in response.data['order']['items']]
+            for response in (kiosk, staff)
+        ])
+        self.assertEqual(InventoryBalance.objects.get(product=self.water).reserved, 2)
+
+
+class DashboardStatsCacheTests(TestCase):
+    """
+    The dashboard is computed once per TTL, invalidated by writes and never
+    recomputed by several requests at a time
+    """
+
+    def setUp(self):
+        cache.delete_many([STATS_KEY, STALE_KEY, LOCK_KEY])
+        self.addCleanup(cache.delete_many, [STATS_KEY, STALE_KEY, LOCK_KEY])
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        )
+        self.room = Room.objects.create(code='101')
+        self.url = reverse('dashboard-stats')
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+
+    def test_feedback_invalidates_snapshot(self):
+        self.assertEqual(self.client.get(self.url).data['satisfaction']['total_responses'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Feedback.objects.create(room=self.room, staff_rating=5, stay_rating=5)
+        self.assertEqual(self.client.get(self.url).data['satisfaction']['total_responses'], 1)
+
+    def test_concurrent_miss_gets_stale_snapshot(self):
+        stale = self.client.get(self.url).data
+        cache.delete(STATS_KEY)
+        # Another worker is computing
+        cache.add(LOCK_KEY, True)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data, stale)
+
+    def test_concurrent_miss_without_snapshot_computes(self):
+        cache.add(LOCK_KEY, True)
+        stats = get_dashboard_stats(allow_stale=False)
+        self.assertEqual(stats['rooms']['total_rooms'], 1)
+        # Only the lock holder stores the snapshot
+        self.assertIsNone(cache.get(STATS_KEY))
+
+    def test_invalidations_are_coalesced(self):
+        self.client.get(self.url)
+        invalidate_dashboard_stats()
+        invalidate_dashboard_stats()
+        self.assertEqual(OutboxEvent.objects.filter(group=DASHBOARD_GROUP).count(), 1)
+
+        self.client.get(self.url)
+        invalidate_dashboard_stats()
+        self.assertEqual(OutboxEvent.objects.filter(group=DASHBOARD_GROUP).count(), 2)
+
+
+@override_settings(ORDER_SYNC_OVERLAP=0)
+class QueueSyncTests(TestCase):
+    """
+    The staff queue syncs only the orders changed since the cursor, with
+    tombstones for the orders that left the queue
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        )
+        self.device = Device.objects.create(device_uid='IPAD-TEST', room=Room.objects.create(code='101'))
+        self.placed = Order.objects.create(assignment=self.device, room=self.device.room)
+        self.preparing = Order.objects.create(assignment=self.device, room=self.device.room, status='PREPARING')
+        self.url = reverse('order-queue-changes')
+
+    def sync(self, cursor=None):
+        response = self.client.get(self.url, {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def change_status(self, order, to_status):
+        response = self.client.patch(reverse('order-change-status', args=[order.id]), {'to_status': to_status})
+        self.assertEqual(response.status_code, 200)
+
+    def test_full_sync_then_changes_only(self):
+        full = self.sync()
+        self.assertEqual({order['id'] for order in full['orders']}, {self.placed.id, self.preparing.id})
+        self.assertEqual(full['removed'], [])
+
+        self.change_status(self.placed, 'PREPARING')
+        self.change_status(self.preparing, 'READY')
+        delta = self.sync(full['cursor'])
+        self.assertEqual([(order['id'], order['version']) for order in delta['orders']], [(self.placed.id, 2)])
+        self.assertEqual(delta['removed'], [{'id': self.preparing.id, 'status': 'READY', 'version': 2}])
+
+        self.assertEqual(self.sync(delta['cursor'])['orders'], [])
+
+    def test_unchanged_queue_costs_the_same_whatever_its_size(self):
+        cursor = self.sync()['cursor']
+        Order.objects.bulk_create([Order(assignment=self.device) for _ in range(20)])
+        Order.objects.filter(status='PLACED').update(updated_at=EPOCH)
+        with self.assertNumQueries(2):
+            delta = self.sync(cursor)
+        self.assertEqual((delta['orders'], delta['removed']), ([], []))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'yesterday'}).status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AdminDashboardConsumerTests(TestCase):
+    """
+    The live dashboard gets the full statistics once, then only the changed panels
+    """
+
+    def setUp(self):
+        cache.delete_many([STATS_KEY, STALE_KEY, LOCK_KEY])
+        self.addCleanup(cache.delete_many, [STATS_KEY, STALE_KEY, LOCK_KEY])
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        self.room = Room.objects.create(code='101')
+
+    async def test_snapshot_then_panel_delta(self):
+        token = str(AccessToken.for_user(self.admin))
+        communicator = WebsocketCommunicator(AdminDashboardConsumer.as_asgi(), f'/ws/admin/dashboard/?token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        snapshot = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(snapshot['type'], 'dashboard_snapshot')
+        self.assertEqual(snapshot['stats']['satisfaction']['total_responses'], 0)
+
+        await database_sync_to_async(Feedback.objects.create)(room=self.room, staff_rating=5, stay_rating=5)
+        # Normally run after commit by the Feedback post_save receiver
+        await database_sync_to_async(invalidate_dashboard_stats)()
+        await dispatch_pending()
+
+        delta = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(delta['type'], 'dashboard_delta')
+        self.assertEqual(list(delta['panels']), ['satisfaction'])
+        self.assertEqual(delta['panels']['satisfaction']['total_responses'], 1)
+
+        await communicator.disconnect()
+
+
+class WebSocketFanOutBenchTests(TestCase):
+    """
+    The fan-out harness delivers every message on both kinds of channel layer and cleans up
+    """
+
+    def test_no_drops(self):
+        path = f'{tempfile.mkdtemp()}/fanout.json'
+        call_command(
+            'bench_websocket_fanout', kiosks=20, staff=4, admins=2, events=30, rate=1000,
+            layers='memory,redis-pubsub', standin=True, output=path, stdout=StringIO()
+        )
+
+        with open(path) as results:
+            for result in json.load(results):
+                with self.subTest(layer=result['layer']):
+                    self.assertEqual(result['failed_connections'], 0)
+                    self.assertEqual((result['kiosk']['expected'], result['kiosk']['dropped']), (30, 0))
+                    self.assertEqual((result['staff']['expected'], result['staff']['dropped']), (90, 0))
+        self.assertFalse(Device.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
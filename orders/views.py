@@ -1,17 +1,23 @@
 from django.db import transaction
 from django.utils import timezone
+from django.views.decorators.http import require_GET
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from accounts.permissions import IsStaffOrAdmin
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from common.outbox import publish
+from common.responses import JSONResponse
+from .groups import device_group, publish_to_staff
 
 from .models import Order, OrderItem, OrderStatusEvent
 from catalog.models import Product
+from catalog.popularity import record_order_delivered
+from clinic.device_tokens import DeviceTokenError, adevice_from_request, device_from_request
 from clinic.models import Device
-from inventory.models import InventoryBalance, InventoryMovement
+from inventory.models import InventoryMovement
+from inventory.reservations import InventoryConflict, consume, release
+from report_analytics.rollups import record_status_change
 from .serializers import (
     OrderSerializer,
     PublicOrderSerializer,
@@ -20,12 +26,42 @@ from .serializers import (
     OrderCancelSerializer,
     StaffCreateOrderSerializer
 )
+from .queue_sync import InvalidCursor, changes_since
+from .services import place_order, OrderPlacementError
+
+
+def _quantities_by_product(items):
+    """Sum order item quantities per product"""
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+def _queue_statuses(request):
+    """Statuses of the ?status= filter of the staff queue, PLACED and PREPARING by default"""
+    statuses = [s.strip() for s in request.query_params.get('status', 'PLACED,PREPARING').split(',')]
+
+    # Validate statuses
+    valid_statuses = ['PLACED', 'PREPARING', 'READY', 'DELIVERED', 'CANCELLED']
+    statuses = [s for s in statuses if s in valid_statuses]
+
+    return statuses or ['PLACED', 'PREPARING']
+
+
+def _active_orders(device_id):
+    """Orders of the device that are not delivered or cancelled yet, newest first"""
+    return PublicOrderSerializer.prefetch(Order.objects.filter(
+        assignment_id=device_id,
+        status__in=['PLACED', 'PREPARING', 'READY']
+    )).order_by('-placed_at')
 
 
 class PublicOrderViewSet(viewsets.ViewSet):
     """
     Public ViewSet for orders (Kiosk/iPad)
-    No authentication required - uses device_uid
+    No user authentication - the kiosk sends its device token (clinic.device_tokens)
+    or, until it is enrolled, its device_uid
     """
     permission_classes = [AllowAny]
 
@@ -34,8 +70,8 @@ class PublicOrderViewSet(viewsets.ViewSet):
         """
         Create a new order from kiosk
         POST /api/public/orders/create
+        X-Device-Token: <device token>  (or "device_uid": "ipad-room-101" in the body)
         {
-            "device_uid": "ipad-room-101",
             "items": [
                 {"product_id": 1, "quantity": 2},
                 {"product_id": 2, "quantity": 1}
@@ -46,13 +82,18 @@ class PublicOrderViewSet(viewsets.ViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        device_uid = serializer.validated_data['device_uid']
         items_data = serializer.validated_data['items']
 
         try:
+            identity = device_from_request(request, serializer.validated_data.get('device_uid'))
+            if identity is None:
+                return Response({
+                    'error': 'X-Device-Token header or device_uid is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
             with transaction.atomic():
-                # Get device and validate it's active
-                device = Device.objects.select_for_update().get(device_uid=device_uid, is_active=True)
+                # Lock the device (also checks it is still active)
+                device = Device.objects.select_for_update().get(pk=identity.device_id, is_active=True)
 
                 # Get active patient assignment for this device
                 from clinic.models import PatientAssignment
@@ -74,135 +115,38 @@ class PublicOrderViewSet(viewsets.ViewSet):
                         'can_patient_order': False
                     }, status=status.HTTP_403_FORBIDDEN)
 
-                # Update device last_seen_at
-                device.last_seen_at = timezone.now()
-                device.save(update_fields=['last_seen_at'])
-
-                # VALIDATE ORDER LIMITS BY CATEGORY TYPE
-                order_limits = patient_assignment.order_limits or {}
-                category_counts = {}
-
-                # Count items by category type
-                for item_data in items_data:
-                    product = Product.objects.select_related('category').get(
-                        id=item_data['product_id'],
-                        is_active=True
-                    )
-                    category_type = product.category.category_type
-                    if category_type not in category_counts:
-                        category_counts[category_type] = 0
-                    category_counts[category_type] += item_data['quantity']
-
-                # Check against limits
-                for category_type, count in category_counts.items():
-                    max_allowed = order_limits.get(category_type, 999)  # 999 = no limit
-                    if count > max_allowed:
-                        category_label = {
-                            'DRINK': 'bebidas',
-                            'SNACK': 'snacks',
-                            'OTHER': 'productos'
-                        }.get(category_type, 'productos')
-
-                        return Response({
-                            'error': f'Has alcanzado tu límite de {category_label}. Máximo permitido: {max_allowed}',
-                            'limit_reached': True,
-                            'category_type': category_type,
-                            'max_allowed': max_allowed,
-                            'requested': count
-                        }, status=status.HTTP_400_BAD_REQUEST)
-
-                # Validate inventory availability for all items first
-                inventory_checks = []
-                for item_data in items_data:
-                    product = Product.objects.select_for_update().get(
-                        id=item_data['product_id'],
-                        is_active=True
-                    )
-
-                    # Get or create inventory balance with lock
-                    balance, created = InventoryBalance.objects.select_for_update().get_or_create(
-                        product=product,
-                        defaults={'on_hand': 0, 'reserved': 0}
-                    )
-
-                    # Check availability: available = on_hand - reserved
-                    available = balance.on_hand - balance.reserved
-                    requested_qty = item_data['quantity']
-
-                    if available < requested_qty:
-                        return Response({
-                            'error': f'Insufficient inventory for {product.name}. Available: {available}, Requested: {requested_qty}'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-
-                    inventory_checks.append({
-                        'product': product,
-                        'balance': balance,
-                        'quantity': requested_qty
-                    })
-
-                # Create order
-                order = Order.objects.create(
-                    assignment=device,
+                # Validate limits and stock, create items and reserve inventory
+                order, items = place_order(
+                    device=device,
                     patient_assignment=patient_assignment,
-                    patient=patient_assignment.patient,
-                    room=patient_assignment.room,
-                    status='PLACED'
-                )
-
-                # Create order items and reserve inventory
-                for check in inventory_checks:
-                    product = check['product']
-                    balance = check['balance']
-                    quantity = check['quantity']
-
-                    # Create order item
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=quantity,
-                        unit_label=product.unit_label  # Snapshot unit_label
-                    )
-
-                    # Reserve inventory
-                    balance.reserved += quantity
-                    balance.save(update_fields=['reserved', 'updated_at'])
-
-                    # Create inventory movement for reservation
-                    InventoryMovement.objects.create(
-                        product=product,
-                        movement_type='RESERVE',
-                        quantity=quantity,
-                        order=order,
-                        note=f'Reserved for order #{order.id}'
-                    )
-
-                # Create initial status event
-                OrderStatusEvent.objects.create(
-                    order=order,
-                    from_status='',
-                    to_status='PLACED',
-                    note='Order placed from kiosk'
+                    items_data=items_data
                 )
 
-                # Broadcast new order to staff via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    'staff_orders',
+                # Broadcast new order to the staff of this device and admins (sent after commit)
+                publish_to_staff(
                     {
                         'type': 'new_order',
                         'order_id': order.id,
                         'room_code': order.room.code if order.room else None,
                         'device_uid': device.device_uid,
                         'placed_at': order.placed_at.isoformat(),
-                    }
+                    },
+                    device_id=device.id,
+                    staff_id=patient_assignment.staff_id
                 )
 
                 return Response({
                     'success': True,
                     'message': 'Order created successfully',
-                    'order': PublicOrderSerializer(order).data
+                    'order': PublicOrderSerializer(order, context={'items': items}).data
                 }, status=status.HTTP_201_CREATED)
 
+        except OrderPlacementError as e:
+            return Response(e.payload, status=e.status_code)
+        except DeviceTokenError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_401_UNAUTHORIZED)
         except Device.DoesNotExist:
             return Response({
                 'error': 'Device not found or inactive'
@@ -220,28 +164,27 @@ class PublicOrderViewSet(viewsets.ViewSet):
     def active_orders(self, request):
         """
         Get active orders for a device
+        GET /api/public/orders/active  (X-Device-Token header)
         GET /api/public/orders/active?device_uid=ipad-room-101
         """
-        device_uid = request.query_params.get('device_uid')
-        if not device_uid:
-            return Response({
-                'error': 'device_uid parameter is required'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
         try:
-            device = Device.objects.get(device_uid=device_uid)
+            identity = device_from_request(request, request.query_params.get('device_uid'))
+            if identity is None:
+                return Response({
+                    'error': 'X-Device-Token header or device_uid parameter is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Get active orders (not delivered or cancelled)
-            orders = Order.objects.filter(
-                assignment=device,
-                status__in=['PLACED', 'PREPARING', 'READY']
-            ).prefetch_related('items', 'items__product').order_by('-placed_at')
+            orders = _active_orders(identity.device_id)
 
             return Response({
                 'success': True,
                 'orders': PublicOrderSerializer(orders, many=True).data
             }, status=status.HTTP_200_OK)
 
+        except DeviceTokenError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_401_UNAUTHORIZED)
         except Device.DoesNotExist:
             return Response({
                 'error': 'Device not found'
@@ -266,10 +209,10 @@ class PublicOrderViewSet(viewsets.ViewSet):
             ).get(id=assignment_id, is_active=True)
             
             # Get all delivered orders for this assignment
-            orders = Order.objects.filter(
+            orders = PublicOrderSerializer.prefetch(Order.objects.filter(
                 patient_assignment=assignment,
                 status='DELIVERED'
-            ).prefetch_related('items', 'items__product').order_by('-delivered_at')
+            )).order_by('-delivered_at')
             
             serializer = PublicOrderSerializer(orders, many=True)
             
@@ -293,20 +236,48 @@ class PublicOrderViewSet(viewsets.ViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+
+@require_GET
+async def active_orders_async(request):
+    """
+    Async PublicOrderViewSet.active_orders (same JSON), served on the event loop under ASGI
+    GET /api/public/async/orders/active  (X-Device-Token header or ?device_uid=)
+    """
+    try:
+        identity = await adevice_from_request(request, request.GET.get('device_uid'))
+        if identity is None:
+            return JSONResponse({
+                'error': 'X-Device-Token header or device_uid parameter is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = [order async for order in _active_orders(identity.device_id)]
+
+        return JSONResponse({
+            'success': True,
+            'orders': PublicOrderSerializer(orders, many=True).data
+        }, status=status.HTTP_200_OK)
+
+    except DeviceTokenError as e:
+        return JSONResponse({
+            'error': str(e)
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    except Device.DoesNotExist:
+        return JSONResponse({
+            'error': 'Device not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return JSONResponse({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for managing orders (Staff only)
     """
     serializer_class = OrderSerializer
     permission_classes = [IsStaffOrAdmin]
-    queryset = Order.objects.all().prefetch_related(
-        'items',
-        'items__product',
-        'status_events',
-        'assignment',
-        'room',
-        'patient'
-    ).order_by('-placed_at')
+    queryset = OrderSerializer.prefetch(Order.objects.all()).order_by('-placed_at')
 
     def get_queryset(self):
         """
@@ -347,24 +318,37 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
         Get orders in queue (PLACED or PREPARING)
         GET /api/orders/queue?status=PLACED,PREPARING&my_orders=true
         """
-        status_filter = request.query_params.get('status', 'PLACED,PREPARING')
-        statuses = [s.strip() for s in status_filter.split(',')]
-
-        # Validate statuses
-        valid_statuses = ['PLACED', 'PREPARING', 'READY', 'DELIVERED', 'CANCELLED']
-        statuses = [s for s in statuses if s in valid_statuses]
+        # Use get_queryset() to apply my_orders filter
+        orders = self.get_queryset().filter(status__in=_queue_statuses(request))
 
-        if not statuses:
-            statuses = ['PLACED', 'PREPARING']
+        data = self.get_serializer(orders, many=True).data
+        return Response({
+            'success': True,
+            'count': len(data),
+            'orders': data
+        }, status=status.HTTP_200_OK)
 
-        # Use get_queryset() to apply my_orders filter
-        orders = self.get_queryset().filter(status__in=statuses)
+    @action(detail=False, methods=['get'], url_path='queue/changes', url_name='queue-changes')
+    def queue_changes(self, request):
+        """
+        Changes to the order queue since the cursor of the previous call (orders.queue_sync)
+        GET /api/orders/queue/changes?status=PLACED,PREPARING&my_orders=true&cursor=...
+        Without a cursor the whole queue is returned.
+        """
+        try:
+            orders, removed, cursor = changes_since(
+                self.get_queryset(), _queue_statuses(request), request.query_params.get('cursor')
+            )
+        except InvalidCursor as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = self.get_serializer(orders, many=True)
         return Response({
             'success': True,
-            'count': orders.count(),
-            'orders': serializer.data
+            'cursor': cursor,
+            'orders': self.get_serializer(orders, many=True).data,
+            'removed': removed
         }, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['patch'], url_path='status')
@@ -403,21 +387,14 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                 # If changing to DELIVERED, consume inventory
                 if to_status == 'DELIVERED':
                     # Get all order items with products
-                    items = order.items.select_related('product').all()
+                    items = list(order.items.select_related('product').all())
 
-                    for item in items:
-                        # Get inventory balance with lock
-                        balance = InventoryBalance.objects.select_for_update().get(
-                            product=item.product
-                        )
+                    # Consume inventory in one statement: reserved -= qty, on_hand -= qty
+                    consumed = consume(_quantities_by_product(items))
 
-                        # Consume inventory: reserved -= qty, on_hand -= qty
-                        balance.reserved -= item.quantity
-                        balance.on_hand -= item.quantity
-                        balance.save(update_fields=['reserved', 'on_hand', 'updated_at'])
-
-                        # Create inventory movement for consumption
-                        InventoryMovement.objects.create(
+                    # Create inventory movements for consumption
+                    InventoryMovement.objects.bulk_create([
+                        InventoryMovement(
                             product=item.product,
                             movement_type='CONSUME',
                             quantity=item.quantity,
@@ -425,8 +402,12 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                             created_by=request.user if request.user.is_authenticated else None,
                             note=f'Consumed for order #{order.id} delivery'
                         )
+                        for item in items
+                        if item.product_id in consumed
+                    ])
 
                     order.delivered_at = timezone.now()
+                    record_order_delivered(order, items)
 
                     # Block patient from creating new orders when order is delivered
                     # Check if there are any other active orders (PLACED, PREPARING, READY)
@@ -450,6 +431,7 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                     order.cancelled_at = timezone.now()
 
                 order.save(update_fields=['status', 'delivered_at', 'cancelled_at', 'updated_at'])
+                record_status_change(order, from_status, to_status, items=items if to_status == 'DELIVERED' else None)
 
                 # Create status event
                 status_event = OrderStatusEvent.objects.create(
@@ -460,11 +442,10 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                     note=note
                 )
 
-                # Broadcast status change to kiosk via WebSocket
+                # Broadcast status change to kiosk via WebSocket (sent after commit)
                 if order.assignment:
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        f'device_{order.assignment.id}',
+                    publish(
+                        device_group(order.assignment.id),
                         {
                             'type': 'order_status_changed',
                             'order_id': order.id,
@@ -484,10 +465,10 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({
                 'error': 'Order not found'
             }, status=status.HTTP_404_NOT_FOUND)
-        except InventoryBalance.DoesNotExist:
+        except InventoryConflict as e:
             return Response({
-                'error': 'Inventory balance not found for one or more products'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({
                 'error': str(e)
@@ -525,20 +506,14 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                     }, status=status.HTTP_400_BAD_REQUEST)
 
                 # Release reserved inventory
-                items = order.items.select_related('product').all()
-
-                for item in items:
-                    # Get inventory balance with lock
-                    balance = InventoryBalance.objects.select_for_update().get(
-                        product=item.product
-                    )
+                items = list(order.items.select_related('product').all())
 
-                    # Release reservation: reserved -= qty
-                    balance.reserved -= item.quantity
-                    balance.save(update_fields=['reserved', 'updated_at'])
+                # Release reservations in one statement: reserved -= qty
+                released = release(_quantities_by_product(items))
 
-                    # Create inventory movement for release
-                    InventoryMovement.objects.create(
+                # Create inventory movements for release
+                InventoryMovement.objects.bulk_create([
+                    InventoryMovement(
                         product=item.product,
                         movement_type='RELEASE',
                         quantity=item.quantity,
@@ -546,11 +521,15 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                         created_by=request.user if request.user.is_authenticated else None,
                         note=f'Released from cancelled order #{order.id}'
                     )
+                    for item in items
+                    if item.product_id in released
+                ])
 
                 # Update order status
                 order.status = 'CANCELLED'
                 order.cancelled_at = timezone.now()
                 order.save(update_fields=['status', 'cancelled_at', 'updated_at'])
+                record_status_change(order, from_status, 'CANCELLED')
 
                 # Create status event
                 status_event = OrderStatusEvent.objects.create(
@@ -561,11 +540,10 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                     note=note or 'Order cancelled'
                 )
 
-                # Broadcast cancellation to kiosk via WebSocket
+                # Broadcast cancellation to kiosk via WebSocket (sent after commit)
                 if order.assignment:
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        f'device_{order.assignment.id}',
+                    publish(
+                        device_group(order.assignment.id),
                         {
                             'type': 'order_status_changed',
                             'order_id': order.id,
@@ -585,10 +563,10 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({
                 'error': 'Order not found'
             }, status=status.HTTP_404_NOT_FOUND)
-        except InventoryBalance.DoesNotExist:
+        except InventoryConflict as e:
             return Response({
-                'error': 'Inventory balance not found for one or more products'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({
                 'error': str(e)
@@ -633,116 +611,50 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                         'error': 'You can only create orders for your own assigned patients'
                     }, status=status.HTTP_403_FORBIDDEN)
 
-                # Validate inventory availability for all items
-                for item in items:
-                    product = Product.objects.select_related('category').get(
-                        id=item['product_id'],
-                        is_active=True
-                    )
-                    quantity = int(item['quantity'])
-
-                    # Check inventory if product is tracked
-                    try:
-                        inventory = InventoryBalance.objects.select_for_update().get(product=product)
-                        available = inventory.on_hand - inventory.reserved
-                        if available < quantity:
-                            return Response({
-                                'error': f'Insufficient inventory for {product.name}. Available: {available}, Requested: {quantity}'
-                            }, status=status.HTTP_400_BAD_REQUEST)
-                    except InventoryBalance.DoesNotExist:
-                        # Product not tracked in inventory, allow order
-                        pass
-
-                # Create the order
-                order = Order.objects.create(
-                    assignment=assignment.device,
-                    room=assignment.room,
-                    patient=assignment.patient,
+                # Validate stock, create the order and reserve inventory (no limits for staff)
+                order, items = place_order(
+                    device=assignment.device,
                     patient_assignment=assignment,
-                    status='PLACED',
-                    placed_at=timezone.now()
+                    items_data=items,
+                    enforce_limits=False,
+                    allow_untracked=True,
+                    created_by=request.user,
+                    reserve_note='Reserved for Order #{order_id} (created by staff)',
+                    status_note='Order created by staff for patient'
                 )
 
-                # Create order items and reserve inventory
-                for item in items:
-                    product = Product.objects.select_related('category').get(
-                        id=item['product_id'],
-                        is_active=True
-                    )
-                    quantity = int(item['quantity'])
-
-                    # Create order item
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=quantity,
-                        unit_label=product.unit_label
-                    )
-
-                    # Reserve inventory if product is tracked
-                    try:
-                        inventory = InventoryBalance.objects.select_for_update().get(product=product)
-                        inventory.reserved += quantity
-                        inventory.save(update_fields=['reserved', 'updated_at'])
-
-                        # Create inventory movement
-                        InventoryMovement.objects.create(
-                            product=product,
-                            movement_type='RESERVE',
-                            quantity=quantity,
-                            order=order,
-                            created_by=request.user,
-                            note=f'Reserved for Order #{order.id} (created by staff)'
-                        )
-                    except InventoryBalance.DoesNotExist:
-                        # Product not tracked, skip inventory operations
-                        pass
-
-                # Create status event
-                OrderStatusEvent.objects.create(
-                    order=order,
-                    from_status='',
-                    to_status='PLACED',
-                    changed_by=request.user,
-                    note='Order created by staff for patient'
+                # Notify the staff of this device and admins (sent after commit)
+                publish_to_staff(
+                    {
+                        'type': 'new_order',
+                        'order_id': order.id,
+                        'room_code': assignment.room.code if assignment.room else None,
+                        'device_uid': assignment.device.device_uid if assignment.device else None,
+                        'placed_at': order.placed_at.isoformat()
+                    },
+                    device_id=assignment.device_id,
+                    staff_id=assignment.staff_id
                 )
 
-                # Broadcast via WebSocket
-                try:
-                    channel_layer = get_channel_layer()
-                    if channel_layer:
-                        # Notify staff dashboard
-                        async_to_sync(channel_layer.group_send)(
-                            'staff_orders',
-                            {
-                                'type': 'new_order',
-                                'order_id': order.id,
-                                'room_code': assignment.room.code if assignment.room else None,
-                                'device_uid': assignment.device.device_uid if assignment.device else None,
-                                'placed_at': order.placed_at.isoformat()
-                            }
-                        )
-
-                        # Notify kiosk (patient device) to redirect to order status
-                        if assignment.device:
-                            async_to_sync(channel_layer.group_send)(
-                                f'device_{assignment.device.id}',
-                                {
-                                    'type': 'order_created_by_staff',
-                                    'order_id': order.id,
-                                    'placed_at': order.placed_at.isoformat()
-                                }
-                            )
-                except Exception as ws_error:
-                    # Log but don't fail the request
-                    print(f'WebSocket broadcast failed: {ws_error}')
+                # Notify kiosk (patient device) to redirect to order status
+                if assignment.device:
+                    publish(
+                        device_group(assignment.device.id),
+                        {
+                            'type': 'order_created_by_staff',
+                            'order_id': order.id,
+                            'placed_at': order.placed_at.isoformat()
+                        }
+                    )
 
                 return Response({
                     'success': True,
                     'message': 'Order created successfully for patient',
-                    'order': PublicOrderSerializer(order, context={'request': request}).data
+                    'order': PublicOrderSerializer(order, context={'request': request, 'items': items}).data
                 }, status=status.HTTP_201_CREATED)
 
+        except OrderPlacementError as e:
+            return Response(e.payload, status=e.status_code)
         except PatientAssignment.DoesNotExist:
             return Response({
                 'error': 'Patient assignment not found'
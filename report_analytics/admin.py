@@ -1,3 +1,17 @@
 from django.contrib import admin
+from .models import OrderRollup, ProductRollup
 
-# Register your models here.
+
+@admin.register(OrderRollup)
+class OrderRollupAdmin(admin.ModelAdmin):
+    list_display = ['period', 'bucket', 'room', 'order_count', 'delivered_count', 'cancelled_count', 'item_quantity']
+    list_filter = ['period', 'room']
+    date_hierarchy = 'bucket'
+
+
+@admin.register(ProductRollup)
+class ProductRollupAdmin(admin.ModelAdmin):
+    list_display = ['period', 'bucket', 'product', 'category', 'order_count', 'quantity', 'delivered_quantity']
+    list_filter = ['period', 'category']
+    search_fields = ['product__name']
+    date_hierarchy = 'bucket'
@@ -0,0 +1,41 @@
+"""
+Management command to rebuild the hourly and daily order rollups from raw orders
+Processes the order history in chunks of days, each chunk in its own transaction.
+Usage: python manage.py rebuild_order_rollups [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--chunk-days 7]
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from report_analytics.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes OrderRollup and ProductRollup rows from Order and OrderItem'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', help='First day to rebuild (default: first order)')
+        parser.add_argument('--to', dest='to_date', help='Last day to rebuild (default: last order)')
+        parser.add_argument('--chunk-days', type=int, default=7, help='Days rebuilt per transaction')
+
+    def _parse(self, value):
+        if not value:
+            return None
+        try:
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f'Invalid date "{value}", use YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be positive')
+
+        self.stdout.write('Rebuilding order rollups...')
+        chunks = rebuild_rollups(
+            start=self._parse(options['from_date']),
+            end=self._parse(options['to_date']),
+            chunk_days=options['chunk_days'],
+            stdout=self.stdout
+        )
+        self.stdout.write(self.style.SUCCESS(f'Done: {chunks} chunk(s) rebuilt'))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('catalog', '0007_product_rating_sum'),
+        ('clinic', '0007_patientassignment_survey_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('HOUR', 'Hour'), ('DAY', 'Day')], max_length=4, verbose_name='period')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour or day', verbose_name='bucket')),
+                ('order_count', models.IntegerField(default=0, help_text='Orders placed', verbose_name='order count')),
+                ('placed_count', models.IntegerField(default=0, help_text='Orders currently PLACED', verbose_name='placed')),
+                ('preparing_count', models.IntegerField(default=0, verbose_name='preparing')),
+                ('ready_count', models.IntegerField(default=0, verbose_name='ready')),
+                ('delivered_count', models.IntegerField(default=0, verbose_name='delivered')),
+                ('cancelled_count', models.IntegerField(default=0, verbose_name='cancelled')),
+                ('item_quantity', models.IntegerField(default=0, help_text='Units ordered', verbose_name='item quantity')),
+                ('delivery_seconds', models.FloatField(default=0, help_text='Sum of placed-to-delivered durations of the delivered orders', verbose_name='delivery seconds')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='clinic.room', verbose_name='room')),
+            ],
+            options={
+                'verbose_name': 'order rollup',
+                'verbose_name_plural': 'order rollups',
+                'ordering': ['period', 'bucket'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'room'), name='unique_order_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('HOUR', 'Hour'), ('DAY', 'Day')], max_length=4, verbose_name='period')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour or day', verbose_name='bucket')),
+                ('line_count', models.IntegerField(default=0, help_text='Order lines with this product', verbose_name='line count')),
+                ('order_count', models.IntegerField(default=0, help_text='Orders with this product', verbose_name='order count')),
+                ('quantity', models.IntegerField(default=0, help_text='Units ordered', verbose_name='quantity')),
+                ('delivered_order_count', models.IntegerField(default=0, verbose_name='delivered orders')),
+                ('delivered_quantity', models.IntegerField(default=0, verbose_name='delivered quantity')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.productcategory', verbose_name='category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'product rollup',
+                'verbose_name_plural': 'product rollups',
+                'ordering': ['period', 'bucket'],
+                'indexes': [models.Index(fields=['period', 'category', 'bucket'], name='report_anal_period_222b55_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'product'), name='unique_product_rollup')],
+            },
+        ),
+    ]
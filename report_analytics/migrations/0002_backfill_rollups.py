@@ -0,0 +1,36 @@
+# Generated manually: fill the rollups with the orders placed before they existed
+
+from django.db import migrations
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Without this the dashboard and reports show no history until
+    rebuild_order_rollups runs, and status changes of older orders
+    subtract from zeroed rows
+    """
+    from report_analytics.rollups import rebuild_rollups
+
+    rebuild_rollups(models=(
+        apps.get_model('orders', 'Order'),
+        apps.get_model('orders', 'OrderItem'),
+        apps.get_model('report_analytics', 'OrderRollup'),
+        apps.get_model('report_analytics', 'ProductRollup'),
+    ))
+
+
+def clear_rollups(apps, schema_editor):
+    apps.get_model('report_analytics', 'OrderRollup').objects.all().delete()
+    apps.get_model('report_analytics', 'ProductRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_patient_assignment'),
+        ('report_analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, clear_rollups),
+    ]
@@ -1,3 +1,89 @@
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+
+PERIOD_CHOICES = [
+    ('HOUR', _('Hour')),
+    ('DAY', _('Day')),
+]
+
+
+class OrderRollup(models.Model):
+    """
+    Order counters per hour or day of placement and room
+    Maintained incrementally on every order status transition (see report_analytics.rollups).
+    Orders are bucketed by placed_at; the status counts follow the current status of those orders.
+    """
+    period = models.CharField(_('period'), max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(_('bucket'), help_text=_('Start of the hour or day'))
+    room = models.ForeignKey(
+        'clinic.Room',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_('room')
+    )
+    order_count = models.IntegerField(_('order count'), default=0, help_text=_('Orders placed'))
+    placed_count = models.IntegerField(_('placed'), default=0, help_text=_('Orders currently PLACED'))
+    preparing_count = models.IntegerField(_('preparing'), default=0)
+    ready_count = models.IntegerField(_('ready'), default=0)
+    delivered_count = models.IntegerField(_('delivered'), default=0)
+    cancelled_count = models.IntegerField(_('cancelled'), default=0)
+    item_quantity = models.IntegerField(_('item quantity'), default=0, help_text=_('Units ordered'))
+    delivery_seconds = models.FloatField(
+        _('delivery seconds'),
+        default=0,
+        help_text=_('Sum of placed-to-delivered durations of the delivered orders')
+    )
+
+    class Meta:
+        verbose_name = _('order rollup')
+        verbose_name_plural = _('order rollups')
+        ordering = ['period', 'bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'room'], name='unique_order_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.period} {self.bucket:%Y-%m-%d %H:%M} room={self.room_id}: {self.order_count} orders'
+
+
+class ProductRollup(models.Model):
+    """
+    Product counters per hour or day of order placement
+    Maintained like OrderRollup; category is a copy of the product category at order time.
+    """
+    period = models.CharField(_('period'), max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(_('bucket'), help_text=_('Start of the hour or day'))
+    product = models.ForeignKey(
+        'catalog.Product',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('product')
+    )
+    category = models.ForeignKey(
+        'catalog.ProductCategory',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('category')
+    )
+    line_count = models.IntegerField(_('line count'), default=0, help_text=_('Order lines with this product'))
+    order_count = models.IntegerField(_('order count'), default=0, help_text=_('Orders with this product'))
+    quantity = models.IntegerField(_('quantity'), default=0, help_text=_('Units ordered'))
+    delivered_order_count = models.IntegerField(_('delivered orders'), default=0)
+    delivered_quantity = models.IntegerField(_('delivered quantity'), default=0)
+
+    class Meta:
+        verbose_name = _('product rollup')
+        verbose_name_plural = _('product rollups')
+        ordering = ['period', 'bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'product'], name='unique_product_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'category', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f'{self.period} {self.bucket:%Y-%m-%d %H:%M} product={self.product_id}: {self.quantity} units'
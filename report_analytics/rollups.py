@@ -0,0 +1,235 @@
+"""
+Hourly and daily order rollups
+
+OrderRollup (per room) and ProductRollup (per product, with its category)
+hold order counters per hour and per day of placement. They are updated
+after commit on every status transition, so the dashboard and the reports
+sum a few rollup rows instead of scanning Order and OrderItem: a year-long
+daily report reads 365 rows per room whatever the order volume. A failed
+update never fails the committed order; it is printed and repaired with
+rebuild_order_rollups.
+
+Orders are bucketed by placed_at in the current time zone. The status
+counts follow the current status of the orders placed in the bucket, which
+is what the reports show.
+"""
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, DurationField, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from common.transactions import robust_on_commit
+from orders.models import Order, OrderItem
+from .models import OrderRollup, ProductRollup
+from .signals import rollups_changed
+
+
+HOUR = 'HOUR'
+DAY = 'DAY'
+
+DEFAULT_MODELS = (Order, OrderItem, OrderRollup, ProductRollup)
+
+STATUS_FIELDS = {
+    'PLACED': 'placed_count',
+    'PREPARING': 'preparing_count',
+    'READY': 'ready_count',
+    'DELIVERED': 'delivered_count',
+    'CANCELLED': 'cancelled_count',
+}
+
+
+def hour_bucket(at):
+    return timezone.localtime(at).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(at):
+    return timezone.localtime(at).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _apply(model, at, dimension, deltas, defaults=None):
+    """
+    Add deltas {key: {field: delta}} to the HOUR and DAY rows of `at`
+    `dimension` is the key column ('room_id' or 'product_id'). Missing rows
+    are inserted first (ignore_conflicts), then all rows are updated by one statement.
+    """
+    defaults = defaults or {}
+    buckets = {HOUR: hour_bucket(at), DAY: day_bucket(at)}
+
+    new_rows = []
+    for period, bucket in buckets.items():
+        for key in deltas:
+            lookup = {'period': period, 'bucket': bucket, dimension: key}
+            # NULL never conflicts on the unique constraint, check first (orders without room are legacy only)
+            if key is None and model.objects.filter(**lookup).exists():
+                continue
+            new_rows.append(model(**lookup, **defaults.get(key, {})))
+    model.objects.bulk_create(new_rows, ignore_conflicts=True)
+
+    fields = {field for key_deltas in deltas.values() for field in key_deltas}
+    updates = {
+        field: F(field) + Case(
+            *[When(**{dimension: key}, then=Value(key_deltas.get(field, 0))) for key, key_deltas in deltas.items()],
+            default=Value(0),
+            output_field=FloatField() if field == 'delivery_seconds' else IntegerField()
+        )
+        for field in fields
+    }
+    model.objects.filter(
+        reduce(or_, [Q(period=period, bucket=bucket) for period, bucket in buckets.items()]),
+        reduce(or_, [Q(**{dimension: key}) for key in deltas])
+    ).update(**updates)
+
+
+def _product_deltas(items, delivered=False):
+    deltas, categories = {}, {}
+    for item in items:
+        row = deltas.setdefault(item.product_id, {})
+        categories[item.product_id] = {'category_id': item.product.category_id}
+        if delivered:
+            row['delivered_order_count'] = 1
+            row['delivered_quantity'] = row.get('delivered_quantity', 0) + item.quantity
+        else:
+            row['order_count'] = 1
+            row['line_count'] = row.get('line_count', 0) + 1
+            row['quantity'] = row.get('quantity', 0) + item.quantity
+    return deltas, categories
+
+
+def record_order_placed(order, items):
+    """Count a newly placed order and its items, after commit"""
+    order_deltas = {order.room_id: {
+        'order_count': 1,
+        STATUS_FIELDS[order.status]: 1,
+        'item_quantity': sum(item.quantity for item in items),
+    }}
+    product_deltas, categories = _product_deltas(items)
+    placed_at = order.placed_at
+
+    def apply():
+        _apply(OrderRollup, placed_at, 'room_id', order_deltas)
+        _apply(ProductRollup, placed_at, 'product_id', product_deltas, defaults=categories)
+        rollups_changed.send(sender=OrderRollup)
+
+    robust_on_commit(apply, f'Rollup update of placed order #{order.id} failed, run rebuild_order_rollups')
+
+
+def record_status_change(order, from_status, to_status, items=None):
+    """
+    Move an order from one status count to another, after commit
+    Deliveries also add the placed-to-delivered duration and, given the
+    order items, the delivered product counters.
+    """
+    if from_status == to_status:
+        return
+
+    deltas = {STATUS_FIELDS[from_status]: -1, STATUS_FIELDS[to_status]: 1}
+    if to_status == 'DELIVERED' and order.delivered_at:
+        deltas['delivery_seconds'] = (order.delivered_at - order.placed_at).total_seconds()
+    product_deltas, categories = _product_deltas(items or [], delivered=True) if to_status == 'DELIVERED' else ({}, {})
+    room_id = order.room_id
+    placed_at = order.placed_at
+
+    def apply():
+        _apply(OrderRollup, placed_at, 'room_id', {room_id: deltas})
+        if product_deltas:
+            _apply(ProductRollup, placed_at, 'product_id', product_deltas, defaults=categories)
+        rollups_changed.send(sender=OrderRollup)
+
+    robust_on_commit(
+        apply, f'Rollup update of order #{order.id} ({from_status} -> {to_status}) failed, run rebuild_order_rollups'
+    )
+
+
+def _order_rows(OrderRollup, period, trunc, orders, items):
+    """Rollup rows of a period computed from raw orders with GROUP BY queries"""
+    delivered = Q(status='DELIVERED')
+    rows = {}
+    for row in orders.annotate(b=trunc('placed_at')).values('b', 'room_id').annotate(
+        order_count=Count('id'),
+        delivery=Sum(F('delivered_at') - F('placed_at'), filter=delivered, output_field=DurationField()),
+        **{field: Count('id', filter=Q(status=order_status)) for order_status, field in STATUS_FIELDS.items()}
+    ).order_by():
+        rows[row['b'], row['room_id']] = OrderRollup(
+            period=period,
+            bucket=row['b'],
+            room_id=row['room_id'],
+            order_count=row['order_count'],
+            delivery_seconds=row['delivery'].total_seconds() if row['delivery'] else 0,
+            **{field: row[field] for field in STATUS_FIELDS.values()}
+        )
+    for row in items.annotate(b=trunc('order__placed_at')).values('b', 'order__room_id').annotate(
+        units=Sum('quantity')
+    ).order_by():
+        rows[row['b'], row['order__room_id']].item_quantity = row['units']
+    return rows.values()
+
+
+def _product_rows(ProductRollup, period, trunc, items):
+    delivered = Q(order__status='DELIVERED')
+    return [
+        ProductRollup(
+            period=period,
+            bucket=row['b'],
+            product_id=row['product_id'],
+            category_id=row['product__category_id'],
+            line_count=row['lines'],
+            order_count=row['orders'],
+            quantity=row['units'],
+            delivered_order_count=row['delivered_orders'],
+            delivered_quantity=row['delivered_units'],
+        )
+        for row in items.annotate(b=trunc('order__placed_at')).values('b', 'product_id', 'product__category_id').annotate(
+            lines=Count('id'),
+            orders=Count('order', distinct=True),
+            units=Sum('quantity'),
+            delivered_orders=Count('order', distinct=True, filter=delivered),
+            delivered_units=Sum('quantity', filter=delivered, default=0),
+        ).order_by()
+    ]
+
+
+def rebuild_rollups(start=None, end=None, chunk_days=7, stdout=None, models=None):
+    """
+    Recompute the rollups from raw orders, one chunk of days at a time
+    Each chunk is replaced in its own transaction with a handful of GROUP BY
+    queries. Transitions committed while a chunk is rebuilt may be lost, run
+    it during a quiet period.
+    `models` is (Order, OrderItem, OrderRollup, ProductRollup), the historical
+    models when called from a migration.
+    """
+    Order, OrderItem, OrderRollup, ProductRollup = models or DEFAULT_MODELS
+    if start is None or end is None:
+        first = Order.objects.order_by('placed_at').values_list('placed_at', flat=True).first()
+        last = Order.objects.order_by('-placed_at').values_list('placed_at', flat=True).first()
+        if first is None:
+            return 0
+        start = start or first
+        end = end or last
+
+    chunk_start = day_bucket(start)
+    end = day_bucket(end) + timedelta(days=1)
+    chunks = 0
+    while chunk_start < end:
+        chunk_end = min(day_bucket(chunk_start + timedelta(days=chunk_days, hours=12)), end)
+        orders = Order.objects.filter(placed_at__gte=chunk_start, placed_at__lt=chunk_end)
+        items = OrderItem.objects.filter(order__placed_at__gte=chunk_start, order__placed_at__lt=chunk_end)
+
+        with transaction.atomic():
+            OrderRollup.objects.filter(bucket__gte=chunk_start, bucket__lt=chunk_end).delete()
+            ProductRollup.objects.filter(bucket__gte=chunk_start, bucket__lt=chunk_end).delete()
+            for period, trunc in ((HOUR, TruncHour), (DAY, TruncDay)):
+                OrderRollup.objects.bulk_create(_order_rows(OrderRollup, period, trunc, orders, items))
+                ProductRollup.objects.bulk_create(_product_rows(ProductRollup, period, trunc, items))
+
+        chunks += 1
+        if stdout:
+            stdout.write(f'  {chunk_start:%Y-%m-%d} - {chunk_end:%Y-%m-%d} rebuilt')
+        chunk_start = chunk_end
+
+    if models is None:
+        rollups_changed.send(sender=OrderRollup)
+    return chunks
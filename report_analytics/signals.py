@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent after the order rollups are updated (report_analytics.rollups), outside
+# of any transaction. No arguments.
+rollups_changed = Signal()
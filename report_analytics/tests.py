@@ -1,3 +1,174 @@
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from catalog.models import ProductCategory, Product
+from clinic.models import Room, Device, Patient, PatientAssignment
+from common.timing import endpoint_stats
+from inventory.models import InventoryBalance
+from orders.models import Order
+from orders.services import place_order
+from .models import OrderRollup, ProductRollup
+
+
+class DailyOrdersReportTests(TestCase):
+    """
+    The daily orders report is one GROUP BY query, whatever the range length
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        )
+        for day, order_status in [(1, 'DELIVERED'), (1, 'CANCELLED'), (1, 'PLACED'), (3, 'DELIVERED')]:
+            order = Order.objects.create(status=order_status)
+            # placed_at is auto_now_add, set it afterwards
+            Order.objects.filter(id=order.id).update(placed_at=datetime(2025, 1, day, 12, tzinfo=timezone.utc))
+        # Orders written behind the application's back, rebuild the rollups
+        call_command('rebuild_order_rollups', stdout=StringIO())
+        self.url = reverse('reports-daily-orders')
+
+    def test_counts_and_gaps(self):
+        response = self.client.get(self.url, {'from': '2025-01-01', 'to': '2025-01-03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_orders'], 4)
+        self.assertEqual(response.data['status_breakdown']['delivered'], 2)
+        self.assertEqual(response.data['status_breakdown']['preparing'], 0)
+        self.assertEqual(response.data['daily_breakdown'], [
+            {'date': '2025-01-01', 'total': 3, 'delivered': 1, 'cancelled': 1},
+            {'date': '2025-01-02', 'total': 0, 'delivered': 0, 'cancelled': 0},
+            {'date': '2025-01-03', 'total': 1, 'delivered': 1, 'cancelled': 0},
+        ])
+
+    def test_query_budget_is_constant(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'from': '2025-01-01', 'to': '2025-01-07'})
+        self.assertEqual(len(response.data['daily_breakdown']), 7)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'from': '2024-10-04', 'to': '2025-01-01'})
+        self.assertEqual(len(response.data['daily_breakdown']), 90)
+
+
+class OrderRollupTests(TestCase):
+    """
+    Rollups follow order transitions and match a rebuild from raw orders
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        self.client.force_authenticate(self.admin)
+        drinks = ProductCategory.objects.create(name='Bebidas', category_type='DRINK')
+        self.water = Product.objects.create(name='Agua', category=drinks)
+        self.juice = Product.objects.create(name='Jugo', category=drinks)
+        InventoryBalance.objects.update(on_hand=100)
+
+        room = Room.objects.create(code='101')
+        self.device = Device.objects.create(device_uid='IPAD-01', room=room)
+        self.assignment = PatientAssignment.objects.create(
+            patient=Patient.objects.create(full_name='Patient', phone_e164='+15550000001'),
+            staff=self.admin,
+            device=self.device,
+            room=room
+        )
+
+    def _place(self, items_data):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            order, _ = place_order(
+                device=self.device,
+                patient_assignment=self.assignment,
+                items_data=items_data,
+                enforce_limits=False
+            )
+        return order
+
+    def _snapshot(self):
+        orders = sorted(OrderRollup.objects.values_list(
+            'period', 'bucket', 'room_id', 'order_count', 'placed_count', 'preparing_count',
+            'delivered_count', 'cancelled_count', 'item_quantity'
+        ))
+        products = sorted(ProductRollup.objects.values_list(
+            'period', 'bucket', 'product_id', 'line_count', 'order_count', 'quantity',
+            'delivered_order_count', 'delivered_quantity'
+        ))
+        return orders, products
+
+    def test_transitions_match_rebuild(self):
+        delivered = self._place([{'product_id': self.water.id, 'quantity': 2}, {'product_id': self.juice.id, 'quantity': 1}])
+        cancelled = self._place([{'product_id': self.water.id, 'quantity': 1}])
+        self._place([{'product_id': self.juice.id, 'quantity': 3}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('order-change-status', args=[delivered.id]), {'to_status': 'DELIVERED'}, format='json')
+            self.client.post(reverse('order-cancel-order', args=[cancelled.id]), {}, format='json')
+
+        day = OrderRollup.objects.get(period='DAY')
+        self.assertEqual(
+            (day.order_count, day.placed_count, day.delivered_count, day.cancelled_count, day.item_quantity),
+            (3, 1, 1, 1, 7)
+        )
+        water = ProductRollup.objects.get(period='DAY', product=self.water)
+        self.assertEqual((water.order_count, water.quantity, water.delivered_quantity), (2, 3, 2))
+
+        incremental = self._snapshot()
+        call_command('rebuild_order_rollups', stdout=StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+
+        # The migration backfills the orders placed before the rollups existed
+        OrderRollup.objects.all().delete()
+        ProductRollup.objects.all().delete()
+        import_module('report_analytics.migrations.0002_backfill_rollups').backfill_rollups(apps, None)
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_failed_update_does_not_fail_the_order(self):
+        with mock.patch('report_analytics.rollups._apply', side_effect=DatabaseError('lock timeout')), \
+                redirect_stdout(StringIO()) as stdout, self.assertLogs('django', 'ERROR'):
+            order = self._place([{'product_id': self.water.id, 'quantity': 1}])
+
+        self.assertTrue(Order.objects.filter(id=order.id).exists())
+        self.assertIn('run rebuild_order_rollups', stdout.getvalue())
+        self.assertFalse(OrderRollup.objects.exists())
+
+
+class RequestTimingTests(TestCase):
+    """
+    Every request reports its query count and timings, the worst endpoints are listed
+    """
+
+    def setUp(self):
+        # Nothing cached, the dashboard runs its queries
+        cache.clear()
+        endpoint_stats.reset()
+        self.addCleanup(endpoint_stats.reset)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser(email='admin@example.com', password='admin123', full_name='Admin')
+        )
+
+    def test_server_timing_and_worst_endpoints(self):
+        response = self.client.get(reverse('reports-daily-orders'), {'from': '2025-01-01', 'to': '2025-01-07'})
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.client.get(reverse('dashboard-stats'))
+
+        response = self.client.get(reverse('reports-endpoints'), {'order_by': 'queries'})
+        self.assertEqual(response.status_code, 200)
+        results = {row['endpoint']: row for row in response.data['results']}
+        self.assertEqual(results['GET reports-daily-orders']['max_queries'], 1)
+        self.assertEqual(response.data['results'][0]['endpoint'], 'GET dashboard-stats')
 
-# Create your tests here.
+        self.assertEqual(self.client.get(reverse('reports-endpoints'), {'order_by': 'x'}).status_code, 400)
@@ -1,12 +1,24 @@
-from datetime import datetime
-from django.db.models import Count, Avg, Sum, Q
+from datetime import datetime, timedelta
+from django.db.models import Count, Avg, Sum
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from accounts.permissions import IsStaffOrAdmin
+from common.timing import worst_endpoints
 
-from orders.models import Order, OrderItem
-from feedbacks.models import Feedback
+from feedbacks.models import Feedback, ProductRating
+from .models import OrderRollup, ProductRollup
+from .rollups import DAY, STATUS_FIELDS
+
+
+def _rating_distribution(queryset, field):
+    """Count of 1-5 star values of a rating field, in one GROUP BY query"""
+    distribution = {rating: 0 for rating in range(1, 6)}
+    for row in queryset.values(field).annotate(count=Count('id')).order_by():
+        if row[field] in distribution:
+            distribution[row[field]] = row['count']
+    return distribution
 
 
 class ReportsViewSet(viewsets.ViewSet):
@@ -35,46 +47,51 @@ class ReportsViewSet(viewsets.ViewSet):
             from_datetime = datetime.strptime(from_date, '%Y-%m-%d')
             to_datetime = datetime.strptime(to_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
 
-            # Query orders in date range
-            orders = Order.objects.filter(
-                placed_at__gte=from_datetime,
-                placed_at__lte=to_datetime
-            )
+            # Daily rollup rows summed per day (single GROUP BY query on the rollup table)
+            rows = OrderRollup.objects.filter(
+                period=DAY,
+                bucket__gte=timezone.make_aware(from_datetime),
+                bucket__lte=timezone.make_aware(to_datetime)
+            ).values('bucket').annotate(
+                total=Sum('order_count'),
+                delivery_seconds=Sum('delivery_seconds'),
+                **{
+                    order_status.lower(): Sum(field)
+                    for order_status, field in STATUS_FIELDS.items()
+                }
+            ).order_by('bucket')
+            rows_by_date = {timezone.localtime(row['bucket']).date(): row for row in rows}
 
             # Aggregate statistics
-            total_orders = orders.count()
+            total_orders = sum(row['total'] for row in rows_by_date.values())
 
             # Count by status
             status_counts = {
-                'placed': orders.filter(status='PLACED').count(),
-                'preparing': orders.filter(status='PREPARING').count(),
-                'ready': orders.filter(status='READY').count(),
-                'delivered': orders.filter(status='DELIVERED').count(),
-                'cancelled': orders.filter(status='CANCELLED').count(),
+                order_status.lower(): sum(row[order_status.lower()] for row in rows_by_date.values())
+                for order_status in STATUS_FIELDS
             }
 
-            # Group by date
+            # Average placed-to-delivered time
+            delivery_seconds = sum(row['delivery_seconds'] for row in rows_by_date.values())
+            average_delivery_minutes = (
+                round(delivery_seconds / status_counts['delivered'] / 60, 1) if status_counts['delivered'] else None
+            )
+
+            # Group by date, filling days without orders
             daily_breakdown = []
             current_date = from_datetime.date()
             end_date = to_datetime.date()
 
             while current_date <= end_date:
-                day_start = datetime.combine(current_date, datetime.min.time())
-                day_end = datetime.combine(current_date, datetime.max.time())
-
-                day_orders = orders.filter(
-                    placed_at__gte=day_start,
-                    placed_at__lte=day_end
-                )
-
+                row = rows_by_date.get(current_date, {})
                 daily_breakdown.append({
                     'date': current_date.isoformat(),
-                    'total': day_orders.count(),
-                    'delivered': day_orders.filter(status='DELIVERED').count(),
-                    'cancelled': day_orders.filter(status='CANCELLED').count(),
+                    'total': row.get('total', 0),
+                    'delivered': row.get('delivered', 0),
+                    'cancelled': row.get('cancelled', 0),
                 })
 
-                current_date = datetime.fromordinal(current_date.toordinal() + 1).date()
+                current_date += timedelta(days=1)
 
             return Response({
                 'success': True,
@@ -82,6 +99,7 @@ class ReportsViewSet(viewsets.ViewSet):
                 'to': to_date,
                 'total_orders': total_orders,
                 'status_breakdown': status_counts,
+                'average_delivery_minutes': average_delivery_minutes,
                 'daily_breakdown': daily_breakdown
             }, status=status.HTTP_200_OK)
 
@@ -115,21 +133,19 @@ class ReportsViewSet(viewsets.ViewSet):
             from_datetime = datetime.strptime(from_date, '%Y-%m-%d')
             to_datetime = datetime.strptime(to_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
 
-            # Query order items in date range
-            order_items = OrderItem.objects.filter(
-                order__placed_at__gte=from_datetime,
-                order__placed_at__lte=to_datetime,
-                order__status='DELIVERED'  # Only count delivered orders
-            ).select_related('product')
-
-            # Aggregate by product
-            product_stats = order_items.values(
+            # Delivered product counters from the daily rollups
+            product_stats = ProductRollup.objects.filter(
+                period=DAY,
+                bucket__gte=timezone.make_aware(from_datetime),
+                bucket__lte=timezone.make_aware(to_datetime),
+                delivered_order_count__gt=0  # Only count delivered orders
+            ).values(
                 'product__id',
                 'product__name',
                 'product__category__name'
             ).annotate(
-                total_quantity=Sum('quantity'),
-                order_count=Count('order', distinct=True)
+                total_quantity=Sum('delivered_quantity'),
+                order_count=Sum('delivered_order_count')
             ).order_by('-total_quantity')[:limit]
 
             return Response({
@@ -169,11 +185,15 @@ class ReportsViewSet(viewsets.ViewSet):
             from_datetime = datetime.strptime(from_date, '%Y-%m-%d')
             to_datetime = datetime.strptime(to_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
 
-            # Query feedbacks in date range
+            # Query feedbacks and product ratings in date range
             feedbacks = Feedback.objects.filter(
                 created_at__gte=from_datetime,
                 created_at__lte=to_datetime
             )
+            product_ratings = ProductRating.objects.filter(
+                created_at__gte=from_datetime,
+                created_at__lte=to_datetime
+            )
 
             total_feedbacks = feedbacks.count()
 
@@ -187,33 +207,19 @@ class ReportsViewSet(viewsets.ViewSet):
                         'average': 0,
                         'distribution': {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
                     },
+                    'staff_rating': {
+                        'average': 0,
+                        'distribution': {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+                    },
                     'stay_rating': {
                         'average': 0,
                         'distribution': {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
                     }
                 }, status=status.HTTP_200_OK)
 
-            # Aggregate ratings
-            order_rating_avg = feedbacks.aggregate(Avg('order_rating'))['order_rating__avg'] or 0
-            stay_rating_avg = feedbacks.aggregate(Avg('stay_rating'))['stay_rating__avg'] or 0
-
-            # Distribution of order ratings
-            order_rating_dist = {
-                1: feedbacks.filter(order_rating=1).count(),
-                2: feedbacks.filter(order_rating=2).count(),
-                3: feedbacks.filter(order_rating=3).count(),
-                4: feedbacks.filter(order_rating=4).count(),
-                5: feedbacks.filter(order_rating=5).count(),
-            }
-
-            # Distribution of stay ratings
-            stay_rating_dist = {
-                1: feedbacks.filter(stay_rating=1).count(),
-                2: feedbacks.filter(stay_rating=2).count(),
-                3: feedbacks.filter(stay_rating=3).count(),
-                4: feedbacks.filter(stay_rating=4).count(),
-                5: feedbacks.filter(stay_rating=5).count(),
-            }
+            # Order rating: the product ratings given to the delivered orders
+            averages = feedbacks.aggregate(staff=Avg('staff_rating'), stay=Avg('stay_rating'))
+            order_rating_avg = product_ratings.aggregate(avg=Avg('rating'))['avg'] or 0
 
             return Response({
                 'success': True,
@@ -222,11 +228,15 @@ class ReportsViewSet(viewsets.ViewSet):
                 'total_feedbacks': total_feedbacks,
                 'order_rating': {
                     'average': round(order_rating_avg, 2),
-                    'distribution': order_rating_dist
+                    'distribution': _rating_distribution(product_ratings, 'rating')
+                },
+                'staff_rating': {
+                    'average': round(averages['staff'] or 0, 2),
+                    'distribution': _rating_distribution(feedbacks, 'staff_rating')
                 },
                 'stay_rating': {
-                    'average': round(stay_rating_avg, 2),
-                    'distribution': stay_rating_dist
+                    'average': round(averages['stay'] or 0, 2),
+                    'distribution': _rating_distribution(feedbacks, 'stay_rating')
                 }
             }, status=status.HTTP_200_OK)
 
@@ -238,3 +248,92 @@ class ReportsViewSet(viewsets.ViewSet):
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['get'], url_path='ratings/products')
+    def product_ratings(self, request):
+        """
+        Get average product ratings
+        GET /api/reports/ratings/products?from=YYYY-MM-DD&to=YYYY-MM-DD&category=ID&group_by=product|category&limit=20
+        """
+        from_date = request.query_params.get('from')
+        to_date = request.query_params.get('to')
+        category_id = request.query_params.get('category')
+        group_by = request.query_params.get('group_by', 'product')
+
+        if not from_date or not to_date:
+            return Response({
+                'error': 'Both "from" and "to" date parameters are required (format: YYYY-MM-DD)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if group_by not in ('product', 'category'):
+            return Response({
+                'error': 'group_by must be "product" or "category"'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = int(request.query_params.get('limit', 20))
+            from_datetime = datetime.strptime(from_date, '%Y-%m-%d')
+            to_datetime = datetime.strptime(to_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+
+            ratings = ProductRating.objects.filter(
+                created_at__gte=from_datetime,
+                created_at__lte=to_datetime
+            )
+            if category_id:
+                ratings = ratings.filter(product__category_id=category_id)
+
+            if group_by == 'category':
+                fields = ['product__category__id', 'product__category__name']
+            else:
+                fields = ['product__id', 'product__name', 'product__category__name']
+
+            rows = ratings.values(*fields).annotate(
+                average=Avg('rating'),
+                rating_count=Count('id'),
+                order_count=Count('order', distinct=True)
+            ).order_by('-average', '-rating_count')[:limit]
+
+            return Response({
+                'success': True,
+                'from': from_date,
+                'to': to_date,
+                'group_by': group_by,
+                'results': [
+                    {**row, 'average': round(row['average'], 2)}
+                    for row in rows
+                ]
+            }, status=status.HTTP_200_OK)
+
+        except ValueError:
+            return Response({
+                'error': 'Invalid date format. Use YYYY-MM-DD or invalid limit value'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['get'], url_path='endpoints')
+    def endpoints(self, request):
+        """
+        Get the slowest endpoints, from the request timing middleware
+        GET /api/reports/endpoints?order_by=p95|queries&limit=20
+        """
+        order_by = request.query_params.get('order_by', 'p95')
+        if order_by not in ('p95', 'queries'):
+            return Response({
+                'error': 'order_by must be "p95" or "queries"'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({
+                'error': 'Invalid limit value'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'order_by': order_by,
+            'results': worst_endpoints(order_by=order_by, limit=limit)
+        }, status=status.HTTP_200_OK)